@@ -2,6 +2,7 @@
 Configuration settings for the Dermatolog AI Scan application.
 Contains model parameters, clinical thresholds, and system constants.
 """
+import os
 
 
 # --- Stage 2: Result Interpretation Parameters ---
@@ -38,7 +39,150 @@ CONFIDENCE_CLASSES = [
 # Changing this requires a compatible model checkpoint.
 MODEL_IMAGE_SIZE = (448, 448)
 
+# Version tag of the crop/pad/resize pipeline. Part of every content-addressed
+# cache key, so bump it whenever preprocessing output changes.
+IMAGE_PREPROCESS_VERSION = "3"
+
+# Input resolution of the YOLO lesion detector (long side). Large JPEG uploads
+# are decoded at a reduced scale that still covers this and MODEL_IMAGE_SIZE.
+YOLO_INPUT_SIZE = 640
+
+# Maximum number of images per YOLO forward pass in batched detection
+# (multi-image analysis, demo preloading, offline evaluation).
+YOLO_MAX_BATCH_SIZE = 8
+
+# Inference backend for the YOLO lesion detector:
+# - "ultralytics": the ultralytics YOLO runtime (default)
+# - "onnx": onnxruntime on CPU with NumPy letterboxing and NMS, using the graph
+#   exported by bin/export_yolo_onnx.py; ultralytics is not imported at runtime
+YOLO_BACKEND = os.getenv("YOLO_BACKEND", "ultralytics")
+
+# Location of the exported ONNX detector used by the "onnx" backend.
+YOLO_ONNX_PATH = os.getenv("YOLO_ONNX_PATH", "models/yolov8n.onnx")
+
 # The default HuggingFace model path for MedSigLIP.
 MEDSIGLIP_MODEL_NAME = "google/medsiglip-448"
 
+# Inference backend for the MedSigLIP vision tower:
+# - "torch": eager PyTorch (default)
+# - "onnx": onnxruntime on CPU, using the graph exported by bin/export_onnx.py
+# - "torchscript": traced and frozen TorchScript module (see MEDSIGLIP_TORCHSCRIPT_PATH)
+# The text tower and scoring head always run in PyTorch.
+MEDSIGLIP_BACKEND = os.getenv("MEDSIGLIP_BACKEND", "torch")
+
+# Location of the exported ONNX vision tower used by the "onnx" backend.
+MEDSIGLIP_ONNX_PATH = os.getenv("MEDSIGLIP_ONNX_PATH", "models/medsiglip-448-vision.onnx")
+
+# Quantization mode for the PyTorch vision tower (CPU only):
+# - "none": full fp32 weights (default)
+# - "int8": dynamic int8 quantization of the vision encoder's Linear layers (pooling head stays fp32)
+# Validate with bin/evaluate_quantization.py before enabling for triage output.
+MEDSIGLIP_QUANTIZATION = os.getenv("MEDSIGLIP_QUANTIZATION", "none")
+
+# Traced and frozen TorchScript vision tower used by MEDSIGLIP_BACKEND=torchscript.
+# Created on first start and reused while model, quantization and torch version match.
+MEDSIGLIP_TORCHSCRIPT_PATH = os.getenv("MEDSIGLIP_TORCHSCRIPT_PATH", "models/medsiglip-448-vision.ts")
+
+# How MedSigLIP weights are loaded:
+# - "full": both towers via AutoModel (default)
+# - "vision_only": only the vision tower plus logit scale/bias, read from
+#   memory-mapped safetensors. The text tower loads on demand for label sets
+#   that are not in the persisted text embedding store below.
+MEDSIGLIP_LOAD_MODE = os.getenv("MEDSIGLIP_LOAD_MODE", "full")
+
+# Persisted label text embeddings used by the "vision_only" load mode.
+# Written at warm-up so later starts never need the text tower for default labels.
+MEDSIGLIP_TEXT_EMBEDDINGS_PATH = os.getenv("MEDSIGLIP_TEXT_EMBEDDINGS_PATH", "models/medsiglip-448-text-embeddings.pt")
+
+
+
+# --- Startup ---
+
+# Load and warm up YOLO and MedSigLIP in the background when the server starts,
+# so the first request after a cold start does not pay for model loading.
+# Progress is reported by /api/ready.
+MODEL_WARMUP_ON_STARTUP = os.getenv("MODEL_WARMUP_ON_STARTUP", "1") == "1"
+
+# torch intra-op threads per process. 0 sizes it from the container CPU quota
+# (cgroup), divided between pre-fork workers; os.cpu_count() reports host cores.
+TORCH_NUM_THREADS = int(os.getenv("TORCH_NUM_THREADS", "0"))
+
+# --- Inference Caching ---
+
+# Memory budget (MB) for cached vision embeddings keyed by image content.
+# A MedSigLIP embedding is a few KB, so the default holds thousands of images.
+MEDSIGLIP_EMBEDDING_CACHE_MB = 64
+
+# Memory budget (MB) for label text embeddings, cached per prompt. Prompts can come
+# from clients (custom labels), so this is bounded; one prompt is a few KB. The
+# default label sets precomputed at warm-up are kept outside this budget.
+MEDSIGLIP_TEXT_EMBEDDING_CACHE_MB = 8
+
+# Crop/pad strategy and YOLO lesion bbox per image content digest, so YOLO runs
+# at most once per unique upload. Entries are a few hundred bytes each.
+PREP_STRATEGY_CACHE_MB = 4
+PREP_STRATEGY_CACHE_TTL_SECONDS = 3600
+
+# Saliency maps (normalized patch-grid maps, 4 KB each) keyed by image content,
+# label, model and method; shared across sessions so repeat views are instant.
+SALIENCY_CACHE_MB = 16
+
+# --- Inference Batching ---
+
+# Concurrent analysis requests arriving within this window (milliseconds) are
+# grouped into one batched vision forward pass.
+MEDSIGLIP_BATCH_WINDOW_MS = 10
+
+# Upper bound on images per batched forward pass. Larger batches improve CPU
+# throughput but increase per-request latency and peak memory.
+MEDSIGLIP_MAX_BATCH_SIZE = 8
+
+# --- Inference Executor (Admission Control) ---
+
+# Worker threads for CPU-bound inference (MedSigLIP, Grad-CAM, YOLO, PIL).
+# Several workers let concurrent analyses meet in the micro-batcher.
+INFERENCE_MAX_WORKERS = 4
+
+# Jobs allowed to wait for a worker. Beyond running + queued, new requests are
+# rejected with HTTP 503 and a Retry-After header.
+INFERENCE_MAX_QUEUE = 16
+
+# Value (seconds) of the Retry-After header sent when the queue is full.
+INFERENCE_RETRY_AFTER_SECONDS = 5
+
+# Low-priority warm-up tasks (e.g. demo set lesion detection) run only while the
+# inference executor is idle; beyond this many queued tasks the oldest are dropped.
+IDLE_TASK_MAX_QUEUE = 8
+
+# How often the idle task worker re-checks whether the inference executor is idle.
+IDLE_TASK_POLL_SECONDS = 0.05
+
+# --- Saliency (Grad-CAM) ---
+
+# Memory that concurrent Grad-CAM passes may hold for activations and autograd
+# graphs. Passes beyond the budget wait for a running one to finish.
+GRADCAM_MEMORY_BUDGET_MB = int(os.getenv("GRADCAM_MEMORY_BUDGET_MB", "1024"))
+
+# Estimated peak memory of one Grad-CAM forward + backward pass on MedSigLIP-448.
+GRADCAM_PASS_MEMORY_MB = 256
+
+# Maximum number of target labels per saliency request (e.g. top-3 differentials).
+SALIENCY_MAX_LABELS = 3
+
+# Precompute the top saliency maps in the background after each analysis, only
+# while the inference executor is idle, so the heatmap panel opens from the cache.
+SALIENCY_PREFETCH = os.getenv("SALIENCY_PREFETCH", "1") == "1"
+
+# Labels precomputed per analyzed photo; matches what the heatmap panel requests
+# (the top differentials), so its request is a full cache hit.
+SALIENCY_PREFETCH_LABELS = SALIENCY_MAX_LABELS
+
+# How often the background worker re-checks whether the inference executor is idle.
+SALIENCY_PREFETCH_IDLE_POLL_SECONDS = 0.05
+
+# Queued prefetch jobs (each holds the uploaded image). Past this, the oldest are dropped.
+SALIENCY_PREFETCH_MAX_JOBS = 32
 
+# Queued jobs older than this are dropped: the user has most likely opened the
+# panel already (computing it in the foreground) or left.
+SALIENCY_PREFETCH_TTL_SECONDS = 60
@@ -2,6 +2,7 @@ import time
 import logging
 import uuid
 import os
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -16,15 +17,29 @@ from starlette.middleware.base import BaseHTTPMiddleware
 from app.models import HealthCheckResponse
 from app.routers.photos import router as photos_router
 from app.routers.api import router as api_router
+from app.services.model_warmup import model_warmup_service
+from app.services.cpu_topology import configure_torch_threads, torch_threads_configured
+from app.config import MODEL_WARMUP_ON_STARTUP, TORCH_NUM_THREADS
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Pre-fork workers (app/serve.py) have already sized their share of the CPUs
+    if not torch_threads_configured():
+        configure_torch_threads(num_threads=TORCH_NUM_THREADS)
+    # Load models in the background; the server accepts traffic (and liveness probes) immediately
+    if MODEL_WARMUP_ON_STARTUP:
+        model_warmup_service.start()
+    yield
+
 app = FastAPI(
     title="Dermatolog AI Scan",
     description="FastAPI application for dermatology analysis",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Simple Session Middleware
@@ -1,9 +1,14 @@
-from pydantic import BaseModel
-from typing import List, Optional
+from pydantic import BaseModel, Field
+from typing import List, Literal, Optional
 class HealthCheckResponse(BaseModel):
     status: str
     yolo_available: bool
 
+class ReadinessResponse(BaseModel):
+    ready: bool
+    uptime: Optional[float] = None # Seconds since warm-up started
+    components: dict # Per-model status, load_time and warmup_time
+
 class Photo(BaseModel):
     id: str
     filename: str
@@ -26,7 +31,7 @@ class TimelineItem(BaseModel):
 
 
 
-from app.config import INTERPRETER_MARGIN_THRESHOLD
+from app.config import INTERPRETER_MARGIN_THRESHOLD, YOLO_MAX_BATCH_SIZE
 
 class SinglePhotoAnalysisRequest(BaseModel):
     # Default labels for zero-shot classification from centralized config
@@ -45,11 +50,35 @@ class SinglePhotoAnalysisResponse(BaseModel):
     interpretation: Optional[dict] = None
     preprocess_strategy: Optional[dict] = None
     execution_times: Optional[dict] = None
+    error: Optional[str] = None # Set (with empty predictions) for a failed item of a batch
+
+class BatchPhotoAnalysisItem(BaseModel):
+    photo_id: str
+    base64_image: Optional[str] = None # Client-side image data
+
+class BatchPhotoAnalysisRequest(BaseModel):
+    # One batch runs in a single inference slot with all images decoded, so it is
+    # capped at one YOLO forward pass
+    items: List[BatchPhotoAnalysisItem] = Field(..., max_length=YOLO_MAX_BATCH_SIZE)
+    candidate_labels: Optional[List[str]] = None
+    model: Optional[str] = "medsiglip"
+    margin_threshold: Optional[float] = INTERPRETER_MARGIN_THRESHOLD
 
 class SaliencyRequest(BaseModel):
     base64_image: str
-    target_label: str
+    target_label: Optional[str] = None
+    target_labels: Optional[List[str]] = None # Several labels share one forward pass
+    method: Literal["gradcam", "patch_similarity"] = "gradcam" # patch_similarity: gradient-free, faster
+    format: Literal["overlay", "grid"] = "overlay" # grid: raw low-resolution map, overlay drawn by the client
+
+class SaliencyMap(BaseModel):
+    label: str
+    saliency_base64: Optional[str] = None # Full-size JPEG overlay ("overlay" format)
+    cam_png_base64: Optional[str] = None # Grayscale PNG of the normalized map ("grid" format)
 
 class SaliencyResponse(BaseModel):
     photo_id: str
-    saliency_base64: str
+    saliency_base64: Optional[str] = None # Overlay of the first requested label ("overlay" format)
+    saliency_maps: Optional[List[SaliencyMap]] = None
+    method: Optional[str] = None
+    format: Optional[str] = None
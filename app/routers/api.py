@@ -1,22 +1,33 @@
 import urllib.request
 from fastapi import APIRouter, HTTPException, Response
-from app.models import HealthCheckResponse
+from fastapi.responses import JSONResponse
+from app.models import HealthCheckResponse, ReadinessResponse
 import os
 
 router = APIRouter(prefix="/api")
 
 from app.services.medsiglip_service import medsiglip_service
 from app.services.yolo_service import yolo_service
+from app.services.model_warmup import model_warmup_service
+from app.services.image_preprocess_service import image_preprocess_service
+from app.services.inference_executor import idle_task_runner
 
 @router.get("/health", response_model=HealthCheckResponse)
 async def health_check():
-    """Health check endpoint."""
-    yolo_available = yolo_service.load_model() is not None
+    """Liveness check endpoint. Cheap: never loads models."""
     return HealthCheckResponse(
         status="OK",
-        yolo_available=yolo_available
+        yolo_available=yolo_service.is_available()
     )
 
+@router.get("/ready", response_model=ReadinessResponse)
+async def readiness_check():
+    """Readiness check: 200 once models are loaded and warmed up, 503 with progress otherwise."""
+    status = model_warmup_service.status()
+    if not status["ready"]:
+        return JSONResponse(status_code=503, content=status)
+    return ReadinessResponse(**status)
+
 DEMO_IMAGES = {
     "1": "https://www.smart.biz.pl/images/stories/TechBlog/app-dermatolog/demo/melanoma_wikipedia.png",
     "2": "https://www.smart.biz.pl/images/stories/TechBlog/app-dermatolog/demo/acne_vulgaris2.jpeg",
@@ -32,6 +43,7 @@ async def get_demo_data():
     """Return available demo images complete with base64 encoded content."""
     
     demo_items = []
+    contents = []
     
     for k, url in DEMO_IMAGES.items():
         try:
@@ -50,6 +62,7 @@ async def get_demo_data():
                     
                 content = response.read(10 * 1024 * 1024 + 1)
                 
+                contents.append(content)
                 b64_content = base64.b64encode(content).decode('utf-8')
                 
                 demo_items.append({
@@ -61,5 +74,10 @@ async def get_demo_data():
         except Exception:
             # Skip images that fail to load
             continue
+
+    # Preload lesion detection for the demo set as one batch in the background, while
+    # no analysis is running; analyzing the demo photos right after then hits the strategy cache.
+    if contents:
+        idle_task_runner.submit(image_preprocess_service.recommend_prep_strategies, contents)
             
     return demo_items
@@ -1,3 +1,4 @@
+import asyncio
 import uuid
 import base64
 import logging
@@ -11,19 +12,39 @@ from fastapi import APIRouter, UploadFile, File, HTTPException, Response, Reques
 from PIL import Image
 
 
-from app.models import TimelineItem, Photo, SinglePhotoAnalysisRequest, SinglePhotoAnalysisResponse, SaliencyRequest, SaliencyResponse
+from app.models import (
+    TimelineItem, Photo, SinglePhotoAnalysisRequest, SinglePhotoAnalysisResponse, SaliencyRequest, SaliencyResponse, SaliencyMap,
+    BatchPhotoAnalysisRequest,
+)
 from app.services.medsiglip_service import medsiglip_service
 from app.services.medsiglip_modality_wrapper import (
     medsiglip_wrapped_service, 
 )
 from app.services.image_preprocess_service import image_preprocess_service, PreprocessStrategy
 from app.services.result_interpreter import result_interpreter
+from app.services.inference_executor import inference_executor, InferenceQueueFull
+from app.services.saliency_prefetch import saliency_prefetcher
+from app.config import SALIENCY_PREFETCH_LABELS
 from app.dal.photo_repo import photo_repo
 
 router = APIRouter(prefix="/api/photos", tags=["photos"])
 
 logger = logging.getLogger(__name__)
 
+async def _run_inference(fn, *args, **kwargs):
+    """
+    Runs blocking model/image work on the inference executor.
+    Translates a full admission queue into 503 with Retry-After.
+    """
+    try:
+        return await inference_executor.run(fn, *args, **kwargs)
+    except InferenceQueueFull as e:
+        raise HTTPException(
+            status_code=503,
+            detail="Server is busy with other analyses, please retry shortly",
+            headers={"Retry-After": str(e.retry_after)}
+        )
+
 def get_date_from_image(image_bytes: bytes) -> str:
     """Heuristic to find creation date from EXIF or return today."""
     try:
@@ -226,103 +247,207 @@ async def get_photo_content(photo_id: str, request: Request):
         logger.error(f"Content fetch failed: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.post("/{photo_id}/analyze", response_model=SinglePhotoAnalysisResponse)
-async def analyze_photo(photo_id: str, request: Request, payload: SinglePhotoAnalysisRequest):
-    session_id = request.cookies.get("session_id")
-    if not session_id:
-        raise HTTPException(status_code=400, detail="No session found")
+def _analyze_content(content: bytes, custom_labels: Optional[List[str]], margin_threshold: Optional[float]) -> dict:
+    """
+    Blocking part of the analysis: preprocessing, MedSigLIP inference and interpretation.
+    Runs on the inference executor.
+    """
+    return _analyze_context(image_preprocess_service.create_context(content), custom_labels, margin_threshold)
+
+def _item_error(e: Exception) -> str:
+    return e.detail if isinstance(e, HTTPException) else str(e)
+
+def _analyze_batch(contents: List[Optional[bytes]], custom_labels: Optional[List[str]], margin_threshold: Optional[float]) -> List[dict]:
+    """
+    Blocking part of a multi-image analysis. Lesion detection for all images runs
+    as one YOLO batch up front; each image is then analyzed from its cached strategy.
+    Failures are per item: a failed image yields {"error": ...} and the others are
+    still analyzed. None entries (content that could not be loaded) are skipped.
+    """
+    results: List[Optional[dict]] = [None] * len(contents)
+    contexts = {}
+    for i, content in enumerate(contents):
+        if content is None:
+            continue
+        context = image_preprocess_service.create_context(content)
+        try:
+            context.image  # decode up front, so a corrupt upload fails alone
+            contexts[i] = context
+        except Exception as e:
+            logger.error(f"Could not decode image {i} of batch: {e}")
+            results[i] = {"error": f"Invalid image: {e}"}
 
+    start_time = time.perf_counter()
     try:
-        # 1. Get Photo Content (Prioritize payload for local-only storage)
-        if payload.base64_image:
-            # Decode base64 image
-            if "," in payload.base64_image:
-                _, encoded = payload.base64_image.split(",", 1)
-            else:
-                encoded = payload.base64_image
-            content = base64.b64decode(encoded)
-        else:
-            # Fallback to fetching from Repo (Database/Filesystem)
-            result = photo_repo.get_photo_metadata(photo_id, session_id)
-            if not result:
-                raise HTTPException(status_code=404, detail="Photo not found")
-            
-            stored_content = result[1]
-            content = stored_content
+        image_preprocess_service.recommend_prep_strategies(list(contexts.values()))
+    except Exception as e:
+        # Each image then computes its own strategy in _analyze_context
+        logger.error(f"Batched preprocessing failed: {e}")
+    logger.info(f"Batched preprocessing of {len(contexts)} images took {(time.perf_counter() - start_time):.3f}s")
 
-        # 2. Run Inference
-        custom_labels = payload.candidate_labels
-        
-        execution_times = {}
+    for i, context in contexts.items():
+        try:
+            results[i] = _analyze_context(context, custom_labels, margin_threshold)
+        except Exception as e:
+            logger.error(f"Analysis of image {i} of batch failed: {e}")
+            results[i] = {"error": _item_error(e)}
+    return results
+
+def _analyze_context(context, custom_labels: Optional[List[str]], margin_threshold: Optional[float]) -> dict:
+    execution_times = {}
+
+    # Decode once; strategy, preview and the model input all come from the same pixels
+    start_time = time.perf_counter()
+    prep_strategy = context.strategy
+    prepared_base64 = context.preview_base64()
+    execution_times["image_preprocess"] = f"{(time.perf_counter() - start_time):.3f}s"
+    
+    primary_results = []
+    primary_name = None
 
-        # Determine Preprocessing Strategy and prepare image
+    # Run Primary (MedSigLIP)
+    interpretation = None
+    try:
         start_time = time.perf_counter()
-        prep_strategy = image_preprocess_service.recommend_prep_strategy(content)
-        prepared_base64 = image_preprocess_service.prepare_image_base64(content)
-        execution_times["image_preprocess"] = f"{(time.perf_counter() - start_time):.3f}s"
+        primary_results = medsiglip_wrapped_service.analyze_image(context, custom_labels=custom_labels)
+        execution_times["primary_medsiglip"] = f"{(time.perf_counter() - start_time):.3f}s"
+        primary_name = medsiglip_wrapped_service.service.model_name
         
-        primary_results = []
-        primary_name = None
+        # Interpret results with configurable threshold
+        interpretation = result_interpreter.interpret(
+            primary_results, 
+            margin_threshold=margin_threshold
+        )
+    except Exception as e:
+        logger.error(f"Primary inference failed: {e}")
+        raise HTTPException(status_code=500, detail="Primary model failed")
+
+    if primary_results:
+        logger.info(f"Primary ({primary_name}) top result: {primary_results[0]['label']} ({primary_results[0]['score']:.2f})")
+         
+    return {
+         "primary": primary_results,
+         "interpretation": interpretation,
+         "primary_model_name": primary_name,
+         "preprocess_strategy": prep_strategy,
+         "prepared_image_base64": prepared_base64,
+         "execution_times": execution_times
+    }
+
+def _load_photo_content(photo_id: str, session_id: str, base64_image: Optional[str]) -> bytes:
+    """Image bytes from the client payload (local-only storage) or from the repo."""
+    if base64_image:
+        # Decode base64 image
+        if "," in base64_image:
+            _, encoded = base64_image.split(",", 1)
+        else:
+            encoded = base64_image
+        return base64.b64decode(encoded)
+
+    # Fallback to fetching from Repo (Database/Filesystem)
+    result = photo_repo.get_photo_metadata(photo_id, session_id)
+    if not result:
+        raise HTTPException(status_code=404, detail="Photo not found")
+    return result[1]
 
-        # Run Primary (MedSigLIP)
-        interpretation = None
+def _finish_analysis(photo_id: str, session_id: str, results_dict: dict, persist: bool) -> SinglePhotoAnalysisResponse:
+    """Merges with previously stored results, saves them (repo-backed photos only) and builds the response."""
+    primary_results = results_dict["primary"]
+
+    # Merge with existing cache 
+    try:
+        current_cache = photo_repo.get_analysis_results(photo_id, session_id)
+        if current_cache:
+            start_data = json.loads(current_cache[0])
+            if isinstance(start_data, dict):
+                if not primary_results and "primary" in start_data:
+                    results_dict["primary"] = start_data["primary"]
+                    results_dict["primary_model_name"] = start_data.get("primary_model_name")
+    except:
+        pass
+
+    # Save results
+    if persist:
         try:
-            start_time = time.perf_counter()
-            primary_results = medsiglip_wrapped_service.analyze_image(content, custom_labels=custom_labels)
-            execution_times["primary_medsiglip"] = f"{(time.perf_counter() - start_time):.3f}s"
-            primary_name = medsiglip_wrapped_service.service.model_name
-            
-            # Interpret results with configurable threshold
-            interpretation = result_interpreter.interpret(
-                primary_results, 
-                margin_threshold=payload.margin_threshold
-            )
+            photo_repo.save_analysis_results(photo_id, session_id, json.dumps(results_dict))
         except Exception as e:
-            logger.error(f"Primary inference failed: {e}")
-            raise HTTPException(status_code=500, detail="Primary model failed")
-
-        if primary_results:
-            logger.info(f"Primary ({primary_name}) top result: {primary_results[0]['label']} ({primary_results[0]['score']:.2f})")
-             
-        results_dict = {
-             "primary": primary_results,
-             "interpretation": interpretation,
-             "primary_model_name": primary_name,
-             "preprocess_strategy": prep_strategy,
-             "prepared_image_base64": prepared_base64,
-             "execution_times": execution_times
-        }
-        
-        # Merge with existing cache 
-        try:
-            current_cache = photo_repo.get_analysis_results(photo_id, session_id)
-            if current_cache:
-                start_data = json.loads(current_cache[0])
-                if isinstance(start_data, dict):
-                    if not primary_results and "primary" in start_data:
-                        results_dict["primary"] = start_data["primary"]
-                        results_dict["primary_model_name"] = start_data.get("primary_model_name")
-        except:
-            pass
-
-        # Save results
-        if not payload.base64_image:
+            logger.error(f"Failed to save analysis results: {e}")
+    
+    return SinglePhotoAnalysisResponse(
+        photo_id=photo_id,
+        predictions=results_dict.get("primary") or [],
+        interpretation=results_dict.get("interpretation"),
+        primary_model_name=results_dict.get("primary_model_name"),
+        analysis_date=datetime.now().isoformat(),
+        prepared_image_base64=results_dict.get("prepared_image_base64"),
+        preprocess_strategy=results_dict.get("preprocess_strategy"),
+        execution_times=results_dict.get("execution_times")
+    )
+
+def _prefetch_saliency(photo_id: str, session_id: str, content: bytes, response: SinglePhotoAnalysisResponse):
+    """Queues the heatmaps the panel will ask for next (top differentials) as low-priority background work."""
+    # Never the reason the model gets loaded
+    if medsiglip_service.model is None:
+        return
+    labels = [p["label"] for p in response.predictions[:SALIENCY_PREFETCH_LABELS] if p.get("label")]
+    saliency_prefetcher.schedule(session_id, photo_id, content, labels)
+
+@router.post("/analyze-batch", response_model=List[SinglePhotoAnalysisResponse])
+async def analyze_photos_batch(request: Request, payload: BatchPhotoAnalysisRequest):
+    """Analyzes several photos in one request, with batched lesion detection."""
+    session_id = request.cookies.get("session_id")
+    if not session_id:
+        raise HTTPException(status_code=400, detail="No session found")
+
+    try:
+        contents, load_errors = [], {}
+        for i, item in enumerate(payload.items):
             try:
-                photo_repo.save_analysis_results(photo_id, session_id, json.dumps(results_dict))
+                contents.append(_load_photo_content(item.photo_id, session_id, item.base64_image))
             except Exception as e:
-                logger.error(f"Failed to save analysis results: {e}")
-        
-        return SinglePhotoAnalysisResponse(
-            photo_id=photo_id,
-            predictions=results_dict.get("primary") or [],
-            interpretation=results_dict.get("interpretation"),
-            primary_model_name=results_dict.get("primary_model_name"),
-            analysis_date=datetime.now().isoformat(),
-            prepared_image_base64=results_dict.get("prepared_image_base64"),
-            preprocess_strategy=results_dict.get("preprocess_strategy"),
-            execution_times=results_dict.get("execution_times")
+                contents.append(None)
+                load_errors[i] = {"error": _item_error(e)}
+
+        results = await _run_inference(
+            _analyze_batch, contents, payload.candidate_labels, payload.margin_threshold
         )
+        responses = []
+        for i, (item, content, results_dict) in enumerate(zip(payload.items, contents, results)):
+            results_dict = load_errors.get(i, results_dict)
+            if "error" in results_dict:
+                responses.append(SinglePhotoAnalysisResponse(photo_id=item.photo_id, predictions=[], error=results_dict["error"]))
+                continue
+            response = _finish_analysis(item.photo_id, session_id, results_dict, persist=not item.base64_image)
+            _prefetch_saliency(item.photo_id, session_id, content, response)
+            responses.append(response)
+        return responses
 
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Batch analysis failed: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/{photo_id}/analyze", response_model=SinglePhotoAnalysisResponse)
+async def analyze_photo(photo_id: str, request: Request, payload: SinglePhotoAnalysisRequest):
+    session_id = request.cookies.get("session_id")
+    if not session_id:
+        raise HTTPException(status_code=400, detail="No session found")
+
+    try:
+        # 1. Get Photo Content (Prioritize payload for local-only storage)
+        content = _load_photo_content(photo_id, session_id, payload.base64_image)
+
+        # 2. Run Inference (off the event loop, bounded by the inference executor)
+        results_dict = await _run_inference(
+            _analyze_content, content, payload.candidate_labels, payload.margin_threshold
+        )
+        response = _finish_analysis(photo_id, session_id, results_dict, persist=not payload.base64_image)
+        _prefetch_saliency(photo_id, session_id, content, response)
+        return response
+
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Analysis failed: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -335,6 +460,7 @@ async def delete_photo(photo_id: str, request: Request):
 
     try:
         photo_repo.delete_photo(photo_id, session_id)
+        saliency_prefetcher.cancel_photo(session_id, photo_id)
         # Ideally delete file too, but keeping it simple for now
         return {"status": "deleted", "id": photo_id}
             
@@ -343,6 +469,7 @@ async def delete_photo(photo_id: str, request: Request):
         raise HTTPException(status_code=500, detail=str(e))
 
 from app.services.gradcam_service import gradcam_service
+from app.config import SALIENCY_MAX_LABELS
 
 @router.post("/{photo_id}/saliency", response_model=SaliencyResponse)
 async def generate_saliency_map(
@@ -361,16 +488,47 @@ async def generate_saliency_map(
         else:
             encoded = payload.base64_image
         content = base64.b64decode(encoded)
-        
-        # Generate Saliency (Grad-CAM)
-        heatmap_bytes = gradcam_service.get_heatmap(content, payload.target_label)
-        saliency_base64 = base64.b64encode(heatmap_bytes).decode('utf-8')
-        
+
+        labels = payload.target_labels or ([payload.target_label] if payload.target_label else [])
+        if not labels:
+            raise HTTPException(status_code=400, detail="target_label or target_labels is required")
+        if len(labels) > SALIENCY_MAX_LABELS:
+            raise HTTPException(status_code=400, detail=f"At most {SALIENCY_MAX_LABELS} target labels per request")
+
+        # A background precomputation of this photo already in progress fills the cache; wait for it
+        in_flight = saliency_prefetcher.claim(session_id, photo_id)
+        if in_flight is not None:
+            await asyncio.wrap_future(in_flight)
+
+        # Generate Saliency (Grad-CAM or patch similarity), one shared forward pass for all labels.
+        # Both formats fail the same way: a map that could not be computed is a 500.
+        if payload.format == "grid":
+            grids = await _run_inference(gradcam_service.get_cam_grids, content, labels, payload.method)
+            if any(grid is None for grid in grids):
+                raise HTTPException(status_code=500, detail="Saliency map could not be computed")
+            saliency_maps = [
+                SaliencyMap(label=label, cam_png_base64=base64.b64encode(grid).decode('utf-8'))
+                for label, grid in zip(labels, grids)
+            ]
+        else:
+            heatmaps = await _run_inference(gradcam_service.get_heatmaps, content, labels, payload.method)
+            if any(heatmap is None for heatmap in heatmaps):
+                raise HTTPException(status_code=500, detail="Saliency map could not be computed")
+            saliency_maps = [
+                SaliencyMap(label=label, saliency_base64=base64.b64encode(heatmap_bytes).decode('utf-8'))
+                for label, heatmap_bytes in zip(labels, heatmaps)
+            ]
+
         return SaliencyResponse(
             photo_id=photo_id,
-            saliency_base64=saliency_base64
+            saliency_base64=saliency_maps[0].saliency_base64,
+            saliency_maps=saliency_maps,
+            method=payload.method,
+            format=payload.format,
         )
             
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Saliency generation failed: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -385,7 +543,7 @@ async def clear_session_photos(request: Request):
 
     try:
         photo_repo.clear_session(session_id)
-        
+        saliency_prefetcher.cancel_session(session_id)
             
         return {"status": "cleared", "message": "All session photos deleted"}
             
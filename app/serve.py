@@ -0,0 +1,185 @@
+"""
+Pre-fork multi-worker server.
+
+Loads the models once in the parent process, moves the weights into shared
+memory and forks worker processes that all serve the same listening socket.
+Every worker maps the same MedSigLIP weights instead of holding its own copy,
+so more cores can be used without multiplying memory.
+
+Usage:
+    python -m app.serve --workers 4 --port 8080
+
+Linux only (relies on os.fork and /proc for memory reporting).
+"""
+import argparse
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+from typing import Dict
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("app.serve")
+
+def read_memory(pid: int) -> Dict[str, float]:
+    """
+    Returns RSS, PSS and shared memory (MB) of a process.
+    PSS splits shared pages between the processes mapping them, so the sum of
+    worker PSS values shows the real footprint; RSS alone counts shared weights
+    once per worker.
+    """
+    fields = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 2 and parts[0].endswith(":") and parts[1].isdigit():
+                    fields[parts[0][:-1]] = int(parts[1])
+    except OSError:
+        return {}
+
+    shared_kb = fields.get("Shared_Clean", 0) + fields.get("Shared_Dirty", 0)
+    return {
+        "rss_mb": round(fields.get("Rss", 0) / 1024, 1),
+        "pss_mb": round(fields.get("Pss", 0) / 1024, 1),
+        "shared_mb": round(shared_kb / 1024, 1),
+    }
+
+def log_memory(workers: Dict[int, int]):
+    total_pss = 0.0
+    parent = read_memory(os.getpid())
+    logger.info(f"Memory parent[{os.getpid()}]: {parent}")
+    total_pss += parent.get("pss_mb", 0.0)
+    for index, pid in sorted(workers.items()):
+        usage = read_memory(pid)
+        total_pss += usage.get("pss_mb", 0.0)
+        logger.info(f"Memory worker {index} [{pid}]: {usage}")
+    logger.info(f"Memory total PSS: {total_pss:.1f} MB")
+
+def preload_models():
+    """
+    Loads the model weights in the parent process and moves them to shared memory.
+    No inference runs here: thread pools must not be started before forking, so
+    the TorchScript/ONNX vision backend (tracing runs a forward pass) is built
+    lazily in each worker. Warm-up runs in each worker through the app lifespan hook.
+    """
+    from app.services.medsiglip_service import medsiglip_service
+    from app.services.yolo_service import yolo_service
+
+    start_time = time.perf_counter()
+    try:
+        medsiglip_service._load_model(vision_backend=False)
+    except Exception as e:
+        logger.error(f"Preloading MedSigLIP failed, workers will load it lazily: {e}")
+        return
+    try:
+        medsiglip_service.model.share_memory()
+    except Exception as e:
+        # e.g. packed int8 weights; copy-on-write sharing still applies
+        logger.warning(f"Could not move MedSigLIP weights to shared memory: {e}")
+    yolo_service.load_model()
+    if hasattr(yolo_service.model, "session"):
+        yolo_service.model.session = None
+    logger.info(f"Models preloaded in parent in {(time.perf_counter() - start_time):.1f}s")
+
+def run_worker(index: int, sock: socket.socket, workers: int, log_level: str):
+    import torch
+    import uvicorn
+    from app.config import TORCH_NUM_THREADS
+    from app.services.cpu_topology import configure_torch_threads
+
+    # Split the container's CPU quota between workers instead of every worker claiming all host cores
+    configure_torch_threads(workers=workers, num_threads=TORCH_NUM_THREADS)
+
+    config = uvicorn.Config("app.main:app", log_level=log_level)
+    server = uvicorn.Server(config)
+    logger.info(f"Worker {index} [{os.getpid()}] started with {torch.get_num_threads()} torch threads")
+    server.run(sockets=[sock])
+
+def spawn(index: int, sock: socket.socket, workers: int, log_level: str) -> int:
+    pid = os.fork()
+    if pid == 0:
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        exit_code = 0
+        try:
+            run_worker(index, sock, workers, log_level)
+        except Exception as e:
+            logger.error(f"Worker {index} crashed: {e}")
+            exit_code = 1
+        finally:
+            os._exit(exit_code)
+    return pid
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-fork server sharing model weights between workers.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8080")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", "2")))
+    parser.add_argument("--memory-report-interval", type=float, default=300.0, help="Seconds between memory reports (0 disables)")
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+
+    if not hasattr(os, "fork"):
+        logger.error("Pre-fork serving requires os.fork (Linux/macOS).")
+        sys.exit(1)
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((args.host, args.port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+
+    preload_models()
+
+    workers: Dict[int, int] = {}
+    for index in range(args.workers):
+        workers[index] = spawn(index, sock, args.workers, args.log_level)
+    logger.info(f"Serving on http://{args.host}:{args.port} with {args.workers} workers: {list(workers.values())}")
+
+    shutting_down = False
+
+    def shutdown(signum, _frame):
+        nonlocal shutting_down
+        shutting_down = True
+        for pid in workers.values():
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+
+    next_report = time.monotonic() + 30.0  # first report once workers have warmed up
+    while workers:
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            break
+
+        if pid:
+            index = next((i for i, p in workers.items() if p == pid), None)
+            if index is not None:
+                del workers[index]
+                if not shutting_down:
+                    logger.warning(f"Worker {index} [{pid}] exited with status {status}; respawning")
+                    workers[index] = spawn(index, sock, args.workers, args.log_level)
+            continue
+
+        if args.memory_report_interval and time.monotonic() >= next_report and not shutting_down:
+            log_memory(workers)
+            next_report = time.monotonic() + args.memory_report_interval
+        time.sleep(0.5)
+
+    sock.close()
+    logger.info("All workers stopped.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+import logging
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+def estimate_size(value: Any) -> int:
+    """Best-effort size in bytes for cached values (tensors, arrays, bytes, strings)."""
+    if hasattr(value, "element_size") and hasattr(value, "numel"):
+        return value.element_size() * value.numel()
+    if hasattr(value, "nbytes"):
+        return int(value.nbytes)
+    if isinstance(value, (bytes, bytearray, str)):
+        return len(value)
+    return sys.getsizeof(value)
+
+class ByteLRUCache:
+    """
+    Thread-safe LRU cache bounded by the total size of its values in bytes.
+    Least recently used entries are evicted until a new entry fits.
+    Values larger than the whole budget are not cached.
+    With ttl_seconds, entries older than the TTL are treated as misses and dropped.
+    """
+    def __init__(self, max_bytes: int, sizeof: Callable[[Any], int] = estimate_size, name: str = "cache",
+                 ttl_seconds: Optional[float] = None, clock: Callable[[], float] = time.monotonic):
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.name = name
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.current_bytes = 0
+
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[2] is not None and self.clock() >= entry[2]:
+                del self._entries[key]
+                self.current_bytes -= entry[1]
+                self.expired += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Hashable, value: Any):
+        size = self.sizeof(value)
+        if size > self.max_bytes:
+            logger.debug(f"{self.name}: entry of {size} bytes exceeds budget, not cached")
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self.current_bytes -= self._entries.pop(key)[1]
+            while self._entries and self.current_bytes + size > self.max_bytes:
+                _, (_, evicted_size, _) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+            expires_at = self.clock() + self.ttl_seconds if self.ttl_seconds else None
+            self._entries[key] = (value, size, expires_at)
+            self.current_bytes += size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "bytes": self.current_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "expired": self.expired,
+        }
@@ -0,0 +1,76 @@
+import logging
+import math
+import os
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+CGROUP_V2_CPU_MAX = "/sys/fs/cgroup/cpu.max"
+CGROUP_V1_QUOTA = "/sys/fs/cgroup/cpu/cpu.cfs_quota_us"
+CGROUP_V1_PERIOD = "/sys/fs/cgroup/cpu/cpu.cfs_period_us"
+
+_configured_threads: Optional[int] = None
+
+def _read(path: str) -> Optional[str]:
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+def cgroup_cpu_limit() -> Optional[float]:
+    """
+    Returns the container CPU quota in cores (e.g. 2.0 on a 2 vCPU Cloud Run instance),
+    or None when no quota is set. Supports cgroup v2 and v1.
+    """
+    cpu_max = _read(CGROUP_V2_CPU_MAX)
+    if cpu_max:
+        quota, _, period = cpu_max.partition(" ")
+        if quota != "max" and period:
+            return int(quota) / int(period)
+        return None
+
+    quota, period = _read(CGROUP_V1_QUOTA), _read(CGROUP_V1_PERIOD)
+    if quota and period and int(quota) > 0:
+        return int(quota) / int(period)
+    return None
+
+def available_cpus() -> int:
+    """
+    CPUs this process may actually use: the scheduler affinity mask capped by the
+    cgroup quota. os.cpu_count() reports host cores, which oversubscribes
+    containers that only get a fraction of the machine.
+    """
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+
+    limit = cgroup_cpu_limit()
+    if limit is not None:
+        cpus = min(cpus, max(1, math.ceil(limit)))
+    return max(1, cpus)
+
+def configure_torch_threads(workers: int = 1, num_threads: int = 0, interop_threads: int = 1) -> int:
+    """
+    Sizes torch intra-op threads to this process' share of the available CPUs
+    (num_threads overrides it when > 0) and sets the inter-op pool size.
+    Returns the number of intra-op threads.
+    """
+    global _configured_threads
+    import torch
+
+    threads = num_threads if num_threads > 0 else max(1, available_cpus() // max(1, workers))
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(interop_threads)
+    except RuntimeError:
+        # Only allowed once, before any inter-op parallel work has started
+        logger.debug("torch inter-op threads already initialised; keeping current setting.")
+    logger.info(f"torch threads: intra-op {torch.get_num_threads()}, inter-op {torch.get_num_interop_threads()} "
+                f"(available CPUs {available_cpus()}, cgroup limit {cgroup_cpu_limit()})")
+    _configured_threads = threads
+    return threads
+
+def torch_threads_configured() -> bool:
+    return _configured_threads is not None
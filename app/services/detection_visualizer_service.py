@@ -20,24 +20,21 @@ class DetectionVisualizerService:
             # Prepare Inputs
             image = Image.open(io.BytesIO(image_content)).convert("RGB")
             
-            model = yolo_service.load_model()
-            results = model.predict(image, conf=0.25, verbose=False)
+            boxes = yolo_service.detect(image, conf=0.25)
+            if boxes is None:
+                return image_content
             
             # Draw on image
             draw = ImageDraw.Draw(image)
             
             found = False
-            if results and len(results[0].boxes) > 0:
-                for box in results[0].boxes:
-                    b = box.xyxy[0].cpu().numpy()
-                    conf = float(box.conf[0])
-                    
-                    # Draw red box for lesion
-                    draw.rectangle([b[0], b[1], b[2], b[3]], outline="red", width=5)
-                    # Draw label background
-                    label = f"Lesion {conf:.2f}"
-                    draw.text((b[0] + 5, b[1] + 5), label, fill="red")
-                    found = True
+            for x1, y1, x2, y2, conf in boxes:
+                # Draw red box for lesion
+                draw.rectangle([x1, y1, x2, y2], outline="red", width=5)
+                # Draw label background
+                label = f"Lesion {conf:.2f}"
+                draw.text((x1 + 5, y1 + 5), label, fill="red")
+                found = True
             
             if not found:
                 # Optional: draw some indicator that nothing was found?
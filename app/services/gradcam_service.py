@@ -1,113 +1,326 @@
+import contextlib
+import hashlib
 import logging
+import threading
 import torch
 import torch.nn.functional as F
 import numpy as np
 import cv2
-from PIL import Image
+from PIL import Image, ImageOps
 import io
+from typing import List, Optional
 from app.services.medsiglip_service import medsiglip_service
+from app.services.medsiglip_modality_wrapper import ClinicalModalityWrapper
+from app.services.byte_lru_cache import ByteLRUCache
+from app.config import GRADCAM_MEMORY_BUDGET_MB, GRADCAM_PASS_MEMORY_MB, SALIENCY_CACHE_MB
 
 logger = logging.getLogger(__name__)
 
+class MemoryBudget:
+    """
+    Bounds concurrent work by estimated memory instead of by count.
+    reserve() blocks until the requested amount fits in the budget; a request
+    larger than the whole budget waits until it can run alone.
+    """
+    def __init__(self, budget_mb: int):
+        self.budget_mb = budget_mb
+        self.available_mb = budget_mb
+        self._condition = threading.Condition()
+
+    @property
+    def in_use_mb(self) -> int:
+        return self.budget_mb - self.available_mb
+
+    @contextlib.contextmanager
+    def reserve(self, cost_mb: int):
+        cost_mb = min(cost_mb, self.budget_mb)
+        with self._condition:
+            self._condition.wait_for(lambda: self.available_mb >= cost_mb)
+            self.available_mb -= cost_mb
+        try:
+            yield
+        finally:
+            with self._condition:
+                self.available_mb += cost_mb
+                self._condition.notify_all()
+
+class _ActivationRecorder:
+    """
+    Per-invocation forward hook on the Grad-CAM target layer.
+    Module hooks are shared by every thread using the model, so the hook only acts
+    on outputs produced by the thread that registered it. The forward runs without
+    autograd up to the target layer; the hook replaces the layer output with a
+    leaf that requires grad and turns autograd on for the rest of the forward, so
+    only the layers after it are recorded.
+    """
+    def __init__(self, layer):
+        self.layer = layer
+        self.thread_id = threading.get_ident()
+        self.activations: Optional[torch.Tensor] = None
+        self._handle = None
+
+    def _hook(self, _module, _input, output):
+        if threading.get_ident() != self.thread_id:
+            return None
+        hidden = output[0] if isinstance(output, tuple) else output
+        self.activations = hidden.detach().requires_grad_()
+        # Grad mode is thread-local; the caller's no_grad() block restores it
+        torch.set_grad_enabled(True)
+        return (self.activations,) + tuple(output[1:]) if isinstance(output, tuple) else self.activations
+
+    def __enter__(self):
+        self._handle = self.layer.register_forward_hook(self._hook)
+        return self
+
+    def __exit__(self, *exc):
+        self._handle.remove()
+        return False
+
+# Saliency methods
+GRADCAM = "gradcam"
+PATCH_SIMILARITY = "patch_similarity"  # gradient-free, one no-grad forward
+
 class GradCAMService:
-    def __init__(self):
-        self.gradients = None
-        self.activations = None
-        self.hooks = []
+    """
+    Grad-CAM over the last MedSigLIP vision encoder layer, backpropagating the
+    SigLIP logit of the target label through the vision tower only.
+    Safe to call from several inference threads at once: hook state lives in each
+    call, gradients are taken with torch.autograd.grad (nothing accumulates in the
+    shared parameters' .grad) and concurrent passes are bounded by a memory budget.
+    Only the layers after the target layer are recorded by autograd.
+    The cheaper gradient-free PATCH_SIMILARITY method can be selected per call.
+    """
+    def __init__(self, memory_budget_mb: int = GRADCAM_MEMORY_BUDGET_MB, pass_memory_mb: int = GRADCAM_PASS_MEMORY_MB,
+                 cache_mb: int = SALIENCY_CACHE_MB):
+        self.pass_memory_mb = pass_memory_mb
+        self.memory_budget = MemoryBudget(memory_budget_mb)
+        # Normalized patch-grid maps, shared by all sessions and both output formats
+        self.cache = ByteLRUCache(cache_mb * 1024 * 1024, name="saliency")
 
-    def _save_gradient(self, _module, _grad_input, grad_output):
-        self.gradients = grad_output[0]
+    @staticmethod
+    def _open(image_content: bytes) -> Image.Image:
+        # In display orientation, as the browser draws the photo the map is laid over
+        return ImageOps.exif_transpose(Image.open(io.BytesIO(image_content))).convert("RGB")
 
-    def _save_activation(self, _module, _input, output):
-        if isinstance(output, tuple):
-             self.activations = output[0]
-        else:
-             self.activations = output
+    @staticmethod
+    def cache_key(digest: str, label: str, method: str) -> str:
+        """Saliency cache key: model (and quantization), method, image content digest and label."""
+        return f"{medsiglip_service.model_name}|{medsiglip_service.quantization}|{method}|{digest}|{label}"
 
-    def get_heatmap(self, image_content: bytes, target_label: str) -> bytes:
+    def get_maps(self, image_content: bytes, target_labels: List[str], method: str = GRADCAM,
+                 image: Optional[Image.Image] = None) -> List[Optional[np.ndarray]]:
         """
-        Generates a Grad-CAM heatmap for the given image and target label.
-        Returns the overlay image as bytes (JPEG).
+        Normalized saliency maps per label, served from the cache where possible.
+        Only the labels missing from the cache are computed (in one shared forward);
+        the image is decoded only when something has to be computed, unless given.
+        """
+        digest = hashlib.sha256(image_content).hexdigest()
+        keys = [self.cache_key(digest, label, method) for label in target_labels]
+        maps = [self.cache.get(key) for key in keys]
+        missing = [i for i, cam in enumerate(maps) if cam is None]
+        if not missing:
+            return maps
+
+        if image is None:
+            image = self._open(image_content)
+        computed = self.compute_maps(image, [target_labels[i] for i in missing], method)
+        for i, cam in zip(missing, computed):
+            if cam is not None:
+                cam = np.ascontiguousarray(cam, dtype=np.float32)
+                cam.setflags(write=False)
+                self.cache.put(keys[i], cam)
+            maps[i] = cam
+        return maps
+
+    @staticmethod
+    def _label_embeddings(target_labels: List[str]) -> torch.Tensor:
+        """
+        Text embeddings of the templated prompts the classifier scored the labels with.
+        Warm-up pins and persists those prompts, so in vision_only mode saliency never
+        needs the text tower for the default labels.
+        """
+        _, prompts = ClinicalModalityWrapper(medsiglip_service).build_prompts(list(target_labels))
+        return medsiglip_service.get_text_embeddings(prompts)
+
+    def _compute_cams(self, image: Image.Image, target_labels: List[str]) -> List[Optional[np.ndarray]]:
+        """
+        Returns one Grad-CAM map per label on the patch grid, normalized to [0, 1]
+        (None where it could not be computed). All labels share one vision forward;
+        each label only adds a backward pass through the layers after the target layer.
+        """
+        model = medsiglip_service.model
+        device = medsiglip_service.device
+
+        # The text side is constant per label: score against the cached, detached
+        # text embeddings so only the vision tower runs (no text tower in vision_only mode)
+        text_embeds = self._label_embeddings(target_labels)
+        pixel_values = medsiglip_service.pixel_values([image]).to(device)
+
+        # Hook Target Layer: Last Encoder Layer of Vision Model
+        target_layer = model.vision_model.encoder.layers[-1]
+
+        with self.memory_budget.reserve(self.pass_memory_mb), _ActivationRecorder(target_layer) as recorder:
+            with torch.no_grad():
+                image_embeds = model.vision_model(pixel_values=pixel_values).pooler_output
+                scores = medsiglip_service.logits(image_embeds, text_embeds)[0]
+                if recorder.activations is None or not scores.requires_grad:
+                    logger.error("Failed to capture activations.")
+                    return [None] * len(target_labels)
+                gradients = [
+                    torch.autograd.grad(scores[i], recorder.activations, retain_graph=i < len(target_labels) - 1)[0]
+                    for i in range(len(target_labels))
+                ]
+
+        activations = recorder.activations[0].detach().cpu()
+        return [self._cam_from_gradients(activations, g[0].detach().cpu()) for g in gradients]
+
+    def _compute_cam(self, image: Image.Image, target_label: str) -> Optional[np.ndarray]:
+        """Returns the Grad-CAM map on the patch grid, normalized to [0, 1], or None."""
+        return self._compute_cams(image, [target_label])[0]
+
+    @staticmethod
+    def _project_patches(head, hidden_states: torch.Tensor) -> torch.Tensor:
+        """
+        Maps every patch token into the shared image-text embedding space with the
+        attention-pooling head, as if the pooling probe attended to that token alone:
+        the value and output projections, then the head's layernorm + MLP residual.
+        """
+        attention = head.attention
+        dim = hidden_states.shape[-1]
+        values = F.linear(hidden_states, attention.in_proj_weight[2 * dim:], attention.in_proj_bias[2 * dim:])
+        pooled = attention.out_proj(values)
+        return pooled + head.mlp(head.layernorm(pooled))
+
+    def _patch_similarity_maps(self, image: Image.Image, target_labels: List[str]) -> List[Optional[np.ndarray]]:
+        """
+        Gradient-free saliency: per-patch vision tokens projected into the embedding
+        space and scored against each label's cached text embedding. One no-grad
+        forward for all labels; returns maps on the patch grid normalized to [0, 1].
         """
-        # Ensure model is ready
-        medsiglip_service._load_model()
         model = medsiglip_service.model
-        processor = medsiglip_service.processor
         device = medsiglip_service.device
+        vision_model = model.vision_model
+        if getattr(vision_model, "head", None) is None:
+            logger.error("Vision tower has no attention-pooling head; patch similarity unavailable.")
+            return [None] * len(target_labels)
 
-        # Clean state
-        self.gradients = None
-        self.activations = None
-        for h in self.hooks: h.remove()
-        self.hooks = []
+        text_embeds = self._label_embeddings(target_labels)
+        pixel_values = medsiglip_service.pixel_values([image]).to(device)
+
+        with torch.no_grad():
+            hidden_states = vision_model(pixel_values=pixel_values).last_hidden_state
+            patch_embeds = self._project_patches(vision_model.head, hidden_states)[0]
+            # Monotonic in the cosine similarity; min-max normalized below
+            similarity = medsiglip_service.logits(patch_embeds, text_embeds).t().cpu()
+
+        seq_len = similarity.shape[1]
+        grid_size = int(seq_len**0.5)
+        if grid_size * grid_size != seq_len:
+            logger.warning(f"Non-square sequence length: {seq_len}")
+            return [None] * len(target_labels)
+
+        maps = []
+        for row in similarity:
+            sim_map = row.view(grid_size, grid_size)
+            sim_map = sim_map - sim_map.min()
+            if sim_map.max() > 0:
+                sim_map = sim_map / sim_map.max()
+            maps.append(sim_map.numpy())
+        return maps
+
+    @staticmethod
+    def _cam_from_gradients(activations: torch.Tensor, gradients: torch.Tensor) -> Optional[np.ndarray]:
+        weights = torch.mean(gradients, dim=0)
+        cam = torch.matmul(activations, weights)
+
+        seq_len = cam.shape[0]
+        grid_size = int(seq_len**0.5)
+
+        if grid_size * grid_size != seq_len:
+            logger.warning(f"Non-square sequence length: {seq_len}")
+            return None
+
+        cam_map = cam.view(grid_size, grid_size)
+        cam_map = F.relu(cam_map)
+
+        if cam_map.max() > 0:
+            cam_map = cam_map - cam_map.min()
+            cam_map = cam_map / cam_map.max()
+
+        return cam_map.numpy()
+
+    @staticmethod
+    def _render_overlay(img_np: np.ndarray, cam_map_np: np.ndarray) -> bytes:
+        """Blends the colormapped CAM over the image at full resolution; returns JPEG bytes."""
+        heatmap = cv2.resize(cam_map_np, (img_np.shape[1], img_np.shape[0]))
+
+        heatmap = np.uint8(255 * heatmap)
+        heatmap_color = cv2.applyColorMap(heatmap, cv2.COLORMAP_JET)
+
+        overlay = cv2.addWeighted(img_np, 0.6, heatmap_color, 0.4, 0)
+
+        out_img = Image.fromarray(overlay)
+        buf = io.BytesIO()
+        out_img.save(buf, format="JPEG")
+        return buf.getvalue()
+
+    def compute_maps(self, image: Image.Image, target_labels: List[str], method: str = GRADCAM) -> List[Optional[np.ndarray]]:
+        """Saliency maps on the patch grid, normalized to [0, 1], one per label, with the given method."""
+        if method == PATCH_SIMILARITY:
+            return self._patch_similarity_maps(image, target_labels)
+        if method != GRADCAM:
+            raise ValueError(f"Unknown saliency method: {method}")
+        return self._compute_cams(image, target_labels)
+
+    def get_heatmaps(self, image_content: bytes, target_labels: List[str], method: str = GRADCAM) -> List[Optional[bytes]]:
+        """
+        Generates saliency heatmaps for several target labels from one shared forward pass.
+        Returns one overlay image (JPEG bytes) per label; None where a map could not
+        be computed, as get_cam_grids() does.
+        """
+        # Ensure model is ready
+        medsiglip_service._load_model()
 
         try:
             # Prepare Inputs
-            image = Image.open(io.BytesIO(image_content)).convert("RGB")
-            inputs = processor(text=[target_label], images=image, return_tensors="pt", padding="max_length").to(device)
-            
-            # Hook Target Layer: Last Encoder Layer of Vision Model
-            target_layer = model.vision_model.encoder.layers[-1]
-            
-            h1 = target_layer.register_forward_hook(self._save_activation)
-            h2 = target_layer.register_full_backward_hook(self._save_gradient)
-            self.hooks.extend([h1, h2])
-
-            # Forward Pass
-            model.zero_grad()
-            outputs = model(**inputs)
-            
-            # Calculate Score
-            score = outputs.logits_per_image[0, 0]
-            
-            # Backward Pass
-            score.backward()
-            
-            if self.gradients is None or self.activations is None:
-                logger.error("Failed to capture gradients or activations.")
-                return image_content
-
-            # CPU processing
-            gradients = self.gradients[0].detach().cpu()
-            activations = self.activations[0].detach().cpu()
-            
-            weights = torch.mean(gradients, dim=0)
-            cam = torch.matmul(activations, weights)
-            
-            seq_len = cam.shape[0]
-            grid_size = int(seq_len**0.5)
-            
-            if grid_size * grid_size != seq_len:
-                logger.warning(f"Non-square sequence length: {seq_len}")
-                return image_content
-            
-            cam_map = cam.view(grid_size, grid_size)
-            cam_map = F.relu(cam_map)
-            
-            if cam_map.max() > 0:
-                cam_map = cam_map - cam_map.min()
-                cam_map = cam_map / cam_map.max()
-            
-            cam_map_np = cam_map.numpy()
+            image = self._open(image_content)
+            cam_maps = self.get_maps(image_content, target_labels, method, image=image)
 
             img_np = np.array(image)
-            heatmap = cv2.resize(cam_map_np, (img_np.shape[1], img_np.shape[0]))
-            
-            heatmap = np.uint8(255 * heatmap)
-            heatmap_color = cv2.applyColorMap(heatmap, cv2.COLORMAP_JET)
-            
-            overlay = cv2.addWeighted(img_np, 0.6, heatmap_color, 0.4, 0)
-            
-            out_img = Image.fromarray(overlay)
-            buf = io.BytesIO()
-            out_img.save(buf, format="JPEG")
-            return buf.getvalue()
+            return [None if cam is None else self._render_overlay(img_np, cam) for cam in cam_maps]
 
         except Exception as e:
             logger.error(f"Grad-CAM error: {e}")
-            return image_content
-        finally:
-            for h in self.hooks: h.remove()
-            self.hooks = []
+            return [None] * len(target_labels)
+
+    @staticmethod
+    def _encode_grid(cam_map_np: np.ndarray) -> bytes:
+        """The normalized map as an 8-bit grayscale PNG at patch-grid resolution (e.g. 32x32)."""
+        buf = io.BytesIO()
+        Image.fromarray(np.uint8(255 * np.clip(cam_map_np, 0, 1)), mode="L").save(buf, format="PNG")
+        return buf.getvalue()
+
+    def get_cam_grids(self, image_content: bytes, target_labels: List[str], method: str = GRADCAM) -> List[Optional[bytes]]:
+        """
+        Like get_heatmaps() but returns only the low-resolution maps as tiny grayscale
+        PNGs (None where a map could not be computed), for overlay rendering on the
+        client. Skips the full-resolution colormap, blend and JPEG encode, and on
+        a cache hit even the image decode.
+        """
+        medsiglip_service._load_model()
+
+        try:
+            return [None if cam is None else self._encode_grid(cam)
+                    for cam in self.get_maps(image_content, target_labels, method)]
+        except Exception as e:
+            logger.error(f"Grad-CAM error: {e}")
+            return [None] * len(target_labels)
+
+    def get_heatmap(self, image_content: bytes, target_label: str) -> Optional[bytes]:
+        """
+        Generates a Grad-CAM heatmap for the given image and target label.
+        Returns the overlay image as bytes (JPEG), or None if it could not be computed.
+        """
+        return self.get_heatmaps(image_content, [target_label])[0]
 
 gradcam_service = GradCAMService()
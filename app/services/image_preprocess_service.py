@@ -1,10 +1,17 @@
 import logging
 import functools
+import hashlib
 import time
 import numpy as np
-from PIL import Image
+from PIL import Image, ImageOps
 import io
+import math
+from typing import Callable, Dict, List, Optional, Tuple, Union
 from app.services.yolo_service import yolo_service
+from app.services.byte_lru_cache import ByteLRUCache
+from app.config import (
+    PREP_STRATEGY_CACHE_MB, PREP_STRATEGY_CACHE_TTL_SECONDS, IMAGE_PREPROCESS_VERSION, MODEL_IMAGE_SIZE, YOLO_INPUT_SIZE,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -15,64 +22,280 @@ class PreprocessStrategy(str, Enum):
     PAD = "pad"
     NONE = "none"
 
+EXIF_ORIENTATION = 0x0112
+# EXIF orientations that swap width and height
+TRANSPOSED_ORIENTATIONS = (5, 6, 7, 8)
+
+def draft_size(size: Tuple[int, int], min_short: int = MODEL_IMAGE_SIZE[0], min_long: int = YOLO_INPUT_SIZE) -> Tuple[int, int]:
+    """
+    Smallest size with the aspect ratio of `size` that still covers the MedSigLIP
+    input (short side, which survives the square center crop) and the YOLO input
+    (long side). Returns `size` unchanged when the image is already smaller.
+    """
+    width, height = size
+    scale = max(min_short / min(width, height), min_long / max(width, height))
+    if scale >= 1:
+        return size
+    return (math.ceil(width * scale), math.ceil(height * scale))
+
+def scale_bbox(bbox: tuple, from_size: Tuple[int, int], to_size: Tuple[int, int]) -> tuple:
+    """Maps an (x1, y1, x2, y2) box between two resolutions of the same image."""
+    if not bbox or from_size == to_size:
+        return bbox
+    sx = to_size[0] / from_size[0]
+    sy = to_size[1] / from_size[1]
+    x1, y1, x2, y2 = bbox
+    return (x1 * sx, y1 * sy, x2 * sx, y2 * sy)
+
+def open_scaled(image_bytes: bytes) -> Tuple[Image.Image, Tuple[int, int]]:
+    """
+    Opens image bytes lazily for preprocessing. Large JPEGs are decoded with DCT
+    scaling (PIL draft) straight to the smallest resolution that still covers
+    draft_size(); the EXIF orientation is applied so phone photos are processed
+    the way they are displayed.
+    Returns the image and its full-resolution size in display orientation, for
+    mapping coordinates back to the original.
+    """
+    image = Image.open(io.BytesIO(image_bytes))
+    full_size = image.size
+    if image.format == "JPEG":
+        image.draft("RGB", draft_size(full_size))
+
+    orientation = image.getexif().get(EXIF_ORIENTATION, 1)
+    if orientation != 1:
+        image = ImageOps.exif_transpose(image)
+        if orientation in TRANSPOSED_ORIENTATIONS:
+            full_size = (full_size[1], full_size[0])
+    return image, full_size
+
+class ImageContext:
+    """
+    Request-scoped view of one uploaded image.
+    The bytes are decoded and orientation-normalized once; the preprocessing
+    strategy (including the lesion bbox) and the prepared model input are
+    computed once and shared by everything that handles the request: the
+    strategy report, the preview and the MedSigLIP embeddings.
+    """
+    def __init__(self, image_bytes: bytes, preprocess: "ImagePreprocessService"):
+        self.image_bytes = image_bytes
+        self._preprocess = preprocess
+        self._prepared: Dict[tuple, Image.Image] = {}
+
+    @functools.cached_property
+    def digest(self) -> str:
+        return hashlib.sha256(self.image_bytes).hexdigest()
+
+    @functools.cached_property
+    def _decoded(self) -> Tuple[Image.Image, Tuple[int, int]]:
+        image, full_size = open_scaled(self.image_bytes)
+        return image.convert("RGB"), full_size
+
+    @property
+    def image(self) -> Image.Image:
+        """The decoded RGB image, possibly at a reduced (draft) resolution."""
+        return self._decoded[0]
+
+    @property
+    def original_size(self) -> Tuple[int, int]:
+        """Full-resolution size of the upload (display orientation)."""
+        return self._decoded[1]
+
+    @functools.cached_property
+    def strategy(self) -> dict:
+        """Preprocessing strategy; bbox and image_size are in original-resolution coordinates."""
+        return self._preprocess.cached_strategy(self.digest, lambda: self._decoded)
+
+    def prepared(self, target_size: tuple = (448, 448)) -> Image.Image:
+        """Square crop/pad of the decoded image resized to target_size, computed once per size."""
+        if target_size not in self._prepared:
+            self._prepared[target_size] = self._preprocess.apply_strategy(
+                self.image, self.strategy["strategy"], target_size
+            )
+        return self._prepared[target_size]
+
+    def preview_base64(self, target_size: tuple = (448, 448)) -> str:
+        """The prepared image as a JPEG data URI, for display in the UI."""
+        import base64
+
+        buf = io.BytesIO()
+        self.prepared(target_size).save(buf, format="JPEG")
+        img_b64 = base64.b64encode(buf.getvalue()).decode('utf-8')
+        return f"data:image/jpeg;base64,{img_b64}"
+
+# strategy_for_image(bbox=_DETECT): run detection for this image
+_DETECT = object()
+
 class ImagePreprocessService:
     def __init__(self):
-        pass
+        # Keyed by content digest: YOLO runs at most once per unique image
+        self.strategy_cache = ByteLRUCache(
+            PREP_STRATEGY_CACHE_MB * 1024 * 1024,
+            name="prep-strategy",
+            ttl_seconds=PREP_STRATEGY_CACHE_TTL_SECONDS,
+        )
 
+    def create_context(self, image_bytes: bytes) -> ImageContext:
+        """Wraps uploaded bytes so one request decodes and preprocesses them only once."""
+        return ImageContext(image_bytes, self)
 
-    def get_lesion_bbox(self, image_content: bytes, threshold: float = 0.25) -> tuple:
+    def get_lesion_bbox(self, image_content: Union[bytes, Image.Image], threshold: float = 0.25) -> tuple:
         """
         Detects the lesion bounding box using YOLOv8-Nano.
+        Accepts raw image bytes or an already decoded image; the box is in the
+        coordinates of the given image (original resolution for bytes).
+        Returns the full image when no lesion is found, and None when detection
+        did not run (YOLO unavailable or failed).
         """
+        if not isinstance(image_content, Image.Image):
+            img, full_size = open_scaled(image_content)
+            bbox = self.get_lesion_bbox(img, threshold)
+            return scale_bbox(bbox, img.size, full_size)
+
         try:
-            with Image.open(io.BytesIO(image_content)) as img:
-                if img.mode != "RGB":
-                    img = img.convert("RGB")
-                width, height = img.size
-                
-                model = yolo_service.load_model()
-                if model is None:
-                    return (0, 0, width, height)
-                    
-                # Run inference
-                results = model.predict(img, conf=threshold, verbose=False)
-                
-                if not results or len(results[0].boxes) == 0:
-                    logger.debug("YOLO detection found no boxes, falling back to full image")
-                    return (0, 0, width, height)
-                    
-                # Take the highest confidence box (YOLO sorts by confidence by default)
-                box = results[0].boxes[0].xyxy[0].cpu().numpy()
-                return (float(box[0]), float(box[1]), float(box[2]), float(box[3]))
+            img = image_content
+            if img.mode != "RGB":
+                img = img.convert("RGB")
+            width, height = img.size
+
+            boxes = yolo_service.detect(img, conf=threshold)
+            if boxes is None:
+                return None
+
+            if not boxes:
+                logger.debug("YOLO detection found no boxes, falling back to full image")
+                return (0, 0, width, height)
+
+            # Take the highest confidence box (YOLO sorts by confidence by default)
+            return boxes[0][:4]
         except Exception as e:
             logger.error(f"YOLO detection failed: {e}")
             return None
 
+    def get_lesion_bboxes(self, images: List[Image.Image], threshold: float = 0.25) -> List[Optional[tuple]]:
+        """
+        Batched get_lesion_bbox() for decoded images: one YOLO forward pass per
+        batch instead of one per image.
+        """
+        try:
+            images = [img if img.mode == "RGB" else img.convert("RGB") for img in images]
+            boxes_list = yolo_service.detect_batch(images, conf=threshold)
+        except Exception as e:
+            logger.error(f"YOLO batch detection failed: {e}")
+            return [None] * len(images)
+        if boxes_list is None:
+            return [None] * len(images)
+
+        bboxes = []
+        for i, img in enumerate(images):
+            width, height = img.size
+            if not boxes_list[i]:
+                bboxes.append((0, 0, width, height))
+            else:
+                bboxes.append(boxes_list[i][0][:4])
+        return bboxes
+
+    def recommend_prep_strategies(self, images: List[Union[bytes, ImageContext]], threshold: float = 0.25) -> List[dict]:
+        """
+        Batch version of recommend_prep_strategy for multi-image flows.
+        Cached images are served from the strategy cache; the remaining images
+        that need detection go through YOLO together. Results are cached, so
+        a later ImageContext.strategy for the same content is a cache hit.
+        """
+        contexts = [image if isinstance(image, ImageContext) else self.create_context(image) for image in images]
+        results: List[Optional[dict]] = [None] * len(contexts)
+
+        pending = []
+        for i, context in enumerate(contexts):
+            cached = self.strategy_cache.get(self._strategy_key(context.digest))
+            if cached is not None:
+                results[i] = dict(cached)
+            else:
+                pending.append(i)
+
+        to_detect = [i for i in pending if self.needs_detection(contexts[i].image)]
+        bboxes = dict(zip(to_detect, self.get_lesion_bboxes([contexts[i].image for i in to_detect], threshold)))
+
+        for i in pending:
+            context = contexts[i]
+            results[i] = self._compute_strategy(context.digest, context.image, context.original_size, bboxes.get(i, _DETECT))
+        return results
 
-    @functools.lru_cache(maxsize=32)
     def recommend_prep_strategy(self, image_bytes: bytes) -> dict:
         """
         Decides whether to 'crop' or 'pad' based on object detection.
+        Cached by content digest.
+        """
+        digest = hashlib.sha256(image_bytes).hexdigest()
+        return self.cached_strategy(digest, lambda: open_scaled(image_bytes))
+
+    def cached_strategy(self, digest: str, load_image: Callable[[], Tuple[Image.Image, Tuple[int, int]]]) -> dict:
+        """
+        Returns the strategy (with bbox and source image size) for the image with this
+        content digest, running detection only on a cache miss.
+        load_image returns the (possibly reduced) image and its full-resolution size;
+        the bbox is reported in full-resolution coordinates.
+        """
+        cached = self.strategy_cache.get(self._strategy_key(digest))
+        if cached is not None:
+            return dict(cached)
+
+        image, full_size = load_image()
+        return self._compute_strategy(digest, image, full_size)
+
+    @staticmethod
+    def _strategy_key(digest: str) -> str:
+        return f"{IMAGE_PREPROCESS_VERSION}|{digest}"
+
+    def _compute_strategy(self, digest: str, image: Image.Image, full_size: Tuple[int, int], bbox=_DETECT) -> dict:
+        if bbox is _DETECT and self.needs_detection(image):
+            bbox = self.get_lesion_bbox(image)
+        result = self.strategy_for_image(image, bbox)
+        if result.get("bbox"):
+            result["bbox"] = scale_bbox(result["bbox"], image.size, full_size)
+        result["image_size"] = full_size
+        # The center-crop fallback is not cached when detection did not run (YOLO not
+        # loaded yet or a transient failure), so the next request detects again
+        if bbox or not self.needs_detection(image):
+            self.strategy_cache.put(self._strategy_key(digest), result)
+        return dict(result)
+
+    @staticmethod
+    def _size_strategy(size: Tuple[int, int]) -> Optional[Tuple[PreprocessStrategy, str]]:
+        """Strategy (and reason) decided by the image size alone, or None when it needs the lesion bbox."""
+        width, height = size
+        max_width, max_height = MODEL_IMAGE_SIZE
+        if width == height:
+            return PreprocessStrategy.NONE, "Already square"
+        if width <= max_width and height <= max_height:
+            return (PreprocessStrategy.PAD,
+                    f"Image is {max_width}x{max_height} or smaller; padding to square to avoid any data loss or scale-down")
+        return None
+
+    @classmethod
+    def needs_detection(cls, image: Image.Image) -> bool:
+        """Only non-square images larger than the model input need the lesion bbox to pick a strategy."""
+        return cls._size_strategy(image.size) is None
+
+    def strategy_for_image(self, image: Image.Image, bbox=_DETECT) -> dict:
+        """
+        Decides whether to 'crop' or 'pad' an (orientation-normalized) image
+        based on object detection.
+        bbox may carry a lesion box precomputed by batched detection.
         """
         start_time = time.perf_counter()
-        image = Image.open(io.BytesIO(image_bytes))
         width, height = image.size
-        
-        if width == height:
-            return {
-                "strategy": PreprocessStrategy.NONE, 
-                "reason": "Already square",
-                "execution_time": f"{(time.perf_counter() - start_time):.3f}s"
-            }
 
-        if width <= 448 and height <= 448:
+        size_strategy = self._size_strategy(image.size)
+        if size_strategy is not None:
+            strategy, reason = size_strategy
             return {
-                "strategy": PreprocessStrategy.PAD, 
-                "reason": "Image is 448x448 or smaller; padding to square to avoid any data loss or scale-down",
+                "strategy": strategy,
+                "reason": reason,
                 "execution_time": f"{(time.perf_counter() - start_time):.3f}s"
             }
 
-        bbox = self.get_lesion_bbox(image_bytes)
+        if bbox is _DETECT:
+            bbox = self.get_lesion_bbox(image)
         if not bbox:
             return {
                 "strategy": PreprocessStrategy.CROP, 
@@ -119,14 +342,11 @@ class ImagePreprocessService:
         Intelligently prepares an image by either cropping or padding to a square,
         then resizing to target_size.
         """
-        # Convert to bytes for strategy detection
-        img_byte_arr = io.BytesIO()
-        image.save(img_byte_arr, format='JPEG')
-        image_bytes = img_byte_arr.getvalue()
-        
-        strategy_res = self.recommend_prep_strategy(image_bytes)
-        strategy = strategy_res["strategy"]
-        
+        strategy = self.strategy_for_image(image)["strategy"]
+        return self.apply_strategy(image, strategy, target_size)
+
+    def apply_strategy(self, image: Image.Image, strategy: PreprocessStrategy, target_size: tuple = (448, 448)) -> Image.Image:
+        """Crops or pads the image to a square according to strategy, then resizes to target_size."""
         width, height = image.size
         
         if strategy == PreprocessStrategy.CROP or strategy == PreprocessStrategy.NONE:
@@ -161,15 +381,8 @@ class ImagePreprocessService:
         """
         Prepares image and returns as base64 data URI for UI debugging/display.
         """
-        import base64
         try:
-            image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-            prepared_image = self.prepare_image(image, target_size)
-            
-            buf = io.BytesIO()
-            prepared_image.save(buf, format="JPEG")
-            img_b64 = base64.b64encode(buf.getvalue()).decode('utf-8')
-            return f"data:image/jpeg;base64,{img_b64}"
+            return self.create_context(image_bytes).preview_base64(target_size)
         except Exception as e:
             logger.error(f"Failed to prepare image base64: {e}")
             return None
@@ -179,8 +392,7 @@ class ImagePreprocessService:
         Helper to prepare image directly from bytes and return bytes.
         """
         try:
-            image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-            prepared_image = self.prepare_image(image, target_size)
+            prepared_image = self.create_context(image_bytes).prepared(target_size)
             
             buf = io.BytesIO()
             prepared_image.save(buf, format="JPEG")
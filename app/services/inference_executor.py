@@ -0,0 +1,205 @@
+import asyncio
+import collections
+import functools
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Hashable, Optional, Tuple
+from app.config import (
+    INFERENCE_MAX_WORKERS, INFERENCE_MAX_QUEUE, INFERENCE_RETRY_AFTER_SECONDS,
+    IDLE_TASK_MAX_QUEUE, IDLE_TASK_POLL_SECONDS,
+)
+
+logger = logging.getLogger(__name__)
+
+class InferenceQueueFull(Exception):
+    """Raised when the inference executor has no free admission slot."""
+    def __init__(self, retry_after: int = INFERENCE_RETRY_AFTER_SECONDS):
+        super().__init__("Inference queue is full")
+        self.retry_after = retry_after
+
+class InferenceExecutor:
+    """
+    Dedicated thread pool for CPU-bound model and image work (MedSigLIP, Grad-CAM,
+    YOLO preprocessing, detection visuals), keeping it off the asyncio event loop.
+    Admission is bounded: at most max_workers running plus max_queue waiting jobs.
+    Anything beyond that is rejected immediately with InferenceQueueFull instead of
+    piling up latency for every caller.
+    """
+    def __init__(self, max_workers: int = INFERENCE_MAX_WORKERS, max_queue: int = INFERENCE_MAX_QUEUE):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="inference")
+        self._slots = threading.BoundedSemaphore(max_workers + max_queue)
+        self._pending = 0
+        self._pending_lock = threading.Lock()
+
+    @property
+    def pending(self) -> int:
+        """Number of admitted jobs that are queued or running."""
+        return self._pending
+
+    def is_idle(self) -> bool:
+        return self._pending == 0
+
+    def _release(self, _future):
+        with self._pending_lock:
+            self._pending -= 1
+        self._slots.release()
+
+    def submit(self, fn: Callable, *args, **kwargs):
+        """
+        Admits a job and returns its concurrent.futures.Future.
+        Raises InferenceQueueFull when all slots are taken.
+        """
+        if not self._slots.acquire(blocking=False):
+            logger.warning(f"Inference queue full ({self.max_workers} running, {self.max_queue} queued); rejecting request")
+            raise InferenceQueueFull()
+        with self._pending_lock:
+            self._pending += 1
+        try:
+            future = self._executor.submit(functools.partial(fn, *args, **kwargs))
+        except Exception:
+            self._release(None)
+            raise
+        future.add_done_callback(self._release)
+        return future
+
+    async def run(self, fn: Callable, *args, **kwargs) -> Any:
+        """Runs fn(*args, **kwargs) on the inference pool and awaits the result."""
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
+
+class IdleTaskRunner:
+    """
+    Low-priority background queue for work that must never cost foreground
+    capacity (cache warm-ups, saliency prefetch). A single daemon worker runs one
+    task at a time, only while the inference executor is idle, and never takes
+    one of its admission slots. Tasks may be queued under a key: scheduling the
+    same key replaces the queued task, and keyed tasks can be cancelled or claimed.
+    The queue is bounded: beyond max_queue the oldest tasks are dropped, and tasks
+    still waiting after ttl_seconds expire. Failures are logged.
+    """
+    def __init__(self, executor: InferenceExecutor, max_queue: int = IDLE_TASK_MAX_QUEUE,
+                 poll_seconds: float = IDLE_TASK_POLL_SECONDS, ttl_seconds: Optional[float] = None,
+                 clock: Callable[[], float] = time.monotonic, name: str = "idle-tasks"):
+        self.executor = executor
+        self.max_queue = max_queue
+        self.poll_seconds = poll_seconds
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self.name = name
+        # key -> (task, future, enqueue time), oldest first
+        self._tasks: "collections.OrderedDict[Hashable, Tuple[functools.partial, Future, float]]" = collections.OrderedDict()
+        self._running: Optional[Tuple[Hashable, Future]] = None
+        self._condition = threading.Condition()
+        self._thread = None
+        self.completed = 0
+        self.cancelled = 0
+        self.dropped = 0
+        self.expired = 0
+
+    @property
+    def pending(self) -> int:
+        """Number of queued tasks that have not started yet."""
+        return len(self._tasks)
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        """Queues fn(*args, **kwargs) under a key of its own."""
+        return self.schedule(object(), fn, *args, **kwargs)
+
+    def schedule(self, key: Hashable, fn: Callable, *args, **kwargs) -> Future:
+        """
+        Queues fn(*args, **kwargs) under key, replacing a queued task with the same key.
+        Returns a Future resolved once the task has run (also when it failed) or cancelled.
+        """
+        future = Future()
+        with self._condition:
+            replaced = self._tasks.pop(key, None)
+            if replaced is not None:
+                self._cancel(replaced[1])
+            self._tasks[key] = (functools.partial(fn, *args, **kwargs), future, self.clock())
+            self._expire()
+            while len(self._tasks) > self.max_queue:
+                self._tasks.popitem(last=False)[1][1].cancel()
+                self.dropped += 1
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._worker, name=self.name, daemon=True)
+                self._thread.start()
+            self._condition.notify_all()
+        return future
+
+    def claim(self, key: Hashable) -> Optional[Future]:
+        """
+        Called when the result of a keyed task is needed in the foreground.
+        A queued task is dropped (the caller does the work itself); a running
+        one is returned so the caller can wait for it instead of duplicating it.
+        """
+        with self._condition:
+            self.cancel(key)
+            if self._running is not None and self._running[0] == key:
+                return self._running[1]
+        return None
+
+    def cancel(self, key: Hashable) -> bool:
+        """Drops the queued task with this key; returns whether there was one."""
+        with self._condition:
+            task = self._tasks.pop(key, None)
+            if task is not None:
+                self._cancel(task[1])
+        return task is not None
+
+    def cancel_where(self, predicate: Callable[[Hashable], bool]) -> int:
+        """Drops every queued task whose key matches predicate; returns how many were cancelled."""
+        with self._condition:
+            keys = [key for key in self._tasks if predicate(key)]
+            for key in keys:
+                self._cancel(self._tasks.pop(key)[1])
+        return len(keys)
+
+    def _cancel(self, future: Future):
+        future.cancel()
+        self.cancelled += 1
+
+    def _expire(self):
+        """Drops queued tasks older than ttl_seconds. Call with the condition held."""
+        if self.ttl_seconds is None:
+            return
+        deadline = self.clock() - self.ttl_seconds
+        while self._tasks and next(iter(self._tasks.values()))[2] <= deadline:
+            self._tasks.popitem(last=False)[1][1].cancel()
+            self.expired += 1
+
+    def _next_task(self) -> Tuple[functools.partial, Future]:
+        """Blocks until a task is queued and the inference executor is idle, then takes the oldest task."""
+        with self._condition:
+            while True:
+                self._expire()
+                if self._tasks and self.executor.is_idle():
+                    break
+                # Idleness is not signalled by the executor, so re-check it periodically
+                self._condition.wait(timeout=self.poll_seconds if self._tasks else None)
+            key, (task, future, _) = self._tasks.popitem(last=False)
+            self._running = (key, future)
+            future.set_running_or_notify_cancel()
+            return task, future
+
+    def _worker(self):
+        while True:
+            task, future = self._next_task()
+            try:
+                task()
+                self.completed += 1
+            except Exception as e:
+                logger.warning(f"Background task {getattr(task.func, '__qualname__', task.func)} failed: {e}")
+            finally:
+                with self._condition:
+                    self._running = None
+                future.set_result(None)
+
+# Global instance
+inference_executor = InferenceExecutor()
+idle_task_runner = IdleTaskRunner(inference_executor)
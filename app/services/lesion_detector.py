@@ -0,0 +1,198 @@
+import abc
+import logging
+import os
+import shutil
+import time
+from typing import List, Optional, Tuple
+import numpy as np
+from PIL import Image
+from app.config import YOLO_INPUT_SIZE
+
+logger = logging.getLogger(__name__)
+
+Box = Tuple[float, float, float, float, float]  # x1, y1, x2, y2, confidence
+
+# Ultralytics defaults for detection post-processing
+IOU_THRESHOLD = 0.7
+MAX_DETECTIONS = 300
+MAX_NMS_CANDIDATES = 30000
+CLASS_OFFSET = 7680  # max box side; shifts boxes per class so NMS never mixes classes
+LETTERBOX_COLOR = (114, 114, 114)
+
+class LesionDetector(abc.ABC):
+    """
+    Detector interface used by YOLOService.
+    detect_batch() receives images already downscaled to the detector input size
+    and returns boxes in the coordinates of those images, highest confidence first.
+    """
+    @abc.abstractmethod
+    def detect_batch(self, images: List[Image.Image], conf: float = 0.25) -> List[List[Box]]:
+        ...
+
+class UltralyticsDetector(LesionDetector):
+    """Adapter for an ultralytics YOLO model (the default backend)."""
+    def __init__(self, model):
+        self.model = model
+
+    def detect_batch(self, images: List[Image.Image], conf: float = 0.25) -> List[List[Box]]:
+        results = self.model.predict(images, conf=conf, verbose=False)
+        outputs = []
+        for result in results:
+            boxes = []
+            for box in result.boxes:
+                b = box.xyxy[0].cpu().numpy()
+                boxes.append((float(b[0]), float(b[1]), float(b[2]), float(b[3]), float(box.conf[0])))
+            outputs.append(boxes)
+        return outputs
+
+def letterbox(image: np.ndarray, size: int = YOLO_INPUT_SIZE) -> Tuple[np.ndarray, float, Tuple[int, int]]:
+    """
+    Resizes an HWC RGB array to fit size x size keeping the aspect ratio and pads
+    the rest with gray, as ultralytics does. Returns the padded image, the scale
+    gain and the (left, top) padding.
+    """
+    import cv2
+
+    height, width = image.shape[:2]
+    gain = min(size / height, size / width)
+    new_width, new_height = round(width * gain), round(height * gain)
+    dw, dh = (size - new_width) / 2, (size - new_height) / 2
+
+    if (new_width, new_height) != (width, height):
+        image = cv2.resize(image, (new_width, new_height), interpolation=cv2.INTER_LINEAR)
+    top, bottom = round(dh - 0.1), round(dh + 0.1)
+    left, right = round(dw - 0.1), round(dw + 0.1)
+    image = cv2.copyMakeBorder(image, top, bottom, left, right, cv2.BORDER_CONSTANT, value=LETTERBOX_COLOR)
+    return image, gain, (left, top)
+
+def nms(boxes: np.ndarray, scores: np.ndarray, iou_threshold: float = IOU_THRESHOLD) -> np.ndarray:
+    """Greedy non-maximum suppression over xyxy boxes; returns kept indices by descending score."""
+    x1, y1, x2, y2 = boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
+    areas = (x2 - x1) * (y2 - y1)
+    order = scores.argsort()[::-1]
+
+    keep = []
+    while order.size > 0:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        inter_w = np.clip(np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest]), 0, None)
+        inter_h = np.clip(np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest]), 0, None)
+        inter = inter_w * inter_h
+        iou = inter / (areas[i] + areas[rest] - inter + 1e-9)
+        order = rest[iou <= iou_threshold]
+    return np.array(keep, dtype=np.int64)
+
+def postprocess(prediction: np.ndarray, conf: float, iou_threshold: float = IOU_THRESHOLD,
+                max_det: int = MAX_DETECTIONS) -> np.ndarray:
+    """
+    Decodes one raw YOLOv8 output of shape (4 + classes, anchors) into an (n, 5)
+    array of xyxy boxes and confidences in letterboxed input coordinates.
+    NMS is per class, matching ultralytics' default (non-agnostic) behaviour.
+    """
+    prediction = prediction.T
+    class_scores = prediction[:, 4:]
+    classes = class_scores.argmax(axis=1)
+    scores = class_scores[np.arange(len(classes)), classes]
+
+    mask = scores > conf
+    xywh, scores, classes = prediction[mask, :4], scores[mask], classes[mask]
+    if len(scores) == 0:
+        return np.zeros((0, 5), dtype=np.float32)
+    if len(scores) > MAX_NMS_CANDIDATES:
+        top = scores.argsort()[::-1][:MAX_NMS_CANDIDATES]
+        xywh, scores, classes = xywh[top], scores[top], classes[top]
+
+    boxes = np.empty_like(xywh)
+    boxes[:, :2] = xywh[:, :2] - xywh[:, 2:] / 2
+    boxes[:, 2:] = xywh[:, :2] + xywh[:, 2:] / 2
+
+    keep = nms(boxes + classes[:, None] * CLASS_OFFSET, scores, iou_threshold)[:max_det]
+    return np.concatenate([boxes[keep], scores[keep, None]], axis=1)
+
+class OnnxYoloDetector(LesionDetector):
+    """
+    Runs an ONNX export of YOLOv8 with onnxruntime on CPU: letterboxing, the
+    forward pass and NMS are all done here, without importing ultralytics.
+    """
+    def __init__(self, onnx_path: str, input_size: int = YOLO_INPUT_SIZE, intra_op_threads: Optional[int] = None):
+        self.onnx_path = onnx_path
+        self.input_size = input_size
+        self.intra_op_threads = intra_op_threads
+        self.session = None
+
+    def load(self):
+        if self.session is None:
+            import onnxruntime as ort
+
+            logger.info(f"Loading ONNX lesion detector: {self.onnx_path}...")
+            options = ort.SessionOptions()
+            options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+            if self.intra_op_threads:
+                options.intra_op_num_threads = self.intra_op_threads
+            self.session = ort.InferenceSession(self.onnx_path, sess_options=options, providers=["CPUExecutionProvider"])
+        return self.session
+
+    def detect_batch(self, images: List[Image.Image], conf: float = 0.25) -> List[List[Box]]:
+        if not images:
+            return []
+        session = self.load()
+
+        batch, transforms = [], []
+        for image in images:
+            padded, gain, pad = letterbox(np.asarray(image.convert("RGB")), self.input_size)
+            batch.append(padded)
+            transforms.append((gain, pad, image.size))
+        inputs = np.ascontiguousarray(np.stack(batch).transpose(0, 3, 1, 2), dtype=np.float32) / 255.0
+
+        predictions = session.run(None, {session.get_inputs()[0].name: inputs})[0]
+
+        outputs = []
+        for prediction, (gain, (left, top), (width, height)) in zip(predictions, transforms):
+            detections = postprocess(prediction, conf)
+            # Undo the letterbox: back to the coordinates of the given image
+            detections[:, [0, 2]] = np.clip((detections[:, [0, 2]] - left) / gain, 0, width)
+            detections[:, [1, 3]] = np.clip((detections[:, [1, 3]] - top) / gain, 0, height)
+            outputs.append([tuple(float(v) for v in row) for row in detections])
+        return outputs
+
+def export_yolo_onnx(weights: str, output_path: str, imgsz: int = YOLO_INPUT_SIZE) -> str:
+    """
+    Exports ultralytics YOLO weights to ONNX with a dynamic batch axis.
+    Needs ultralytics at export time only. Returns the output path.
+    """
+    from ultralytics import YOLO
+
+    start_time = time.perf_counter()
+    exported = YOLO(weights).export(format="onnx", imgsz=imgsz, dynamic=True)
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    if os.path.abspath(exported) != os.path.abspath(output_path):
+        shutil.move(exported, output_path)
+    logger.info(f"Exported {weights} to {output_path} in {(time.perf_counter() - start_time):.1f}s")
+    return output_path
+
+def check_detector_parity(reference: LesionDetector, candidate: LesionDetector, images: List[Image.Image],
+                          conf: float = 0.25) -> dict:
+    """
+    Compares the top box of two detectors over the same images.
+    Returns the share of images whose top box matches (IoU >= 0.9, or both empty)
+    and the smallest top-box IoU.
+    """
+    agree = 0
+    min_iou = 1.0
+    for ref_boxes, cand_boxes in zip(reference.detect_batch(images, conf), candidate.detect_batch(images, conf)):
+        if not ref_boxes or not cand_boxes:
+            iou = 1.0 if not ref_boxes and not cand_boxes else 0.0
+        else:
+            a, b = np.array(ref_boxes[0][:4]), np.array(cand_boxes[0][:4])
+            inter = max(0.0, min(a[2], b[2]) - max(a[0], b[0])) * max(0.0, min(a[3], b[3]) - max(a[1], b[1]))
+            union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+            iou = inter / union if union > 0 else 0.0
+        min_iou = min(min_iou, iou)
+        agree += iou >= 0.9
+
+    return {
+        "images": len(images),
+        "top_box_agreement": agree / len(images) if images else 1.0,
+        "min_top_box_iou": min_iou,
+    }
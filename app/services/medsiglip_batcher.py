@@ -0,0 +1,112 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import List, Optional, Union
+from app.services.image_preprocess_service import ImageContext
+from app.services.medsiglip_service import medsiglip_service
+from app.config import MEDSIGLIP_BATCH_WINDOW_MS, MEDSIGLIP_MAX_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+class MedSigLIPBatcher:
+    """
+    Dynamic micro-batching front for MedSigLIPService.
+    Requests arriving within a short window are collected (up to a maximum
+    batch size), run through one batched vision forward pass on a dedicated
+    worker thread, and the per-image results are handed back to each caller.
+    When no other request is in flight the call goes straight to the service,
+    so an idle server never pays the batching window.
+    Exposes the same get_embeddings() signature as the service so it can be
+    dropped into ClinicalModalityWrapper.
+    """
+    def __init__(self, service, max_batch_size: int = MEDSIGLIP_MAX_BATCH_SIZE, batch_window_ms: float = MEDSIGLIP_BATCH_WINDOW_MS):
+        self.service = service
+        self.max_batch_size = max(1, max_batch_size)
+        self.batch_window = batch_window_ms / 1000.0
+
+        self._queue: "queue.Queue" = queue.Queue()
+        self._worker = None
+        self._worker_lock = threading.Lock()
+        self._inflight = 0
+        self._inflight_lock = threading.Lock()
+
+    @property
+    def model_name(self) -> str:
+        return self.service.model_name
+
+    def _ensure_worker(self):
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._worker_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="medsiglip-batcher", daemon=True)
+                self._worker.start()
+
+    def get_embeddings(self, image: Union[bytes, ImageContext], texts: Optional[List[str]] = None):
+        """
+        Blocking call: preprocesses the image (raw bytes or a request's ImageContext)
+        in the caller's thread, enqueues it for the next batch and waits for its result.
+        """
+        with self._inflight_lock:
+            idle = self._inflight == 0
+            self._inflight += 1
+        try:
+            if idle:
+                return self.service.get_embeddings(image, texts=texts)
+
+            key = self.service.image_cache_key(image)
+            cached = self.service.image_embedding_cache.get(key)
+            if cached is not None:
+                # Scoring a cached embedding is cheap; no need to wait for a batch
+                return self.service.score_image_embeds(cached.unsqueeze(0), [texts])[0]
+
+            prepared = self.service.prepare(image)
+            future: Future = Future()
+            self._ensure_worker()
+            self._queue.put((prepared, texts, key, future))
+            return future.result()
+        finally:
+            with self._inflight_lock:
+                self._inflight -= 1
+
+    def _collect_batch(self) -> list:
+        """Blocks for the first request, then gathers more until the window closes or the batch is full."""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.batch_window
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            # Drop requests whose callers have already given up
+            batch = [item for item in batch if item[3].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+
+            images = [item[0] for item in batch]
+            texts_list = [item[1] for item in batch]
+            cache_keys = [item[2] for item in batch]
+            try:
+                start_time = time.perf_counter()
+                results = self.service.get_embeddings_batch(images, texts_list, cache_keys=cache_keys)
+                logger.debug(f"MedSigLIP batch of {len(batch)} took {(time.perf_counter() - start_time):.3f}s")
+            except Exception as e:
+                for _, _, _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            for (_, _, _, future), result in zip(batch, results):
+                future.set_result(result)
+
+# Global instance
+medsiglip_batcher = MedSigLIPBatcher(medsiglip_service)
@@ -1,6 +1,6 @@
 import logging
-from typing import List, Dict, Optional, Any
-from app.services.medsiglip_service import medsiglip_service
+from typing import List, Dict, Optional, Any, Tuple
+from app.services.medsiglip_batcher import medsiglip_batcher
 from app.dermatology_data import MEDSIGLIP_DERMATOLOGY_NARROW_LABELS
 
 logger = logging.getLogger(__name__)
@@ -23,10 +23,10 @@ class ClinicalModalityWrapper:
         #return "Clinical photograph showing {}."
         return "A patient-submitted smartphone photograph showing {}."
 
-    def analyze_image(self, image_bytes: bytes, custom_labels: Optional[List[str]] = None) -> List[Dict]:
+    def build_prompts(self, custom_labels: Optional[List[str]] = None) -> Tuple[List[str], List[str]]:
         """
-        Analyzes an image using clinical descriptions (values) wrapped in modality templates.
-        Returns mapped results with original short labels (keys).
+        Returns (labels, prompts): the short labels (keys) and their clinical
+        descriptions (values) wrapped in the modality template.
         """
         # 1. Prepare labels and descriptions from MEDSIGLIP_DERMATOLOGY_NARROW_LABELS
         if custom_labels:
@@ -48,10 +48,17 @@ class ClinicalModalityWrapper:
         # 2. Apply modality template to descriptions (Values)
         template = self._get_template()
         prompts = [template.format(desc) for desc in descriptions]
+        return valid_labels, prompts
+
+    def analyze_image(self, image_bytes: Any, custom_labels: Optional[List[str]] = None) -> List[Dict]:
+        """
+        Analyzes an image using clinical descriptions (values) wrapped in modality templates.
+        image_bytes may also be an ImageContext when the service supports it (MedSigLIP).
+        Returns mapped results with original short labels (keys).
+        """
+        valid_labels, prompts = self.build_prompts(custom_labels)
 
-        print(f"\n[DEBUG] Prompts for {self.service.model_name}:")
-        for p in prompts:
-            print(f"  - {p}")
+        logger.debug("Prompts for %s: %s", self.service.model_name, prompts)
 
         # 3. Call the underlying service
         # Handle different method names between MedSigLIP and SigLIP services
@@ -77,4 +84,5 @@ class ClinicalModalityWrapper:
         return mapped_results
 
 # Global instances for easy access
-medsiglip_wrapped_service = ClinicalModalityWrapper(medsiglip_service)
+# Routed through the micro-batcher so concurrent requests share a vision forward pass.
+medsiglip_wrapped_service = ClinicalModalityWrapper(medsiglip_batcher)
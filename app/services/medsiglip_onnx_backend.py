@@ -0,0 +1,94 @@
+import logging
+import os
+import time
+from typing import List, Optional
+import numpy as np
+import torch
+from app.config import MODEL_IMAGE_SIZE
+
+logger = logging.getLogger(__name__)
+
+class _VisionTower(torch.nn.Module):
+    """Exposes only the SigLIP vision tower: pixel_values -> pooled image embedding."""
+    def __init__(self, vision_model):
+        super().__init__()
+        self.vision_model = vision_model
+
+    def forward(self, pixel_values):
+        return self.vision_model(pixel_values=pixel_values).pooler_output
+
+def export_vision_onnx(model, output_path: str, image_size: tuple = MODEL_IMAGE_SIZE, opset: int = 17) -> str:
+    """
+    Exports the vision encoder of a loaded SigLIP model to ONNX with a dynamic batch axis.
+    Returns the output path.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    tower = _VisionTower(model.vision_model).eval().to("cpu")
+    dummy = torch.zeros(1, 3, image_size[1], image_size[0], dtype=torch.float32)
+
+    start_time = time.perf_counter()
+    with torch.no_grad():
+        torch.onnx.export(
+            tower,
+            (dummy,),
+            output_path,
+            input_names=["pixel_values"],
+            output_names=["image_embeds"],
+            dynamic_axes={"pixel_values": {0: "batch"}, "image_embeds": {0: "batch"}},
+            opset_version=opset,
+            dynamo=False,
+        )
+    logger.info(f"Exported MedSigLIP vision tower to {output_path} in {(time.perf_counter() - start_time):.1f}s")
+    return output_path
+
+class OnnxVisionBackend:
+    """
+    Runs the exported MedSigLIP vision tower with onnxruntime on CPU.
+    Produces the same pooled (unnormalized) embeddings as model.vision_model(...).pooler_output.
+    """
+    def __init__(self, onnx_path: str, intra_op_threads: Optional[int] = None):
+        self.onnx_path = onnx_path
+        self.intra_op_threads = intra_op_threads
+        self.session = None
+
+    def load(self):
+        if self.session is None:
+            import onnxruntime as ort
+
+            logger.info(f"Loading ONNX vision tower: {self.onnx_path}...")
+            options = ort.SessionOptions()
+            options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+            if self.intra_op_threads:
+                options.intra_op_num_threads = self.intra_op_threads
+            self.session = ort.InferenceSession(self.onnx_path, sess_options=options, providers=["CPUExecutionProvider"])
+        return self.session
+
+    def __call__(self, pixel_values: np.ndarray) -> np.ndarray:
+        session = self.load()
+        return session.run(["image_embeds"], {"pixel_values": np.ascontiguousarray(pixel_values, dtype=np.float32)})[0]
+
+def check_parity(reference_service, candidate_service, images: List[bytes], texts: List[str]) -> dict:
+    """
+    Compares zero-shot probabilities of two MedSigLIPService instances (e.g. torch vs onnx)
+    over the same images and prompts.
+    Returns the maximum absolute probability difference and the top-1 agreement rate.
+    """
+    from app.services.image_preprocess_service import image_preprocess_service
+
+    # Batched lesion detection up front; per-image preprocessing then hits the strategy cache
+    image_preprocess_service.recommend_prep_strategies(images)
+
+    max_abs_diff = 0.0
+    agree = 0
+    for image_bytes in images:
+        ref = {r["label"]: r["score"] for r in reference_service.get_embeddings(image_bytes, texts=texts)}
+        cand = {r["label"]: r["score"] for r in candidate_service.get_embeddings(image_bytes, texts=texts)}
+        max_abs_diff = max(max_abs_diff, max(abs(ref[t] - cand[t]) for t in texts))
+        if max(ref, key=ref.get) == max(cand, key=cand.get):
+            agree += 1
+
+    return {
+        "images": len(images),
+        "max_abs_prob_diff": max_abs_diff,
+        "top1_agreement": agree / len(images) if images else 1.0,
+    }
@@ -1,22 +1,75 @@
 import logging
+import numpy as np
 import torch
 import os
+import json
 from PIL import Image
 from transformers import AutoProcessor, AutoModel
-import io
-from typing import List, Optional
-from app.services.image_preprocess_service import image_preprocess_service
-from app.config import MEDSIGLIP_MODEL_NAME, MODEL_IMAGE_SIZE
+import threading
+import time
+from typing import Dict, List, Optional, Tuple, Union
+from app.services.image_preprocess_service import image_preprocess_service, ImageContext
+from app.services.byte_lru_cache import ByteLRUCache
+from app.config import (
+    MEDSIGLIP_MODEL_NAME, MODEL_IMAGE_SIZE, MEDSIGLIP_BACKEND, MEDSIGLIP_ONNX_PATH, MEDSIGLIP_QUANTIZATION, MEDSIGLIP_EMBEDDING_CACHE_MB, MEDSIGLIP_TEXT_EMBEDDING_CACHE_MB, IMAGE_PREPROCESS_VERSION,
+    MEDSIGLIP_LOAD_MODE, MEDSIGLIP_TEXT_EMBEDDINGS_PATH, MEDSIGLIP_TORCHSCRIPT_PATH,
+)
 
 logger = logging.getLogger(__name__)
 
+class SigLIPTowers(torch.nn.Module):
+    """
+    Stand-in for SiglipModel assembled from separately loaded towers
+    (used by the "vision_only" load mode). The text tower is optional and
+    attached on demand; forward() mirrors SiglipModel for callers that need
+    the full two-tower graph (e.g. Grad-CAM).
+    """
+    def __init__(self, vision_model, logit_scale: torch.Tensor, logit_bias: torch.Tensor, text_model=None):
+        super().__init__()
+        self.vision_model = vision_model
+        self.text_model = text_model
+        self.logit_scale = torch.nn.Parameter(logit_scale, requires_grad=False)
+        self.logit_bias = torch.nn.Parameter(logit_bias, requires_grad=False)
+
+    def forward(self, input_ids=None, pixel_values=None, attention_mask=None, **kwargs):
+        from transformers.models.siglip.modeling_siglip import SiglipOutput
+
+        text_model = self.text_model
+        if text_model is None:
+            raise RuntimeError("Text tower is not loaded")
+        image_embeds = self.vision_model(pixel_values=pixel_values).pooler_output
+        text_embeds = text_model(input_ids=input_ids, attention_mask=attention_mask).pooler_output
+        image_embeds = image_embeds / image_embeds.norm(p=2, dim=-1, keepdim=True)
+        text_embeds = text_embeds / text_embeds.norm(p=2, dim=-1, keepdim=True)
+
+        logits_per_text = torch.matmul(text_embeds, image_embeds.t()) * self.logit_scale.exp() + self.logit_bias
+        return SiglipOutput(
+            logits_per_image=logits_per_text.t(),
+            logits_per_text=logits_per_text,
+            text_embeds=text_embeds,
+            image_embeds=image_embeds,
+        )
+
 class MedSigLIPService:
-    def __init__(self, model_name=MEDSIGLIP_MODEL_NAME):
+    def __init__(self, model_name=MEDSIGLIP_MODEL_NAME, backend=MEDSIGLIP_BACKEND, onnx_path=MEDSIGLIP_ONNX_PATH, quantization=MEDSIGLIP_QUANTIZATION,
+                 load_mode=MEDSIGLIP_LOAD_MODE, text_embeddings_path=MEDSIGLIP_TEXT_EMBEDDINGS_PATH,
+                 torchscript_path=MEDSIGLIP_TORCHSCRIPT_PATH):
         # We'll lazy load the model to avoid startup costs and potential auth issues crashing the app immediately
         self.model_name = model_name
+        self.backend = backend
+        self.onnx_path = onnx_path
+        self.quantization = quantization
+        self.load_mode = load_mode
+        self.text_embeddings_path = text_embeddings_path
+        self.torchscript_path = torchscript_path
         
         self.processor = None
         self.model = None
+        # Optional non-PyTorch runner for the vision tower (see MEDSIGLIP_BACKEND)
+        self.vision_backend = None
+        self._vision_backend_deferred = False
+        self._load_lock = threading.Lock()
+        self._text_tower_lock = threading.Lock()
         if torch.cuda.is_available():
             self.device = "cuda"
         elif torch.backends.mps.is_available():
@@ -24,72 +77,469 @@ class MedSigLIPService:
         else:
             self.device = "cpu"
 
-    def _load_model(self):
-        if self.model is None:
-            logger.info(f"Loading MedSigLIP model: {self.model_name} on {self.device}...")
-            try:
-                token = os.getenv("HF_TOKEN")
-                self.processor = AutoProcessor.from_pretrained(self.model_name, token=token)
-                self.model = AutoModel.from_pretrained(self.model_name, token=token).to(self.device)
-                logger.info("MedSigLIP model loaded successfully.")
-            except Exception as e:
-                    logger.error(f"Failed to load MedSigLIP model: {e}")
-                    raise e
+        # Normalized label text embeddings, one row per prompt keyed by model and prompt.
+        # Prompts already carry the modality template, so a new template naturally
+        # produces new entries. Client-supplied prompts go to a bounded LRU cache;
+        # pinned ones (the default label sets, warm-up and the persisted store) stay.
+        self._pinned_text_embeddings: Dict[str, torch.Tensor] = {}
+        self.text_embedding_cache = ByteLRUCache(MEDSIGLIP_TEXT_EMBEDDING_CACHE_MB * 1024 * 1024, name="text-embeddings")
+        self._text_embeddings_lock = threading.Lock()
+
+        # Pooled vision embeddings keyed by image content and preprocessing parameters
+        self.image_embedding_cache = ByteLRUCache(MEDSIGLIP_EMBEDDING_CACHE_MB * 1024 * 1024, name="image-embeddings")
+
+        # Input size and 0-255 mean/std for the direct pixel_values path, per processor
+        self._normalization_for = None
+        self._normalization_params = None
 
-    def get_embeddings(self, image_bytes: bytes, texts: Optional[List[str]] = None):
+    def _load_model(self, vision_backend: bool = True):
         """
-        Run inference to get embeddings or probabilities for zero-shot classification.
-        If texts is provided, performs zero-shot classification via similarity.
+        Loads the weights and, unless vision_backend is False, the configured
+        TorchScript/ONNX vision runner. The pre-fork server loads weights only:
+        tracing runs a forward pass and would start thread pools before forking,
+        so the runner is built on the first call in each worker instead.
+        """
+        # Every inference call comes through here: once published, the model is
+        # returned without touching the lock
+        if self.model is not None and not (vision_backend and self._vision_backend_deferred):
+            return
+        # Startup warm-up and the first request may race to load the weights
+        with self._load_lock:
+            if self.model is None:
+                logger.info(f"Loading MedSigLIP model: {self.model_name} on {self.device} ({self.load_mode})...")
+                try:
+                    token = os.getenv("HF_TOKEN")
+                    processor = AutoProcessor.from_pretrained(self.model_name, token=token)
+                    if self.load_mode == "vision_only":
+                        model = self._load_vision_only(token)
+                    else:
+                        model = AutoModel.from_pretrained(self.model_name, token=token).to(self.device)
+                    # Fully configured before it is published: unlocked readers check self.model,
+                    # and a failure here must leave the service unloaded rather than half-configured
+                    self._apply_quantization(model)
+                    backend = self._create_vision_backend(model) if vision_backend else None
+                    if self.load_mode == "vision_only":
+                        self._load_text_embedding_store()
+                    self.processor = processor
+                    self.vision_backend = backend
+                    self._vision_backend_deferred = not vision_backend
+                    self.model = model
+                    logger.info("MedSigLIP model loaded successfully.")
+                except Exception as e:
+                        logger.error(f"Failed to load MedSigLIP model: {e}")
+                        raise e
+            elif vision_backend and self._vision_backend_deferred:
+                self.vision_backend = self._create_vision_backend(self.model)
+                self._vision_backend_deferred = False
+
+    def _read_checkpoint_tensors(self, names: List[str], token: Optional[str]) -> Dict[str, torch.Tensor]:
+        """Reads individual tensors from the (possibly sharded) memory-mapped safetensors checkpoint."""
+        from safetensors import safe_open
+        from transformers.utils import cached_file
+
+        index_file = cached_file(self.model_name, "model.safetensors.index.json", token=token,
+                                 _raise_exceptions_for_missing_entries=False)
+        if index_file:
+            with open(index_file) as f:
+                weight_map = json.load(f)["weight_map"]
+            shards = {weight_map[name] for name in names}
+        else:
+            shards = {"model.safetensors"}
+
+        tensors = {}
+        for shard in shards:
+            with safe_open(cached_file(self.model_name, shard, token=token), framework="pt", device="cpu") as f:
+                for name in names:
+                    if name in f.keys():
+                        tensors[name] = f.get_tensor(name)
+        return tensors
+
+    def _load_vision_only(self, token: Optional[str]) -> SigLIPTowers:
+        """
+        Builds the serving model from the vision tower plus logit scale/bias only.
+        Weights are read from memory-mapped safetensors shards, so text tower
+        tensors are never paged in. The text tower is attached on demand.
+        """
+        from transformers import SiglipVisionModel
+
+        vision = SiglipVisionModel.from_pretrained(self.model_name, token=token)
+        # transformers 4.x wraps the transformer in .vision_model; 5.x returns it directly
+        vision = getattr(vision, "vision_model", vision)
+        head = self._read_checkpoint_tensors(["logit_scale", "logit_bias"], token)
+        return SigLIPTowers(vision, head["logit_scale"], head["logit_bias"]).eval().to(self.device)
+
+    def ensure_text_tower(self):
+        """Returns the text tower, loading it first if the model was loaded without it."""
+        self._load_model()
+        text_model = self.model.text_model
+        if text_model is not None:
+            return text_model
+        # Own lock: a seconds-long text tower load must not block foreground analyses
+        with self._text_tower_lock:
+            if self.model.text_model is None:
+                from transformers import SiglipTextModel
+
+                start_time = time.perf_counter()
+                text = SiglipTextModel.from_pretrained(self.model_name, token=os.getenv("HF_TOKEN"))
+                self.model.text_model = getattr(text, "text_model", text).eval().to(self.device)
+                logger.info(f"MedSigLIP text tower loaded on demand in {(time.perf_counter() - start_time):.1f}s")
+            return self.model.text_model
+
+    def unload_text_tower(self):
+        """Drops the text tower again in vision_only mode once label embeddings are cached."""
+        if self.load_mode != "vision_only" or self.model is None:
+            return
+        with self._text_tower_lock:
+            if self.model.text_model is not None:
+                self.model.text_model = None
+                logger.info("MedSigLIP text tower unloaded.")
+
+    def _load_text_embedding_store(self):
+        """Pins label embeddings persisted by save_text_embeddings(), so known prompts need no text tower."""
+        if not self.text_embeddings_path or not os.path.exists(self.text_embeddings_path):
+            return
+        try:
+            data = torch.load(self.text_embeddings_path, map_location=self.device, weights_only=True)
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable text embedding store {self.text_embeddings_path}: {e}")
+            return
+        if data.get("model_name") != self.model_name:
+            return
+        if "prompts" in data:
+            rows = zip(data["prompts"], data["embeddings"])
+        else:
+            # Stores written before per-prompt caching: (prompts, embeddings) per label set
+            rows = [(prompt, row) for prompts, embeds in data["embeddings"] for prompt, row in zip(prompts, embeds)]
+        with self._text_embeddings_lock:
+            for prompt, row in rows:
+                self._pinned_text_embeddings[self._text_key(prompt)] = row.clone()
+        logger.info(f"Loaded {len(self._pinned_text_embeddings)} label embeddings from {self.text_embeddings_path}")
+
+    def save_text_embeddings(self):
+        """Persists the pinned label embeddings to text_embeddings_path."""
+        prefix = self._text_key("")
+        with self._text_embeddings_lock:
+            entries = [(key[len(prefix):], row.cpu()) for key, row in self._pinned_text_embeddings.items()
+                       if key.startswith(prefix)]
+        os.makedirs(os.path.dirname(os.path.abspath(self.text_embeddings_path)), exist_ok=True)
+        torch.save({
+            "model_name": self.model_name,
+            "prompts": [prompt for prompt, _ in entries],
+            "embeddings": torch.stack([row for _, row in entries]) if entries else torch.empty(0),
+        }, self.text_embeddings_path)
+
+    def _apply_quantization(self, model=None):
+        """
+        Applies the configured quantization mode to the vision tower in place.
+        The text tower stays in fp32: it runs once per label set, so there is
+        nothing to gain there and label embeddings keep full precision.
+        Only the encoder layers are quantized: Grad-CAM backpropagates through
+        post_layernorm and the pooling head, and dynamically quantized linears
+        have no autograd kernel, so their gradient would be silently dropped.
+        """
+        if self.quantization in (None, "", "none"):
+            return
+        if self.quantization != "int8":
+            logger.warning(f"Unknown quantization mode '{self.quantization}', using fp32.")
+            return
+        if self.device != "cpu":
+            logger.warning(f"int8 dynamic quantization is CPU-only; keeping fp32 on {self.device}.")
+            return
+
+        from torch.ao.quantization import quantize_dynamic
+        vision_model = (model if model is not None else self.model).vision_model
+        vision_model.encoder = quantize_dynamic(vision_model.encoder, {torch.nn.Linear}, dtype=torch.qint8)
+        logger.info("MedSigLIP vision encoder quantized to int8 (dynamic); pooling head kept in fp32.")
+
+    def _load_vision_backend(self):
+        self.vision_backend = self._create_vision_backend(self.model)
+
+    def _create_vision_backend(self, model):
+        """Returns the configured non-PyTorch vision runner for model, or None to run it eagerly."""
+        if self.backend == "torchscript":
+            return self._create_torchscript_backend(model)
+        if self.backend != "onnx":
+            return None
+        if not os.path.exists(self.onnx_path):
+            logger.warning(f"ONNX vision tower not found at {self.onnx_path}; run bin/export_onnx.py. Falling back to PyTorch.")
+            return None
+        from app.services.medsiglip_onnx_backend import OnnxVisionBackend
+        backend = OnnxVisionBackend(self.onnx_path)
+        backend.load()
+        return backend
+
+    def _create_torchscript_backend(self, model):
+        if self.device != "cpu":
+            logger.warning(f"TorchScript vision backend is CPU-only; using eager PyTorch on {self.device}.")
+            return None
+        from app.services.medsiglip_torchscript_backend import TorchScriptVisionBackend
+        backend = TorchScriptVisionBackend(self.torchscript_path, {
+            "model_name": self.model_name,
+            "quantization": self.quantization,
+            "image_size": list(MODEL_IMAGE_SIZE),
+        })
+        try:
+            backend.load(model)
+        except Exception as e:
+            logger.warning(f"Tracing the MedSigLIP vision tower failed; falling back to eager PyTorch: {e}")
+            return None
+        return backend
+
+    def benchmark_vision_backend(self, runs: int = 3) -> Optional[dict]:
+        """Logs and returns eager vs optimized vision tower latency; None when no optimized backend is active."""
+        if self.vision_backend is None:
+            return None
+        from app.services.medsiglip_torchscript_backend import benchmark
+
+        def eager(pixel_values):
+            with torch.no_grad():
+                return self.model.vision_model(pixel_values=torch.from_numpy(pixel_values).to(self.device)).pooler_output
+
+        pixel_values = self.pixel_values([Image.new("RGB", MODEL_IMAGE_SIZE)]).numpy()
+        result = benchmark(eager, self.vision_backend, pixel_values, runs=runs)
+        logger.info(f"MedSigLIP vision benchmark ({self.backend}, {torch.get_num_threads()} threads): "
+                    f"eager {result['eager_ms']} ms, {self.backend} {result['compiled_ms']} ms, speedup x{result['speedup']}")
+        return result
+
+    def _text_key(self, prompt: str) -> str:
+        return f"{self.model_name}|{prompt}"
+
+    def _cached_text_row(self, prompt: str) -> Optional[torch.Tensor]:
+        key = self._text_key(prompt)
+        row = self._pinned_text_embeddings.get(key)
+        return row if row is not None else self.text_embedding_cache.get(key)
+
+    def get_text_embeddings(self, texts: List[str], pin: bool = False) -> torch.Tensor:
+        """
+        Returns L2-normalized text embeddings for the given prompts, one row per prompt.
+        The text tower only runs for prompts not seen before (all of them in one
+        pass); the matrix is assembled from cached per-prompt rows.
+        pin keeps the rows out of the bounded cache, for the server's own label sets.
         """
         self._load_model()
+        rows = {prompt: self._cached_text_row(prompt) for prompt in dict.fromkeys(texts)}
+
+        if any(row is None for row in rows.values()):
+            with self._text_embeddings_lock:
+                # Another thread may have computed some of them meanwhile
+                missing = []
+                for prompt, row in rows.items():
+                    if row is None:
+                        rows[prompt] = self._cached_text_row(prompt)
+                        if rows[prompt] is None:
+                            missing.append(prompt)
+                if missing:
+                    for prompt, row in zip(missing, self._compute_text_embeddings(missing)):
+                        self.text_embedding_cache.put(self._text_key(prompt), row)
+                        rows[prompt] = row
+
+        if pin:
+            with self._text_embeddings_lock:
+                for prompt, row in rows.items():
+                    self._pinned_text_embeddings[self._text_key(prompt)] = row
+        return torch.stack([rows[prompt] for prompt in texts])
+
+    def _compute_text_embeddings(self, texts: List[str]) -> List[torch.Tensor]:
+        logger.info(f"Computing text embeddings for {len(texts)} prompts (cache miss)")
+        text_model = self.ensure_text_tower()
+        # 64-token limit check as per requirements
+        inputs = self.processor(
+            text=texts,
+            padding="max_length",
+            max_length=64,
+            truncation=True,
+            return_tensors="pt"
+        ).to(self.device)
+
+        with torch.no_grad():
+            text_embeds = text_model(
+                input_ids=inputs["input_ids"],
+                attention_mask=inputs.get("attention_mask"),
+            ).pooler_output
+            text_embeds = text_embeds / text_embeds.norm(p=2, dim=-1, keepdim=True)
+        # Own storage per row, so the cache accounts for (and frees) exactly one row
+        return [row.clone() for row in text_embeds]
+
+    def clear_text_embeddings(self):
+        """Drops all cached label text embeddings, pinned ones included."""
+        with self._text_embeddings_lock:
+            self._pinned_text_embeddings.clear()
+            self.text_embedding_cache.clear()
+
+    def _normalization(self) -> Optional[Tuple[Tuple[int, int], torch.Tensor, torch.Tensor]]:
+        """
+        (width, height), per-channel mean and std on the 0-255 scale when the image
+        processor only resizes, rescales and normalizes; None otherwise.
+        Cached per processor instance.
+        """
+        processor = self.processor
+        if self._normalization_for is processor:
+            return self._normalization_params
+
+        params = None
+        image_processor = getattr(processor, "image_processor", None)
+        size = getattr(image_processor, "size", None)
         try:
-            image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-            image = image_preprocess_service.prepare_image(image, MODEL_IMAGE_SIZE)
-            
+            width, height = int(size["width"]), int(size["height"])
+            rescale_factor = float(image_processor.rescale_factor)
+            mean = torch.tensor(list(image_processor.image_mean), dtype=torch.float32)
+            std = torch.tensor(list(image_processor.image_std), dtype=torch.float32)
+            simple = (image_processor.do_rescale is True and image_processor.do_normalize is True
+                      and not getattr(image_processor, "do_center_crop", False)
+                      and not getattr(image_processor, "do_pad", False))
+            if simple and mean.numel() == 3 and std.numel() == 3:
+                # Rescale folded into mean/std, as the processor's fused normalize does
+                params = ((width, height), mean * (1.0 / rescale_factor), std * (1.0 / rescale_factor))
+        except (AttributeError, KeyError, TypeError, ValueError):
+            params = None
+        if params is None:
+            logger.info("Image processor does not allow the direct pixel_values path; using the processor.")
+
+        self._normalization_params = params
+        self._normalization_for = processor
+        return params
+
+    def pixel_values(self, images: List[Image.Image]) -> torch.Tensor:
+        """
+        Vision tower input for already prepared images.
+        Images at the processor's input size are packed into one contiguous uint8
+        buffer and rescaled/normalized with vectorized torch ops, matching the
+        processor output; anything else goes through the processor.
+        """
+        params = self._normalization()
+        if params is None or any(image.size != params[0] or image.mode != "RGB" for image in images):
+            return self.processor(images=images, return_tensors="pt")["pixel_values"]
+
+        (width, height), mean, std = params
+        batch = np.empty((len(images), height, width, 3), dtype=np.uint8)
+        for i, image in enumerate(images):
+            batch[i] = np.asarray(image)
+        pixel_values = torch.from_numpy(batch).permute(0, 3, 1, 2).to(torch.float32, memory_format=torch.contiguous_format)
+        return pixel_values.sub_(mean[:, None, None]).div_(std[:, None, None])
+
+    def _get_image_embeds(self, images: List[Image.Image]) -> torch.Tensor:
+        """Runs the vision tower only and returns pooled (unnormalized) image embeddings, one row per image."""
+        pixel_values = self.pixel_values(images)
+        if self.vision_backend is not None:
+            image_embeds = self.vision_backend(pixel_values.numpy())
+            return torch.from_numpy(image_embeds).to(self.device)
+
+        with torch.no_grad():
+            return self.model.vision_model(pixel_values=pixel_values.to(self.device)).pooler_output
+
+    def logits(self, image_embeds: torch.Tensor, text_embeds: torch.Tensor) -> torch.Tensor:
+        """
+        Reproduces the SigLIP head: cosine similarity of pooled image embeddings and
+        normalized text embeddings, scaled by the learned logit scale and shifted by
+        the logit bias. Returns logits_per_image (images x labels).
+        """
+        image_embeds = image_embeds / image_embeds.norm(p=2, dim=-1, keepdim=True)
+        logits_per_image = torch.matmul(image_embeds, text_embeds.t())
+        return logits_per_image * self.model.logit_scale.exp() + self.model.logit_bias
+
+    def _score(self, image_embeds: torch.Tensor, text_embeds: torch.Tensor) -> torch.Tensor:
+        """SigLIP head logits softmaxed over the labels."""
+        return self.logits(image_embeds, text_embeds).softmax(dim=1)
+
+    @staticmethod
+    def _context(image: Union[bytes, ImageContext]) -> ImageContext:
+        return image if isinstance(image, ImageContext) else image_preprocess_service.create_context(image)
+
+    def prepare(self, image: Union[bytes, ImageContext]) -> Image.Image:
+        """
+        Decodes the upload and applies the crop/pad preprocessing for the vision tower.
+        An ImageContext reuses the decode and strategy already done for the request.
+        """
+        return self._context(image).prepared(MODEL_IMAGE_SIZE)
+
+    def image_cache_key(self, image: Union[bytes, ImageContext]) -> str:
+        """
+        Content-addressed key for the image embedding cache: digest of the raw
+        upload plus everything that changes the vision output (model, input size,
+        backend, quantization, the preprocessing pipeline version and the crop
+        strategy and bbox). An embedding of the "Detection failed" centre-crop
+        fallback therefore never answers for a later successful detection.
+        """
+        context = self._context(image)
+        strategy = context.strategy
+        crop = f"{strategy['strategy'].value}:{','.join(map(str, strategy.get('bbox') or []))}"
+        return (f"{self.model_name}|{MODEL_IMAGE_SIZE[0]}x{MODEL_IMAGE_SIZE[1]}|{self.backend}|{self.quantization}"
+                f"|{IMAGE_PREPROCESS_VERSION}|{crop}|{context.digest}")
+
+    def get_cached_image_embeds(self, image: Union[bytes, ImageContext]) -> Optional[torch.Tensor]:
+        """Returns the cached pooled embedding for these image bytes, or None."""
+        return self.image_embedding_cache.get(self.image_cache_key(image))
+
+    def score_image_embeds(self, image_embeds: torch.Tensor, texts_list: List[Optional[List[str]]]) -> list:
+        """
+        Scores pooled image embeddings (one row per image) against each image's label prompts.
+        Returns one result per image, in the same shape as get_embeddings.
+        """
+        outputs = []
+        for i, texts in enumerate(texts_list):
             if texts:
-                # 64-token limit check as per requirements
-                inputs = self.processor(
-                    text=texts,
-                    images=image,
-                    padding="max_length",
-                    max_length=64,
-                    truncation=True,
-                    return_tensors="pt"
-                ).to(self.device)
-
-                # Optional: Log warning if truncation occurred (check input_ids shape vs max_length)
-                # Note: with truncation=True, the shape will be (num_texts, 64)
-                # To detect if it *would* have exceeded, we could tokenize without truncation first,
-                # but that's expensive. Instead, we can just ensure we stay within the limit.
-                
+                # Label prompts are constant between requests, so only the
+                # vision tower runs per request; text embeddings come from the cache.
+                text_embeds = self.get_text_embeddings(texts)
                 with torch.no_grad():
-                    outputs = self.model(**inputs)
-                
-                # Retrieve logits
-                logits_per_image = outputs.logits_per_image
-                probs = logits_per_image.softmax(dim=1)
-                
+                    probs = self._score(image_embeds[i:i + 1], text_embeds)
+
                 # Format results
                 results = []
                 prob_values = probs[0].tolist()
-                for i, text in enumerate(texts):
-                    results.append({"label": text, "score": prob_values[i]})
-                
+                for j, text in enumerate(texts):
+                    results.append({"label": text, "score": prob_values[j]})
+
                 # Sort by score descending
                 results.sort(key=lambda x: x["score"], reverse=True)
-                return results
+                outputs.append(results)
             else:
                 # Just image embedding
                 # MedSigLIP is a CLIP-like model, so we can get features
-                inputs = self.processor(images=image, return_tensors="pt").to(self.device) # Only image
-                with torch.no_grad():
-                     image_features = self.model.get_image_features(**inputs)
-                
-                return {"embedding": image_features[0].tolist()}
+                outputs.append({"embedding": image_embeds[i].tolist()})
+        return outputs
+
+    def get_embeddings_batch(self, images: List[Image.Image], texts_list: List[Optional[List[str]]],
+                             cache_keys: Optional[List[str]] = None) -> list:
+        """
+        Runs a single batched vision forward over already prepared images and
+        scores each one against its own label prompts.
+        When cache_keys are given, the resulting embeddings are stored in the image embedding cache.
+        Returns one result per image, in the same shape as get_embeddings.
+        """
+        self._load_model()
+        try:
+            image_embeds = self._get_image_embeds(images)
+            if cache_keys:
+                for key, embeds in zip(cache_keys, image_embeds):
+                    self.image_embedding_cache.put(key, embeds.detach().clone())
+            return self.score_image_embeds(image_embeds, texts_list)
 
         except Exception as e:
             logger.error(f"MedSigLIP inference failed: {e}")
             raise e
 
+    def get_embeddings(self, image: Union[bytes, ImageContext], texts: Optional[List[str]] = None):
+        """
+        Run inference to get embeddings or probabilities for zero-shot classification.
+        If texts is provided, performs zero-shot classification via similarity.
+        Re-analysis of the same image (other labels, modality or threshold) is scored
+        against the cached vision embedding and skips preprocessing and the vision tower.
+        """
+        self._load_model()
+        context = self._context(image)
+        key = self.image_cache_key(context)
+        cached = self.image_embedding_cache.get(key)
+        if cached is not None:
+            logger.debug("Image embedding cache hit")
+            return self.score_image_embeds(cached.unsqueeze(0), [texts])[0]
+
+        try:
+            prepared = self.prepare(context)
+        except Exception as e:
+            logger.error(f"MedSigLIP inference failed: {e}")
+            raise e
+        return self.get_embeddings_batch([prepared], [texts], cache_keys=[key])[0]
+
 # Global instance
 medsiglip_service = MedSigLIPService()
@@ -0,0 +1,86 @@
+import json
+import logging
+import os
+import time
+from typing import Callable, Optional
+import numpy as np
+import torch
+from app.config import MODEL_IMAGE_SIZE
+from app.services.medsiglip_onnx_backend import _VisionTower
+
+logger = logging.getLogger(__name__)
+
+METADATA_FILE = "metadata.json"
+
+def trace_vision_tower(model, image_size: tuple = MODEL_IMAGE_SIZE) -> torch.jit.ScriptModule:
+    """Traces the SigLIP vision tower (pixel_values -> pooled embedding) and freezes it for inference."""
+    tower = _VisionTower(model.vision_model).eval().to("cpu")
+    dummy = torch.zeros(1, 3, image_size[1], image_size[0], dtype=torch.float32)
+    with torch.no_grad():
+        traced = torch.jit.trace(tower, (dummy,), check_trace=False)
+    return torch.jit.optimize_for_inference(torch.jit.freeze(traced.eval()))
+
+class TorchScriptVisionBackend:
+    """
+    Runs a traced and frozen MedSigLIP vision tower.
+    The artifact is saved to artifact_path together with metadata describing what
+    it was traced from; it is re-traced when the metadata no longer matches
+    (other model, quantization mode, image size or torch version).
+    Produces the same pooled (unnormalized) embeddings as model.vision_model(...).pooler_output.
+    """
+    def __init__(self, artifact_path: str, metadata: dict):
+        self.artifact_path = artifact_path
+        self.metadata = dict(metadata, torch_version=torch.__version__)
+        self.module: Optional[torch.jit.ScriptModule] = None
+
+    def _load_artifact(self) -> Optional[torch.jit.ScriptModule]:
+        if not os.path.exists(self.artifact_path):
+            return None
+        extra_files = {METADATA_FILE: ""}
+        try:
+            module = torch.jit.load(self.artifact_path, map_location="cpu", _extra_files=extra_files)
+        except Exception as e:
+            logger.warning(f"Could not load TorchScript vision tower {self.artifact_path}: {e}")
+            return None
+        if json.loads(extra_files[METADATA_FILE] or "{}") != self.metadata:
+            logger.info(f"TorchScript vision tower {self.artifact_path} is stale; re-tracing.")
+            return None
+        return module
+
+    def load(self, model) -> torch.jit.ScriptModule:
+        if self.module is None:
+            start_time = time.perf_counter()
+            module = self._load_artifact()
+            if module is not None:
+                logger.info(f"Loaded TorchScript vision tower from {self.artifact_path} in {(time.perf_counter() - start_time):.1f}s")
+            else:
+                module = trace_vision_tower(model, tuple(self.metadata["image_size"]))
+                os.makedirs(os.path.dirname(os.path.abspath(self.artifact_path)), exist_ok=True)
+                torch.jit.save(module, self.artifact_path, _extra_files={METADATA_FILE: json.dumps(self.metadata)})
+                logger.info(f"Traced MedSigLIP vision tower to {self.artifact_path} in {(time.perf_counter() - start_time):.1f}s")
+            self.module = module
+        return self.module
+
+    def __call__(self, pixel_values: np.ndarray) -> np.ndarray:
+        with torch.no_grad():
+            return self.module(torch.from_numpy(np.ascontiguousarray(pixel_values, dtype=np.float32))).numpy()
+
+def benchmark(eager: Callable[[np.ndarray], object], compiled: Callable[[np.ndarray], object],
+              pixel_values: np.ndarray, runs: int = 3) -> dict:
+    """Median latency (ms) of the eager and optimized vision tower on the same input."""
+    def median_ms(fn):
+        fn(pixel_values)  # first call may still specialise kernels
+        timings = []
+        for _ in range(runs):
+            start_time = time.perf_counter()
+            fn(pixel_values)
+            timings.append((time.perf_counter() - start_time) * 1000)
+        return sorted(timings)[len(timings) // 2]
+
+    eager_ms = median_ms(eager)
+    compiled_ms = median_ms(compiled)
+    return {
+        "eager_ms": round(eager_ms, 1),
+        "compiled_ms": round(compiled_ms, 1),
+        "speedup": round(eager_ms / compiled_ms, 2) if compiled_ms else None,
+    }
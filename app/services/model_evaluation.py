@@ -0,0 +1,69 @@
+import glob
+import logging
+import os
+from typing import Dict, List, Optional
+from app.services.medsiglip_modality_wrapper import ClinicalModalityWrapper
+from app.services.result_interpreter import result_interpreter
+from app.services.image_preprocess_service import image_preprocess_service
+
+logger = logging.getLogger(__name__)
+
+IMAGE_PATTERNS = ("*.jpg", "*.jpeg", "*.png")
+
+def load_image_folder(folder: str) -> Dict[str, bytes]:
+    """Reads all JPEG/PNG files in a folder, keyed by file name."""
+    paths = []
+    for pattern in IMAGE_PATTERNS:
+        paths.extend(glob.glob(os.path.join(folder, pattern)))
+
+    images = {}
+    for path in sorted(paths):
+        with open(path, "rb") as f:
+            images[os.path.basename(path)] = f.read()
+    return images
+
+def evaluate_against_reference(reference_service, candidate_service, images: Dict[str, bytes],
+                               modality: str = "macroscopic", custom_labels: Optional[List[str]] = None) -> dict:
+    """
+    Accuracy guardrail for alternative inference modes (quantized, ONNX, ...).
+    Runs both services through the clinical wrapper on every image and reports:
+    - top1_agreement: share of images with the same top-1 label
+    - max_prob_deviation: largest absolute per-label probability difference
+    - status_agreement: share of images with the same ResultInterpreter status
+    plus a per-image breakdown.
+    """
+    reference = ClinicalModalityWrapper(reference_service, modality=modality)
+    candidate = ClinicalModalityWrapper(candidate_service, modality=modality)
+
+    # Batched lesion detection for the whole folder; per-image analysis then hits the strategy cache
+    image_preprocess_service.recommend_prep_strategies(list(images.values()))
+
+    per_image = []
+    for name, image_bytes in images.items():
+        ref_results = reference.analyze_image(image_bytes, custom_labels=custom_labels)
+        cand_results = candidate.analyze_image(image_bytes, custom_labels=custom_labels)
+
+        ref_scores = {r["label"]: r["score"] for r in ref_results}
+        cand_scores = {r["label"]: r["score"] for r in cand_results}
+        deviation = max(abs(ref_scores[label] - cand_scores[label]) for label in ref_scores)
+
+        ref_status = result_interpreter.interpret(ref_results).get("status")
+        cand_status = result_interpreter.interpret(cand_results).get("status")
+
+        per_image.append({
+            "image": name,
+            "reference_top1": ref_results[0]["label"],
+            "candidate_top1": cand_results[0]["label"],
+            "max_prob_deviation": deviation,
+            "reference_status": ref_status,
+            "candidate_status": cand_status,
+        })
+
+    count = len(per_image)
+    return {
+        "images": count,
+        "top1_agreement": sum(p["reference_top1"] == p["candidate_top1"] for p in per_image) / count if count else 1.0,
+        "max_prob_deviation": max((p["max_prob_deviation"] for p in per_image), default=0.0),
+        "status_agreement": sum(p["reference_status"] == p["candidate_status"] for p in per_image) / count if count else 1.0,
+        "per_image": per_image,
+    }
@@ -0,0 +1,119 @@
+import logging
+import threading
+import time
+from typing import Dict, Optional
+from PIL import Image
+from app.config import MODEL_IMAGE_SIZE
+from app.services.medsiglip_service import medsiglip_service
+from app.services.medsiglip_modality_wrapper import ClinicalModalityWrapper
+from app.services.yolo_service import yolo_service
+
+logger = logging.getLogger(__name__)
+
+# Component states reported by /api/ready
+PENDING = "pending"
+LOADING = "loading"
+READY = "ready"
+UNAVAILABLE = "unavailable"  # Optional component not installed or failed to load; the app works without it
+FAILED = "failed"
+
+class ModelWarmupService:
+    """
+    Loads YOLO and MedSigLIP in a background thread at startup and runs a
+    warm-up inference on each, so allocations and kernel selection happen
+    before the first user request. Tracks per-component progress and timings
+    for the readiness endpoint.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.started_at: Optional[float] = None
+        self.components: Dict[str, dict] = {
+            "yolo": {"status": PENDING},
+            "medsiglip": {"status": PENDING},
+        }
+
+    def _update(self, name: str, **fields):
+        with self._lock:
+            self.components[name].update(fields)
+
+    def start(self):
+        """Starts warm-up in a daemon thread; calling it again is a no-op."""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self.started_at = time.time()
+            self._thread = threading.Thread(target=self.run, name="model-warmup", daemon=True)
+        self._thread.start()
+
+    def run(self):
+        self._warm_yolo()
+        self._warm_medsiglip()
+        logger.info(f"Model warm-up finished: {self.status()}")
+
+    def _warm_yolo(self):
+        if not yolo_service.is_available():
+            self._update("yolo", status=UNAVAILABLE)
+            return
+        self._update("yolo", status=LOADING)
+        try:
+            start_time = time.perf_counter()
+            model = yolo_service.load_model()
+            load_time = time.perf_counter() - start_time
+            if model is None:
+                self._update("yolo", status=UNAVAILABLE, load_time=round(load_time, 3))
+                return
+
+            start_time = time.perf_counter()
+            # Goes through the configured backend (ultralytics or ONNX)
+            yolo_service.detect(Image.new("RGB", (640, 640)))
+            self._update("yolo", status=READY, load_time=round(load_time, 3),
+                         warmup_time=round(time.perf_counter() - start_time, 3))
+        except Exception as e:
+            # YOLO is optional (analysis falls back to the centre crop), so a failed
+            # load must not keep the instance out of rotation
+            logger.error(f"YOLO warm-up failed: {e}")
+            self._update("yolo", status=UNAVAILABLE, error=str(e))
+
+    def _warm_medsiglip(self):
+        self._update("medsiglip", status=LOADING)
+        try:
+            start_time = time.perf_counter()
+            medsiglip_service._load_model()
+            load_time = time.perf_counter() - start_time
+
+            # Precompute label embeddings for the default label set of every modality
+            # and push one blank image through the vision tower.
+            start_time = time.perf_counter()
+            for modality in ("macroscopic", "dermoscopy"):
+                _, prompts = ClinicalModalityWrapper(medsiglip_service, modality=modality).build_prompts()
+                medsiglip_service.get_text_embeddings(prompts, pin=True)
+            medsiglip_service._get_image_embeds([Image.new("RGB", MODEL_IMAGE_SIZE)])
+            warmup_time = time.perf_counter() - start_time
+
+            # Eager vs optimized vision tower latency (ONNX / TorchScript), logged once per start
+            benchmark = medsiglip_service.benchmark_vision_backend()
+
+            if medsiglip_service.load_mode == "vision_only":
+                # Persist the default label embeddings so later starts skip the text tower entirely
+                medsiglip_service.save_text_embeddings()
+                medsiglip_service.unload_text_tower()
+
+            self._update("medsiglip", status=READY, load_time=round(load_time, 3),
+                         warmup_time=round(warmup_time, 3))
+            if benchmark is not None:
+                self._update("medsiglip", benchmark=benchmark)
+        except Exception as e:
+            logger.error(f"MedSigLIP warm-up failed: {e}")
+            self._update("medsiglip", status=FAILED, error=str(e))
+
+    def status(self) -> dict:
+        with self._lock:
+            return {
+                "ready": all(c["status"] in (READY, UNAVAILABLE) for c in self.components.values()),
+                "uptime": round(time.time() - self.started_at, 1) if self.started_at else None,
+                "components": {name: dict(c) for name, c in self.components.items()},
+            }
+
+# Global instance
+model_warmup_service = ModelWarmupService()
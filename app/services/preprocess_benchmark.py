@@ -0,0 +1,172 @@
+import base64
+import contextlib
+import io
+import platform
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+import numpy as np
+import PIL
+from PIL import Image
+from app.config import IMAGE_PREPROCESS_VERSION, MODEL_IMAGE_SIZE
+from app.services.image_preprocess_service import ImagePreprocessService, open_scaled
+from app.services.lesion_detector import Box, LesionDetector
+from app.services.yolo_service import yolo_service
+
+# Synthetic uploads: (name, width, height, format). Covers already-square inputs,
+# small images that are padded, typical phone photos in both orientations and a
+# panorama-like aspect ratio.
+DEFAULT_CASES: List[Tuple[str, int, int, str]] = [
+    ("square-448", 448, 448, "JPEG"),
+    ("small-400x300", 400, 300, "JPEG"),
+    ("landscape-1600x1200", 1600, 1200, "JPEG"),
+    ("portrait-3024x4032", 3024, 4032, "JPEG"),
+    ("landscape-4032x3024", 4032, 3024, "JPEG"),
+    ("wide-4000x1800", 4000, 1800, "JPEG"),
+    ("png-1200x900", 1200, 900, "PNG"),
+]
+
+class StubDetector(LesionDetector):
+    """
+    Deterministic detector for benchmarks: one box covering `box_fraction` of each
+    side, centred at (cx, cy) in relative coordinates. Off-centre boxes make
+    landscape images take the pad path, centred ones the crop path.
+    """
+    def __init__(self, cx: float = 0.5, cy: float = 0.5, box_fraction: float = 0.3):
+        self.cx = cx
+        self.cy = cy
+        self.box_fraction = box_fraction
+
+    def detect_batch(self, images: List[Image.Image], conf: float = 0.25) -> List[List[Box]]:
+        outputs = []
+        for image in images:
+            width, height = image.size
+            half_w, half_h = width * self.box_fraction / 2, height * self.box_fraction / 2
+            x, y = width * self.cx, height * self.cy
+            outputs.append([(max(0.0, x - half_w), max(0.0, y - half_h),
+                             min(float(width), x + half_w), min(float(height), y + half_h), 0.9)])
+        return outputs
+
+@contextlib.contextmanager
+def stub_detector(detector: Optional[LesionDetector] = None):
+    """Temporarily serves yolo_service detections from a stub instead of model weights."""
+    previous = yolo_service.model
+    yolo_service.model = detector or StubDetector()
+    try:
+        yield yolo_service.model
+    finally:
+        yolo_service.model = previous
+
+def synthetic_image(width: int, height: int, image_format: str = "JPEG", seed: int = 0) -> bytes:
+    """
+    Encodes a deterministic skin-toned image with a darker blob and sensor-like noise,
+    so compression and resampling cost resemble a real photo rather than a flat fill.
+    """
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    blob = np.exp(-(((x - width * 0.55) / (width * 0.12)) ** 2 + ((y - height * 0.5) / (height * 0.12)) ** 2))
+    base = np.array([205, 160, 135], dtype=np.float32) - blob[..., None] * np.array([110, 90, 80], dtype=np.float32)
+    pixels = np.clip(base + rng.normal(0, 6, (height, width, 3)), 0, 255).astype(np.uint8)
+
+    buf = io.BytesIO()
+    Image.fromarray(pixels).save(buf, format=image_format, **({"quality": 90} if image_format == "JPEG" else {}))
+    return buf.getvalue()
+
+def _time(fn: Callable[[], object], runs: int) -> Dict[str, float]:
+    timings = []
+    for _ in range(runs):
+        start_time = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start_time) * 1000)
+    timings.sort()
+    return {"median_ms": round(timings[len(timings) // 2], 3), "min_ms": round(timings[0], 3)}
+
+def benchmark_image(image_bytes: bytes, runs: int = 5, target_size: tuple = MODEL_IMAGE_SIZE) -> dict:
+    """
+    Times each preprocessing stage for one upload. Every stage runs on the output
+    of the previous one, computed once up front, so stages are measured in isolation.
+    Needs yolo_service to be served by a (stub) detector.
+    Returns the chosen strategy and per-stage timings.
+    """
+    service = ImagePreprocessService()
+
+    def decode():
+        image, full_size = open_scaled(image_bytes)
+        return image.convert("RGB"), full_size
+
+    image, _ = decode()
+    strategy = service.strategy_for_image(image)["strategy"]
+    width, height = image.size
+    square_side = min(width, height) if strategy != "pad" else max(width, height)
+    square = service.apply_strategy(image, strategy, (square_side, square_side))
+    prepared = square.resize(target_size, Image.Resampling.LANCZOS)
+    buf = io.BytesIO()
+    prepared.save(buf, format="JPEG")
+    jpeg = buf.getvalue()
+
+    def end_to_end():
+        service.strategy_cache.clear()
+        service.create_context(image_bytes).preview_base64(target_size)
+
+    stages = {
+        "decode": _time(decode, runs),
+        "strategy": _time(lambda: service.strategy_for_image(image), runs),
+        "crop_pad": _time(lambda: service.apply_strategy(image, strategy, (square_side, square_side)), runs),
+        "resize": _time(lambda: square.resize(target_size, Image.Resampling.LANCZOS), runs),
+        "jpeg_encode": _time(lambda: prepared.save(io.BytesIO(), format="JPEG"), runs),
+        "base64_encode": _time(lambda: base64.b64encode(jpeg), runs),
+        "end_to_end": _time(end_to_end, runs),
+    }
+    return {"strategy": strategy.value, "stages": stages}
+
+def run_benchmark(cases: List[Tuple[str, int, int, str]] = DEFAULT_CASES, runs: int = 5,
+                  detector: Optional[LesionDetector] = None) -> dict:
+    """Benchmarks all stages over the synthetic cases; returns a JSON-serializable report."""
+    results = {}
+    with stub_detector(detector) as active:
+        for name, width, height, image_format in cases:
+            image_bytes = synthetic_image(width, height, image_format)
+            results[name] = {
+                "size": [width, height],
+                "format": image_format,
+                "bytes": len(image_bytes),
+                **benchmark_image(image_bytes, runs),
+            }
+
+    return {
+        "preprocess_version": IMAGE_PREPROCESS_VERSION,
+        "runs": runs,
+        "detector": {"type": type(active).__name__, **vars(active)},
+        "environment": {
+            "python": platform.python_version(),
+            "pillow": PIL.__version__,
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+        },
+        "cases": results,
+    }
+
+def compare(baseline: dict, current: dict, max_ratio: float = 1.25, min_delta_ms: float = 1.0) -> List[dict]:
+    """
+    Lists stages whose median time grew by more than max_ratio against the baseline
+    report. Differences under min_delta_ms are ignored as timer noise; cases that
+    took another crop/pad path than in the baseline are not comparable and skipped.
+    """
+    regressions = []
+    for name, case in current["cases"].items():
+        base_case = baseline.get("cases", {}).get(name)
+        if base_case is None or base_case.get("strategy") != case.get("strategy"):
+            continue
+        for stage, timing in case["stages"].items():
+            base = base_case["stages"].get(stage)
+            if base is None:
+                continue
+            before, after = base["median_ms"], timing["median_ms"]
+            if after - before > min_delta_ms and after > before * max_ratio:
+                regressions.append({
+                    "case": name,
+                    "stage": stage,
+                    "baseline_ms": before,
+                    "current_ms": after,
+                    "ratio": round(after / before, 2) if before else None,
+                })
+    return regressions
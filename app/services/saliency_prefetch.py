@@ -0,0 +1,55 @@
+import time
+from concurrent.futures import Future
+from typing import Callable, List, Optional
+from app.services.gradcam_service import gradcam_service, GRADCAM
+from app.services.inference_executor import inference_executor, IdleTaskRunner
+from app.config import (
+    SALIENCY_PREFETCH, SALIENCY_PREFETCH_IDLE_POLL_SECONDS, SALIENCY_PREFETCH_MAX_JOBS, SALIENCY_PREFETCH_TTL_SECONDS,
+)
+
+class SaliencyPrefetcher:
+    """
+    Precomputes Grad-CAM maps right after an analysis, so the heatmap panel's
+    /saliency request is served from the saliency cache. Jobs run on their own
+    IdleTaskRunner (only while the inference executor is idle, never in one of
+    its slots) and are keyed by (session_id, photo_id): re-analysing a photo
+    replaces its queued job, and deleting the photo or clearing the session
+    cancels it. Beyond max_jobs the oldest jobs are dropped and jobs still
+    waiting after ttl_seconds expire, so a busy server never accumulates
+    uploads or works for users who have long left.
+    """
+    def __init__(self, service=gradcam_service, executor=inference_executor,
+                 idle_poll_seconds: float = SALIENCY_PREFETCH_IDLE_POLL_SECONDS, enabled: bool = SALIENCY_PREFETCH,
+                 max_jobs: int = SALIENCY_PREFETCH_MAX_JOBS, ttl_seconds: float = SALIENCY_PREFETCH_TTL_SECONDS,
+                 clock: Callable[[], float] = time.monotonic):
+        self.service = service
+        self.enabled = enabled
+        self.runner = IdleTaskRunner(executor, max_queue=max_jobs, poll_seconds=idle_poll_seconds,
+                                     ttl_seconds=ttl_seconds, clock=clock, name="saliency-prefetch")
+
+    def schedule(self, session_id: str, photo_id: str, image_content: bytes, labels: List[str]) -> Optional[Future]:
+        """
+        Queues saliency maps for the labels of one photo.
+        Returns a Future resolved once the maps are cached (or the job is cancelled).
+        """
+        if not self.enabled or not labels:
+            return None
+        return self.runner.schedule((session_id, photo_id), self.service.get_maps, image_content, list(labels), GRADCAM)
+
+    def claim(self, session_id: str, photo_id: str) -> Optional[Future]:
+        """
+        Called when the photo's saliency is requested in the foreground.
+        A queued job is dropped (the request computes the maps itself); a running
+        one is returned so the caller can wait for it instead of duplicating it.
+        """
+        return self.runner.claim((session_id, photo_id))
+
+    def cancel_photo(self, session_id: str, photo_id: str):
+        self.runner.cancel((session_id, photo_id))
+
+    def cancel_session(self, session_id: str) -> int:
+        """Drops every queued job of a session; returns how many were cancelled."""
+        return self.runner.cancel_where(lambda key: key[0] == session_id)
+
+# Global instance
+saliency_prefetcher = SaliencyPrefetcher()
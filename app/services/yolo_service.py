@@ -1,22 +1,115 @@
 import logging
 import os
+import threading
+from typing import List, Optional
+import numpy as np
+from PIL import Image
+from app.config import YOLO_BACKEND, YOLO_INPUT_SIZE, YOLO_MAX_BATCH_SIZE, YOLO_ONNX_PATH
+from app.services.lesion_detector import Box, LesionDetector, OnnxYoloDetector, UltralyticsDetector
 
 logger = logging.getLogger(__name__)
 
+def detector_proxy(image: Image.Image, size: int = YOLO_INPUT_SIZE) -> Image.Image:
+    """
+    Downscales the image so its long side matches the detector input size, using
+    area interpolation. Ultralytics would resize to this size anyway; doing it
+    up front avoids converting and copying the full-resolution image.
+    Images already within the size are returned as is.
+    """
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    width, height = image.size
+    scale = size / max(width, height)
+    if scale >= 1:
+        return image
+
+    import cv2
+    proxy_size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    return Image.fromarray(cv2.resize(np.asarray(image), proxy_size, interpolation=cv2.INTER_AREA))
+
 class YOLOService:
-    def __init__(self):
+    def __init__(self, backend: str = YOLO_BACKEND, onnx_path: str = YOLO_ONNX_PATH):
+        self.backend = backend
+        self.onnx_path = onnx_path
         self.model = None
+        self._load_lock = threading.Lock()
+
+    def _use_onnx(self) -> bool:
+        return self.backend == "onnx" and os.path.exists(self.onnx_path)
+
+    def is_available(self) -> bool:
+        """Cheap check whether YOLO can be used, without loading the weights."""
+        if self.model is not None:
+            return True
+        import importlib.util
+        if self._use_onnx() and importlib.util.find_spec("onnxruntime") is not None:
+            return True
+        return importlib.util.find_spec("ultralytics") is not None
 
     def load_model(self):
+        """
+        Loads the detector for the configured backend: an OnnxYoloDetector for
+        "onnx", otherwise the ultralytics YOLO model. Returns None when neither
+        can be loaded.
+        """
         if self.model is None:
-            try:
-                from ultralytics import YOLO
-                # Use YOLOv8-Nano
-                logger.info("Loading YOLOv8-Nano model...")
-                self.model = YOLO('yolov8n.pt')
-            except ImportError:
-                logger.warning("ultralytics not installed. YOLO detection will be skipped.")
-                return None
+            with self._load_lock:
+                if self.model is None:
+                    if self.backend == "onnx":
+                        if self._use_onnx():
+                            detector = OnnxYoloDetector(self.onnx_path)
+                            detector.load()
+                            self.model = detector
+                            return self.model
+                        logger.warning(f"YOLO ONNX model {self.onnx_path} not found; falling back to ultralytics. "
+                                       "Run bin/export_yolo_onnx.py to create it.")
+                    try:
+                        from ultralytics import YOLO
+                        # Use YOLOv8-Nano
+                        logger.info("Loading YOLOv8-Nano model...")
+                        self.model = YOLO('yolov8n.pt')
+                    except ImportError:
+                        logger.warning("ultralytics not installed. YOLO detection will be skipped.")
+                        return None
         return self.model
 
+    def get_detector(self) -> Optional[LesionDetector]:
+        """The loaded model behind the LesionDetector interface, or None when YOLO is not available."""
+        model = self.load_model()
+        if model is None or isinstance(model, LesionDetector):
+            return model
+        return UltralyticsDetector(model)
+
+    def detect(self, image: Image.Image, conf: float = 0.25) -> Optional[List[Box]]:
+        """
+        Runs lesion detection on a proxy of the image at the detector input size.
+        Returns (x1, y1, x2, y2, confidence) boxes in the coordinates of `image`,
+        highest confidence first, or None when YOLO is not available.
+        """
+        results = self.detect_batch([image], conf=conf)
+        return None if results is None else results[0]
+
+    def detect_batch(self, images: List[Image.Image], conf: float = 0.25,
+                     batch_size: int = YOLO_MAX_BATCH_SIZE) -> Optional[List[List[Box]]]:
+        """
+        Batched detect(): proxies of up to batch_size images are letterboxed into
+        one input tensor and run in a single forward pass.
+        Returns one box list per image, or None when YOLO is not available.
+        """
+        detector = self.get_detector()
+        if detector is None:
+            return None
+
+        outputs = []
+        for start in range(0, len(images), batch_size):
+            chunk = images[start:start + batch_size]
+            proxies = [detector_proxy(image) for image in chunk]
+            results = detector.detect_batch(proxies, conf=conf)
+
+            for image, proxy, boxes in zip(chunk, proxies, results):
+                sx = image.size[0] / proxy.size[0]
+                sy = image.size[1] / proxy.size[1]
+                outputs.append([(x1 * sx, y1 * sy, x2 * sx, y2 * sy, score) for x1, y1, x2, y2, score in boxes])
+        return outputs
+
 yolo_service = YOLOService()
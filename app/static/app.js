@@ -26,7 +26,7 @@ function dermatologApp() {
         modelName: 'Loading...',
         yoloAvailable: false,
         marginThreshold: 0.05,
-        currentAnalysisId: null,
+        currentAnalysisIds: [],
         clearPromise: null,
         debugMode: false,
 
@@ -290,7 +290,7 @@ function dermatologApp() {
             this.loading = false;
             this.response = null;
             this.latency = null;
-            this.currentAnalysisId = null;
+            this.currentAnalysisIds = [];
             this.editingPhoto = null;
             this.editingDate = '';
 
@@ -368,56 +368,75 @@ function dermatologApp() {
             let startTime = performance.now();
 
             try {
-                for (const photo of photosToAnalyze) {
-                    console.log(`Starting analysis for ${photo.filename} (${photo.id})`);
-                    report += `Analyzing ${photo.filename} (Local Transfer)...\n`;
+                // Photos are sent in small batches so lesion detection runs batched on the server
+                const batchSize = 4;
+                for (let i = 0; i < photosToAnalyze.length; i += batchSize) {
+                    const batch = photosToAnalyze.slice(i, i + batchSize);
+                    console.log(`Starting analysis for ${batch.map(p => p.filename).join(', ')}`);
+                    report += `Analyzing ${batch.map(p => p.filename).join(', ')} (Local Transfer)...\n`;
                     this.response = report;
-                    this.currentAnalysisId = photo.id;
+                    this.currentAnalysisIds = batch.map(p => p.id);
 
                     try {
-                        const res = await fetch(`/api/photos/${photo.id}/analyze`, {
-                            method: 'POST',
-                            headers: { 'Content-Type': 'application/json' },
-                            body: JSON.stringify({
-                                model: 'medsiglip',
-                                margin_threshold: parseFloat(this.marginThreshold),
-                                base64_image: photo.local_content
+                        const common = {
+                            model: 'medsiglip',
+                            margin_threshold: parseFloat(this.marginThreshold)
+                        };
+                        // A single photo uses the per-photo endpoint
+                        const res = batch.length === 1
+                            ? await fetch(`/api/photos/${batch[0].id}/analyze`, {
+                                method: 'POST',
+                                headers: { 'Content-Type': 'application/json' },
+                                body: JSON.stringify({ ...common, base64_image: batch[0].local_content })
                             })
-                        });
+                            : await fetch('/api/photos/analyze-batch', {
+                                method: 'POST',
+                                headers: { 'Content-Type': 'application/json' },
+                                body: JSON.stringify({
+                                    ...common,
+                                    items: batch.map(p => ({ photo_id: p.id, base64_image: p.local_content }))
+                                })
+                            });
 
                         if (res.ok) {
-                            const data = await res.json();
-                            if (data.predictions && data.predictions.length > 0) {
-                                // Populate results for UI
-                                this.analysisResults[photo.id] = {
-                                    id: photo.id,
-                                    date: new Date().toISOString(),
-                                    prediction: data.predictions[0],
-                                    predictions: data.predictions, // For legacy if any
-                                    primary: data.predictions,
-                                    initial_classification: data.initial_classification,
-                                    primary_name: data.primary_model_name,
-                                    interpretation: data.interpretation,
-                                    preprocess_strategy: data.preprocess_strategy,
-                                    prepared_image_base64: data.prepared_image_base64,
-                                    execution_times: data.execution_times,
-                                    saliency_base64: data.saliency_base64
-                                };
-                                report += `  ➔ Primary Results (${data.primary_model_name}):\n`;
-                                data.predictions.forEach(p => {
-                                    report += `     - ${p.label}: ${(p.score * 100).toFixed(1)}%\n`;
-                                });
-                            }
+                            const body = await res.json();
+                            const results = batch.length === 1 ? [body] : body;
+                            results.forEach((data, index) => {
+                                const photo = batch[index];
+                                if (data.error) {
+                                    report += `  ➔ ${photo.filename} Failed: ${data.error}\n`;
+                                } else if (data.predictions && data.predictions.length > 0) {
+                                    // Populate results for UI
+                                    this.analysisResults[photo.id] = {
+                                        id: photo.id,
+                                        date: new Date().toISOString(),
+                                        prediction: data.predictions[0],
+                                        predictions: data.predictions, // For legacy if any
+                                        primary: data.predictions,
+                                        initial_classification: data.initial_classification,
+                                        primary_name: data.primary_model_name,
+                                        interpretation: data.interpretation,
+                                        preprocess_strategy: data.preprocess_strategy,
+                                        prepared_image_base64: data.prepared_image_base64,
+                                        execution_times: data.execution_times,
+                                        saliency_base64: data.saliency_base64
+                                    };
+                                    report += `  ➔ ${photo.filename} Primary Results (${data.primary_model_name}):\n`;
+                                    data.predictions.forEach(p => {
+                                        report += `     - ${p.label}: ${(p.score * 100).toFixed(1)}%\n`;
+                                    });
+                                }
+                            });
                         } else {
                             const err = await res.text();
                             report += `  ➔ Request Failed: ${res.status} ${err}\n`;
                         }
                     } catch (e) {
-                        console.error(`Analysis error for ${photo.id}:`, e);
+                        console.error(`Analysis error for batch starting at ${batch[0].id}:`, e);
                         report += `  ➔ Error: ${e.message}\n`;
                     }
 
-                    this.currentAnalysisId = null;
+                    this.currentAnalysisIds = [];
                     report += "\n";
                     this.response = report;
                 }
@@ -449,8 +468,9 @@ function dermatologApp() {
                 return;
             }
 
-            const topLabel = this.analysisResults[photo.id].primary[0].label;
-            console.log("Fetching saliency for label:", topLabel);
+            // Top differentials side by side; the server computes them from one forward pass
+            const labels = this.analysisResults[photo.id].primary.slice(0, 3).map(p => p.label);
+            console.log("Fetching saliency for labels:", labels);
 
             try {
                 const res = await fetch(`/api/photos/${photo.id}/saliency`, {
@@ -458,14 +478,22 @@ function dermatologApp() {
                     headers: { 'Content-Type': 'application/json' },
                     body: JSON.stringify({
                         base64_image: photo.local_content,
-                        target_label: topLabel
+                        target_labels: labels,
+                        // Only the low-resolution maps; the overlay is drawn here over the photo we already hold
+                        format: 'grid'
                     })
                 });
 
                 if (res.ok) {
                     const data = await res.json();
-                    console.log("Saliency data received for", photo.id, "len:", data.saliency_base64 ? data.saliency_base64.length : 0);
-                    this.analysisResults[photo.id].saliency_base64 = data.saliency_base64;
+                    const maps = data.saliency_maps || [];
+                    console.log("Saliency grids received for", photo.id, "count:", maps.length);
+                    for (const map of maps) {
+                        map.saliency_base64 = await this.renderSaliencyOverlay(photo.local_content, map.cam_png_base64);
+                    }
+                    this.analysisResults[photo.id].saliency_maps = maps;
+                    this.analysisResults[photo.id].saliency_label = labels[0];
+                    this.analysisResults[photo.id].saliency_base64 = maps.length ? maps[0].saliency_base64 : null;
                     console.log("Updated analysisResults with saliency for", photo.id);
                 } else {
                     console.error("Saliency fetch failed with status:", res.status);
@@ -475,6 +503,59 @@ function dermatologApp() {
             }
         },
 
+        loadImage(src) {
+            return new Promise((resolve, reject) => {
+                const img = new Image();
+                img.onload = () => resolve(img);
+                img.onerror = reject;
+                img.src = src;
+            });
+        },
+
+        /**
+         * Draws a saliency map over the photo: the grayscale CAM grid is upscaled
+         * with bilinear smoothing, colored with a JET colormap (high = red) and
+         * blended 40% over the image. Returns a JPEG data URL.
+         */
+        async renderSaliencyOverlay(imageSrc, camPngBase64, maxSide = 1024) {
+            const [photo, cam] = await Promise.all([
+                this.loadImage(imageSrc),
+                this.loadImage('data:image/png;base64,' + camPngBase64)
+            ]);
+            const scale = Math.min(1, maxSide / Math.max(photo.naturalWidth, photo.naturalHeight));
+            const width = Math.round(photo.naturalWidth * scale);
+            const height = Math.round(photo.naturalHeight * scale);
+
+            const canvas = document.createElement('canvas');
+            canvas.width = width;
+            canvas.height = height;
+            const ctx = canvas.getContext('2d');
+            ctx.imageSmoothingEnabled = true;
+            ctx.drawImage(cam, 0, 0, width, height);
+            const heat = ctx.getImageData(0, 0, width, height).data;
+            ctx.drawImage(photo, 0, 0, width, height);
+            const frame = ctx.getImageData(0, 0, width, height);
+            const px = frame.data;
+
+            const clamp = v => Math.min(1, Math.max(0, v));
+            for (let i = 0; i < px.length; i += 4) {
+                const v = heat[i] / 255;
+                px[i] = 0.6 * px[i] + 0.4 * 255 * clamp(1.5 - Math.abs(4 * v - 3));
+                px[i + 1] = 0.6 * px[i + 1] + 0.4 * 255 * clamp(1.5 - Math.abs(4 * v - 2));
+                px[i + 2] = 0.6 * px[i + 2] + 0.4 * 255 * clamp(1.5 - Math.abs(4 * v - 1));
+            }
+            ctx.putImageData(frame, 0, 0);
+            return canvas.toDataURL('image/jpeg', 0.9);
+        },
+
+        selectSaliency(photo, index) {
+            const result = this.analysisResults[photo.id];
+            const map = result && result.saliency_maps && result.saliency_maps[index];
+            if (!map) return;
+            result.saliency_label = map.label;
+            result.saliency_base64 = map.saliency_base64;
+        },
+
         getAllPhotos() {
             let photos = [];
             this.timeline.forEach(item => {
@@ -0,0 +1,42 @@
+import argparse
+import json
+import os
+import sys
+
+# Allow running as `python bin/benchmark_preprocess.py` from the project root
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.services.preprocess_benchmark import StubDetector, compare, run_benchmark
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the image preprocessing stages on synthetic images (no model weights needed).")
+    parser.add_argument("--runs", type=int, default=5, help="Timed runs per stage")
+    parser.add_argument("--output", help="Write the JSON report to this file instead of stdout")
+    parser.add_argument("--compare", help="Baseline JSON report to check for regressions")
+    parser.add_argument("--max-ratio", type=float, default=1.25, help="Allowed median slowdown against the baseline")
+    parser.add_argument("--off-center", action="store_true", help="Place the stub lesion off-centre so landscape images are padded")
+    args = parser.parse_args()
+
+    detector = StubDetector(cx=0.85) if args.off_center else StubDetector()
+    report = run_benchmark(runs=args.runs, detector=detector)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+        print(f"Wrote {args.output}")
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, report, max_ratio=args.max_ratio)
+        for r in regressions:
+            print(f"REGRESSION {r['case']} / {r['stage']}: {r['baseline_ms']} ms -> {r['current_ms']} ms (x{r['ratio']})", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions against {args.compare}.", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
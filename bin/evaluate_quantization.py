@@ -0,0 +1,61 @@
+import argparse
+import copy
+import json
+import os
+import sys
+from dotenv import load_dotenv
+
+# Allow running as `python bin/evaluate_quantization.py` from the project root
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+# Load environment variables
+load_dotenv()
+
+from app.config import MEDSIGLIP_MODEL_NAME
+from app.services.medsiglip_service import MedSigLIPService
+from app.services.model_evaluation import load_image_folder, evaluate_against_reference
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare a quantized MedSigLIP against the fp32 model on a local image folder.")
+    parser.add_argument("--model-name", default=MEDSIGLIP_MODEL_NAME)
+    parser.add_argument("--mode", default="int8", help="Quantization mode to evaluate")
+    parser.add_argument("--images", default="tests/data", help="Folder with evaluation images")
+    parser.add_argument("--modality", default="macroscopic", choices=["macroscopic", "dermoscopy"])
+    parser.add_argument("--min-agreement", type=float, default=1.0, help="Required top-1 and status agreement rate")
+    parser.add_argument("--json", action="store_true", help="Print the full report as JSON")
+    args = parser.parse_args()
+
+    images = load_image_folder(args.images)
+    if not images:
+        print(f"No images found in {args.images}.")
+        sys.exit(1)
+
+    reference = MedSigLIPService(model_name=args.model_name, backend="torch", quantization="none")
+    reference._load_model()
+
+    # Quantize a copy so both variants are evaluated side by side in one process
+    candidate = MedSigLIPService(model_name=args.model_name, backend="torch", quantization=args.mode)
+    candidate.device = reference.device
+    candidate.processor = reference.processor
+    candidate.model = copy.deepcopy(reference.model)
+    candidate._apply_quantization()
+
+    report = evaluate_against_reference(reference, candidate, images, modality=args.modality)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        for row in report["per_image"]:
+            print(f"  {row['image']}: {row['reference_top1']} -> {row['candidate_top1']}, "
+                  f"max |dp| {row['max_prob_deviation']:.4f}, status {row['reference_status']} -> {row['candidate_status']}")
+        print(f"Images: {report['images']}")
+        print(f"Top-1 agreement: {report['top1_agreement']:.1%}")
+        print(f"Status agreement: {report['status_agreement']:.1%}")
+        print(f"Max probability deviation: {report['max_prob_deviation']:.4f}")
+
+    if report["top1_agreement"] < args.min_agreement or report["status_agreement"] < args.min_agreement:
+        print("Quantized model does NOT meet the agreement threshold.")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+import argparse
+import os
+import sys
+from dotenv import load_dotenv
+
+# Allow running as `python bin/export_onnx.py` from the project root
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+# Load environment variables
+load_dotenv()
+
+from app.config import MEDSIGLIP_MODEL_NAME, MEDSIGLIP_ONNX_PATH
+from app.dermatology_data import MEDSIGLIP_DERMATOLOGY_NARROW_LABELS
+from app.services.medsiglip_modality_wrapper import ClinicalModalityWrapper
+from app.services.medsiglip_service import MedSigLIPService
+from app.services.medsiglip_onnx_backend import export_vision_onnx, check_parity
+from app.services.model_evaluation import load_image_folder
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the MedSigLIP vision tower to ONNX and verify parity with PyTorch.")
+    parser.add_argument("--model-name", default=MEDSIGLIP_MODEL_NAME)
+    parser.add_argument("--output", default=MEDSIGLIP_ONNX_PATH)
+    parser.add_argument("--images", default="tests/data", help="Folder with images for the parity check")
+    parser.add_argument("--tolerance", type=float, default=1e-3, help="Max allowed absolute probability difference")
+    parser.add_argument("--skip-export", action="store_true", help="Only run the parity check on an existing export")
+    args = parser.parse_args()
+
+    torch_service = MedSigLIPService(model_name=args.model_name, backend="torch", quantization="none")
+    torch_service._load_model()
+
+    if not args.skip_export:
+        export_vision_onnx(torch_service.model, args.output)
+
+    images = list(load_image_folder(args.images).values())
+    if not images:
+        print(f"No images found in {args.images}; skipping parity check.")
+        return
+
+    # Share the already loaded PyTorch model; only the vision tower differs
+    onnx_service = MedSigLIPService(model_name=args.model_name, backend="onnx", onnx_path=args.output)
+    onnx_service.model = torch_service.model
+    onnx_service.processor = torch_service.processor
+    onnx_service.device = torch_service.device
+    onnx_service._load_vision_backend()
+
+    template = ClinicalModalityWrapper(torch_service)._get_template()
+    texts = [template.format(desc) for desc in MEDSIGLIP_DERMATOLOGY_NARROW_LABELS.values()]
+    report = check_parity(torch_service, onnx_service, images, texts)
+    print(f"Parity over {report['images']} images: max |dp| = {report['max_abs_prob_diff']:.2e}, top-1 agreement = {report['top1_agreement']:.1%}")
+
+    if report["max_abs_prob_diff"] > args.tolerance or report["top1_agreement"] < 1.0:
+        print("Parity check FAILED.")
+        sys.exit(1)
+    print("Parity check passed.")
+
+if __name__ == "__main__":
+    main()
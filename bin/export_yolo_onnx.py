@@ -0,0 +1,48 @@
+import argparse
+import io
+import os
+import sys
+from dotenv import load_dotenv
+from PIL import Image
+
+# Allow running as `python bin/export_yolo_onnx.py` from the project root
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+# Load environment variables
+load_dotenv()
+
+from app.config import YOLO_ONNX_PATH
+from app.services.lesion_detector import OnnxYoloDetector, UltralyticsDetector, check_detector_parity, export_yolo_onnx
+from app.services.model_evaluation import load_image_folder
+from app.services.yolo_service import detector_proxy
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the YOLOv8 lesion detector to ONNX and verify parity with ultralytics.")
+    parser.add_argument("--weights", default="yolov8n.pt")
+    parser.add_argument("--output", default=YOLO_ONNX_PATH)
+    parser.add_argument("--images", default="tests/data", help="Folder with images for the parity check")
+    parser.add_argument("--conf", type=float, default=0.25)
+    parser.add_argument("--min-iou", type=float, default=0.9, help="Min allowed IoU between the top boxes")
+    parser.add_argument("--skip-export", action="store_true", help="Only run the parity check on an existing export")
+    args = parser.parse_args()
+
+    if not args.skip_export:
+        export_yolo_onnx(args.weights, args.output)
+
+    images = [detector_proxy(Image.open(io.BytesIO(data))) for data in load_image_folder(args.images).values()]
+    if not images:
+        print(f"No images found in {args.images}; skipping parity check.")
+        return
+
+    from ultralytics import YOLO
+    report = check_detector_parity(UltralyticsDetector(YOLO(args.weights)), OnnxYoloDetector(args.output), images, args.conf)
+    print(f"Parity over {report['images']} images: top-box agreement = {report['top_box_agreement']:.1%}, "
+          f"min top-box IoU = {report['min_top_box_iou']:.3f}")
+
+    if report["min_top_box_iou"] < args.min_iou:
+        print("Parity check FAILED.")
+        sys.exit(1)
+    print("Parity check passed.")
+
+if __name__ == "__main__":
+    main()
@@ -20,6 +20,108 @@ def find_free_port():
         s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         return s.getsockname()[1]
 
+class _TinyProcessor:
+    """
+    Offline stand-in for the MedSigLIP AutoProcessor: a real SigLIP image
+    processor plus a deterministic word-hash tokenizer.
+    """
+    def __init__(self, image_size=448, vocab_size=99):
+        from transformers import SiglipImageProcessor
+        self.image_processor = SiglipImageProcessor(size={"height": image_size, "width": image_size})
+        self.vocab_size = vocab_size
+
+    def _tokenize(self, texts, max_length):
+        import zlib
+        import torch
+        ids = []
+        for text in texts:
+            row = [zlib.crc32(w.encode()) % (self.vocab_size - 1) + 1 for w in text.split()][:max_length]
+            ids.append(row + [0] * (max_length - len(row)))
+        return torch.tensor(ids, dtype=torch.long)
+
+    def __call__(self, text=None, images=None, padding=None, max_length=64, truncation=True, return_tensors="pt"):
+        from transformers import BatchFeature
+        data = {}
+        if text is not None:
+            data["input_ids"] = self._tokenize(text, max_length or 64)
+        if images is not None:
+            data.update(self.image_processor(images=images, return_tensors="pt"))
+        return BatchFeature(data)
+
+
+@pytest.fixture(scope="session")
+def tiny_medsiglip():
+    """
+    Returns a (model, processor) pair with a randomly initialised, tiny SigLIP
+    model at the production 448px / 14px patch geometry. No weights download.
+    """
+    torch = pytest.importorskip("torch")
+    from transformers import SiglipConfig, SiglipModel
+
+    torch.manual_seed(0)
+    config = SiglipConfig(
+        text_config=dict(vocab_size=99, hidden_size=32, intermediate_size=37, num_hidden_layers=2,
+                         num_attention_heads=4, max_position_embeddings=64),
+        vision_config=dict(image_size=448, patch_size=14, hidden_size=32, intermediate_size=37,
+                           num_hidden_layers=2, num_attention_heads=4),
+    )
+    model = SiglipModel(config).eval()
+    return model, _TinyProcessor()
+
+
+@pytest.fixture
+def tiny_medsiglip_service(tiny_medsiglip):
+    """A MedSigLIPService instance wired to the tiny model on CPU."""
+    from app.services.medsiglip_service import MedSigLIPService
+
+    model, processor = tiny_medsiglip
+    service = MedSigLIPService(model_name="tiny-medsiglip")
+    service.device = "cpu"
+    service.model = model
+    service.processor = processor
+    return service
+
+
+@pytest.fixture
+def label_prompts():
+    """Templated label prompts, as the classifier sends them to the MedSigLIP text tower."""
+    return [
+        "A patient-submitted smartphone photograph showing malignant melanoma.",
+        "A patient-submitted smartphone photograph showing benign melanocytic nevus.",
+        "A patient-submitted smartphone photograph showing normal, healthy skin.",
+    ]
+
+
+@pytest.fixture
+def differentials():
+    """Short label keys of the narrow label map, as the saliency endpoints receive them."""
+    return ["Melanoma", "Basal Cell Carcinoma", "Seborrheic Keratosis"]
+
+
+@pytest.fixture
+def make_image():
+    """Factory for test photos: a solid colour or, given a seed, reproducible noise."""
+    def make(color=(180, 90, 60), size=(448, 448), seed=None):
+        from PIL import Image
+        if seed is None:
+            return Image.new("RGB", size, color=color)
+        import numpy as np
+        rng = np.random.default_rng(seed)
+        return Image.fromarray(rng.integers(0, 256, (size[1], size[0], 3), dtype=np.uint8))
+    return make
+
+
+@pytest.fixture
+def make_jpeg(make_image):
+    """Factory for JPEG uploads of make_image photos, or of a given PIL image."""
+    def make(image=None, **kwargs):
+        import io
+        buf = io.BytesIO()
+        (image if image is not None else make_image(**kwargs)).save(buf, format="JPEG")
+        return buf.getvalue()
+    return make
+
+
 @pytest.fixture
 def client():
     """
@@ -0,0 +1,69 @@
+import base64
+import io
+from unittest.mock import patch
+from PIL import Image
+
+from app.services.image_preprocess_service import image_preprocess_service
+
+
+def _data_uri(size, color):
+    buf = io.BytesIO()
+    Image.new("RGB", size, color=color).save(buf, format="JPEG")
+    return "data:image/jpeg;base64," + base64.b64encode(buf.getvalue()).decode()
+
+
+def test_analyze_batch_returns_one_result_per_photo(client):
+    client.cookies.set("session_id", "test-batch-session-001")
+    items = [
+        {"photo_id": "a", "base64_image": _data_uri((640, 480), (200, 40, 40))},
+        {"photo_id": "b", "base64_image": _data_uri((300, 300), (40, 200, 40))},
+    ]
+
+    with patch("app.services.medsiglip_service.medsiglip_service.get_embeddings") as mock_embed, \
+            patch.object(image_preprocess_service, "recommend_prep_strategies",
+                         wraps=image_preprocess_service.recommend_prep_strategies) as batch_prep:
+        mock_embed.return_value = [{"label": "TestCondition", "score": 0.95}]
+        resp = client.post("/api/photos/analyze-batch", json={"items": items})
+
+    assert resp.status_code == 200
+    data = resp.json()
+    assert [d["photo_id"] for d in data] == ["a", "b"]
+    assert all(d["predictions"][0]["label"] == "TestCondition" for d in data)
+    assert data[1]["preprocess_strategy"]["strategy"] == "none"
+    batch_prep.assert_called_once()
+
+
+def test_analyze_batch_requires_session(client):
+    client.cookies.clear()
+    resp = client.post("/api/photos/analyze-batch", json={"items": []})
+    assert resp.status_code == 400
+
+
+def test_analyze_batch_rejects_oversized_batches(client):
+    from app.config import YOLO_MAX_BATCH_SIZE
+
+    client.cookies.set("session_id", "test-batch-session-001")
+    items = [{"photo_id": str(i), "base64_image": "aGVsbG8="} for i in range(YOLO_MAX_BATCH_SIZE + 1)]
+    with patch("app.routers.photos._analyze_batch") as analyze:
+        resp = client.post("/api/photos/analyze-batch", json={"items": items})
+    assert resp.status_code == 422
+    analyze.assert_not_called()
+
+
+def test_analyze_batch_reports_failures_per_item(client):
+    client.cookies.set("session_id", "test-batch-session-002")
+    items = [
+        {"photo_id": "good", "base64_image": _data_uri((640, 480), (200, 40, 40))},
+        {"photo_id": "corrupt", "base64_image": "data:image/jpeg;base64,bm90IGFuIGltYWdl"},
+        {"photo_id": "missing"},
+    ]
+
+    with patch("app.services.medsiglip_service.medsiglip_service.get_embeddings") as mock_embed:
+        mock_embed.return_value = [{"label": "TestCondition", "score": 0.95}]
+        resp = client.post("/api/photos/analyze-batch", json={"items": items})
+
+    assert resp.status_code == 200
+    good, corrupt, missing = resp.json()
+    assert good["predictions"][0]["label"] == "TestCondition" and good["error"] is None
+    assert corrupt["predictions"] == [] and "Invalid image" in corrupt["error"]
+    assert missing["predictions"] == [] and missing["error"] == "Photo not found"
@@ -0,0 +1,22 @@
+import pytest
+from unittest.mock import patch
+
+from app.services import cpu_topology
+
+
+@pytest.mark.parametrize("files, expected", [
+    ({cpu_topology.CGROUP_V2_CPU_MAX: "200000 100000"}, 2.0),
+    ({cpu_topology.CGROUP_V2_CPU_MAX: "max 100000"}, None),
+    ({cpu_topology.CGROUP_V1_QUOTA: "150000", cpu_topology.CGROUP_V1_PERIOD: "100000"}, 1.5),
+    ({cpu_topology.CGROUP_V1_QUOTA: "-1", cpu_topology.CGROUP_V1_PERIOD: "100000"}, None),
+    ({}, None),
+])
+def test_cgroup_cpu_limit(files, expected):
+    with patch("app.services.cpu_topology._read", side_effect=files.get):
+        assert cpu_topology.cgroup_cpu_limit() == expected
+
+
+def test_available_cpus_capped_by_quota():
+    with patch("app.services.cpu_topology.os.sched_getaffinity", return_value=set(range(32))), \
+            patch("app.services.cpu_topology.cgroup_cpu_limit", return_value=1.5):
+        assert cpu_topology.available_cpus() == 2
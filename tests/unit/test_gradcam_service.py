@@ -0,0 +1,304 @@
+import base64
+import io
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+from PIL import Image
+
+torch = pytest.importorskip("torch")
+
+from app.services.gradcam_service import GradCAMService, MemoryBudget, PATCH_SIMILARITY
+
+from app.services.medsiglip_modality_wrapper import ClinicalModalityWrapper
+
+
+def _reference_cam(service, image, label):
+    """Grad-CAM with a full backward pass, as the service computed it originally."""
+    model = service.model
+    captured = {}
+
+    def hook(_module, _input, output):
+        hidden = output[0] if isinstance(output, tuple) else output
+        hidden.retain_grad()
+        captured["activations"] = hidden
+
+    handle = model.vision_model.encoder.layers[-1].register_forward_hook(hook)
+    try:
+        # Saliency scores the same templated prompt the classifier used for the label
+        _, prompts = ClinicalModalityWrapper(service).build_prompts([label])
+        inputs = service.processor(text=prompts, images=image, return_tensors="pt", padding="max_length")
+        model.zero_grad()
+        model(**inputs).logits_per_image[0, 0].backward()
+    finally:
+        handle.remove()
+        model.zero_grad()
+
+    activations = captured["activations"]
+    cam = torch.relu(activations[0].detach() @ activations.grad[0].mean(dim=0))
+    grid = int(cam.numel() ** 0.5)
+    cam = cam.view(grid, grid)
+    cam = cam - cam.min()
+    return (cam / cam.max()).numpy()
+
+
+@pytest.fixture
+def gradcam(tiny_medsiglip_service):
+    with patch("app.services.gradcam_service.medsiglip_service", tiny_medsiglip_service):
+        yield GradCAMService(memory_budget_mb=1024, pass_memory_mb=256)
+
+
+def test_cam_matches_full_backward(gradcam, tiny_medsiglip_service, differentials, make_image):
+    image = make_image(seed=0)
+    expected = _reference_cam(tiny_medsiglip_service, image, differentials[0])
+
+    actual = gradcam._compute_cam(image, differentials[0])
+
+    assert actual.shape == (32, 32)
+    np.testing.assert_allclose(actual, expected, atol=1e-4)
+    # No gradients are left on the shared model
+    assert all(p.grad is None for p in tiny_medsiglip_service.model.parameters())
+
+
+def test_saliency_reuses_pinned_classifier_prompts(gradcam, tiny_medsiglip_service, differentials, make_image):
+    """Warm-up pins the default prompts, so saliency for those labels never runs the text tower."""
+    service = tiny_medsiglip_service
+    service.clear_text_embeddings()
+    service.get_text_embeddings(ClinicalModalityWrapper(service).build_prompts()[1], pin=True)
+    try:
+        with patch.object(service.model.text_model, "forward", wraps=service.model.text_model.forward) as text_fwd:
+            gradcam._compute_cams(make_image(seed=0), differentials)
+            gradcam.compute_maps(make_image(seed=0), differentials, method=PATCH_SIMILARITY)
+        text_fwd.assert_not_called()
+    finally:
+        service.clear_text_embeddings()
+
+
+def test_text_tower_runs_once_per_label(gradcam, tiny_medsiglip_service, differentials, make_image):
+    text_model = tiny_medsiglip_service.model.text_model
+    calls = []
+    handle = text_model.register_forward_pre_hook(lambda *_: calls.append(1))
+    try:
+        tiny_medsiglip_service.clear_text_embeddings()
+        gradcam._compute_cam(make_image(seed=0), differentials[1])
+        gradcam._compute_cam(make_image(seed=1), differentials[1])
+    finally:
+        handle.remove()
+
+    # Computed once for the label, then served from the text embedding cache
+    assert len(calls) == 1
+
+
+def test_multi_label_cams_share_one_forward(gradcam, tiny_medsiglip_service, differentials, make_image):
+    image = make_image(seed=0)
+    single = [gradcam._compute_cam(image, label) for label in differentials]
+
+    forwards = []
+    handle = tiny_medsiglip_service.model.vision_model.register_forward_pre_hook(lambda *_: forwards.append(1))
+    try:
+        multi = gradcam._compute_cams(image, differentials)
+    finally:
+        handle.remove()
+
+    assert len(forwards) == 1
+    for actual, expected in zip(multi, single):
+        np.testing.assert_allclose(actual, expected, atol=1e-5)
+    assert not np.allclose(multi[0], multi[1])
+
+
+def test_saliency_endpoint_returns_one_map_per_label(client, differentials):
+    client.cookies.set("session_id", "test-saliency-session")
+    with patch("app.routers.photos.gradcam_service.get_heatmaps", return_value=[b"a", b"b"]) as get_heatmaps:
+        resp = client.post("/api/photos/abc/saliency", json={"base64_image": "aGVsbG8=", "target_labels": differentials[:2]})
+
+    assert resp.status_code == 200
+    get_heatmaps.assert_called_once_with(b"hello", differentials[:2], "gradcam")
+    data = resp.json()
+    assert data["saliency_base64"] == "YQ=="
+    assert [m["label"] for m in data["saliency_maps"]] == differentials[:2]
+
+    resp = client.post("/api/photos/abc/saliency", json={"base64_image": "aGVsbG8=", "target_labels": differentials + ["x"]})
+    assert resp.status_code == 400
+
+
+def test_patch_projection_matches_pooling_head_on_single_token(tiny_medsiglip_service):
+    head = tiny_medsiglip_service.model.vision_model.head
+    tokens = torch.randn(5, 1, head.probe.shape[-1])
+
+    with torch.no_grad():
+        expected = head(tokens)
+        actual = GradCAMService._project_patches(head, tokens)[:, 0]
+
+    assert torch.allclose(actual, expected, atol=1e-5)
+
+
+def test_patch_similarity_maps_need_no_gradients(gradcam, tiny_medsiglip_service, differentials, make_image):
+    forwards = []
+    handle = tiny_medsiglip_service.model.vision_model.register_forward_pre_hook(
+        lambda *_: forwards.append(torch.is_grad_enabled()))
+    try:
+        maps = gradcam.compute_maps(make_image(seed=0), differentials, method=PATCH_SIMILARITY)
+    finally:
+        handle.remove()
+
+    assert forwards == [False]
+    assert len(maps) == len(differentials)
+    for sim_map in maps:
+        assert sim_map.shape == (32, 32)
+        assert sim_map.min() == pytest.approx(0.0) and sim_map.max() == pytest.approx(1.0)
+    assert gradcam.memory_budget.in_use_mb == 0
+
+
+def test_saliency_endpoint_passes_method(client, differentials):
+    client.cookies.set("session_id", "test-saliency-session")
+    with patch("app.routers.photos.gradcam_service.get_heatmaps", return_value=[b"a"]) as get_heatmaps:
+        resp = client.post("/api/photos/abc/saliency",
+                           json={"base64_image": "aGVsbG8=", "target_label": differentials[0], "method": "patch_similarity"})
+    assert resp.status_code == 200
+    assert resp.json()["method"] == "patch_similarity"
+    get_heatmaps.assert_called_once_with(b"hello", [differentials[0]], "patch_similarity")
+
+    resp = client.post("/api/photos/abc/saliency", json={"base64_image": "aGVsbG8=", "target_label": "x", "method": "magic"})
+    assert resp.status_code == 422
+
+
+def test_grid_format_returns_small_png_maps(gradcam, client, differentials, make_image, make_jpeg):
+    content = make_jpeg(image=make_image(seed=0).resize((1200, 900)))
+
+    grids = gradcam.get_cam_grids(content, differentials[:2])
+    assert len(grids) == 2
+    grid = Image.open(io.BytesIO(grids[0]))
+    assert (grid.format, grid.mode, grid.size) == ("PNG", "L", (32, 32))
+    assert len(grids[0]) < len(gradcam.get_heatmap(content, differentials[0])) / 10
+
+    client.cookies.set("session_id", "test-saliency-session")
+    with patch("app.routers.photos.gradcam_service", gradcam):
+        resp = client.post("/api/photos/abc/saliency", json={
+            "base64_image": "data:image/jpeg;base64," + base64.b64encode(content).decode(),
+            "target_labels": differentials[:2],
+            "format": "grid",
+        })
+    assert resp.status_code == 200
+    data = resp.json()
+    assert data["format"] == "grid" and data["saliency_base64"] is None
+    assert [base64.b64decode(m["cam_png_base64"]) for m in data["saliency_maps"]] == grids
+
+
+def test_saliency_cache_computes_only_missing_labels(gradcam, differentials, make_image, make_jpeg):
+    content = make_jpeg(image=make_image(seed=0))
+    with patch.object(gradcam, "compute_maps", wraps=gradcam.compute_maps) as compute_maps:
+        first = gradcam.get_maps(content, differentials[:2])
+        again = gradcam.get_maps(content, differentials[:2])
+        more = gradcam.get_maps(content, differentials)
+        gradcam.get_maps(content, differentials[:1], method=PATCH_SIMILARITY)
+
+    assert [call.args[1] for call in compute_maps.call_args_list] == [differentials[:2], differentials[2:], differentials[:1]]
+    for a, b in zip(first, again):
+        assert a is b
+    np.testing.assert_array_equal(more[0], first[0])
+    assert gradcam.cache.stats()["hits"] == 4
+
+
+def test_saliency_cache_is_shared_across_sessions(gradcam, client, differentials, make_image, make_jpeg):
+    payload = {"base64_image": base64.b64encode(make_jpeg(image=make_image(seed=2))).decode(), "target_label": differentials[0], "format": "grid"}
+    with patch("app.routers.photos.gradcam_service", gradcam), \
+            patch.object(gradcam, "compute_maps", wraps=gradcam.compute_maps) as compute_maps:
+        for session in ("session-a", "session-b"):
+            client.cookies.set("session_id", session)
+            assert client.post("/api/photos/abc/saliency", json=payload).status_code == 200
+
+    compute_maps.assert_called_once()
+
+
+def test_concurrent_calls_do_not_mix_state(gradcam, differentials, make_image):
+    images = [make_image(seed=seed) for seed in range(len(differentials))]
+    sequential = [gradcam._compute_cam(image, label) for image, label in zip(images, differentials)]
+
+    with ThreadPoolExecutor(max_workers=len(differentials)) as pool:
+        concurrent = list(pool.map(gradcam._compute_cam, images * 2, differentials * 2))
+
+    for i, cam in enumerate(concurrent):
+        np.testing.assert_allclose(cam, sequential[i % len(differentials)], atol=1e-5)
+
+
+def test_get_heatmap_returns_jpeg_overlay(gradcam, differentials, make_image, make_jpeg):
+    content = make_jpeg(image=make_image(seed=0).resize((600, 400)))
+
+    overlay = Image.open(io.BytesIO(gradcam.get_heatmap(content, differentials[0])))
+
+    assert overlay.format == "JPEG"
+    assert overlay.size == (600, 400)
+
+
+def test_memory_budget_bounds_concurrency():
+    budget = MemoryBudget(300)
+    running, peak = [0], [0]
+    lock = threading.Lock()
+
+    def work():
+        with budget.reserve(100):
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            time.sleep(0.02)
+            with lock:
+                running[0] -= 1
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(lambda _: work(), range(12)))
+
+    assert peak[0] == 3
+    assert budget.in_use_mb == 0
+
+    # A pass larger than the whole budget still runs, alone
+    with budget.reserve(1000):
+        assert budget.available_mb == 0
+
+
+def test_gradcam_on_int8_model_keeps_pooling_head_gradients(tiny_medsiglip_service, differentials, make_image):
+    import copy
+    from app.services.medsiglip_service import MedSigLIPService
+
+    def service_with(model, quantization="none"):
+        service = MedSigLIPService(model_name=tiny_medsiglip_service.model_name, quantization=quantization)
+        service.device = "cpu"
+        service.processor = tiny_medsiglip_service.processor
+        service.model = model
+        return service
+
+    quantized = service_with(copy.deepcopy(tiny_medsiglip_service.model), "int8")
+    quantized._apply_quantization()
+    head = quantized.model.vision_model.head
+    assert not [m for m in head.modules() if type(m).__module__.startswith("torch.ao.nn.quantized")]
+
+    # Every fp32 head parameter receives a gradient
+    pixel_values = quantized.pixel_values([make_image(seed=0)])
+    pooled = quantized.model.vision_model(pixel_values=pixel_values).pooler_output
+    grads = torch.autograd.grad(pooled.sum(), list(head.parameters()))
+    assert all(g.abs().sum() > 0 for g in grads)
+
+    # The int8 map stays close to the fp32 full-backward reference; quantizing the
+    # head as well (the original bug) moves it by up to ~0.7 on this model
+    image = make_image(seed=0)
+    with patch("app.services.gradcam_service.medsiglip_service", quantized):
+        cam = GradCAMService()._compute_cam(image, differentials[0])
+    expected = _reference_cam(tiny_medsiglip_service, image, differentials[0])
+    np.testing.assert_allclose(cam, expected, atol=0.1)
+    assert np.corrcoef(cam.ravel(), expected.ravel())[0, 1] > 0.99
+
+
+@pytest.mark.parametrize("output_format, method_name", [("overlay", "get_heatmaps"), ("grid", "get_cam_grids")])
+def test_failed_map_is_an_error_in_both_formats(client, output_format, method_name, differentials):
+    client.cookies.set("session_id", "test-saliency-session")
+    with patch(f"app.routers.photos.gradcam_service.{method_name}", return_value=[b"a", None]):
+        resp = client.post("/api/photos/abc/saliency",
+                           json={"base64_image": "aGVsbG8=", "target_labels": differentials[:2], "format": output_format})
+    assert resp.status_code == 500
+
+
+def test_overlay_failure_does_not_return_the_original_image(gradcam, differentials, make_image, make_jpeg):
+    with patch.object(gradcam, "compute_maps", side_effect=RuntimeError("boom")):
+        assert gradcam.get_heatmaps(make_jpeg(image=make_image(seed=0)), differentials[:2]) == [None, None]
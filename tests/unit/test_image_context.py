@@ -0,0 +1,116 @@
+import io
+from unittest.mock import patch
+from PIL import Image
+
+from app.services import image_preprocess_service as preprocess_module
+from app.services.image_preprocess_service import image_preprocess_service, PreprocessStrategy
+
+
+def _jpeg_bytes(size=(1200, 800), orientation=None):
+    image = Image.new("RGB", size, color=(180, 90, 60))
+    buf = io.BytesIO()
+    if orientation is None:
+        image.save(buf, format="JPEG")
+    else:
+        exif = Image.Exif()
+        exif[preprocess_module.EXIF_ORIENTATION] = orientation
+        image.save(buf, format="JPEG", exif=exif)
+    return buf.getvalue()
+
+
+def setup_function():
+    image_preprocess_service.strategy_cache.clear()
+
+
+def test_context_decodes_and_detects_once():
+    content = _jpeg_bytes()
+    context = image_preprocess_service.create_context(content)
+
+    with patch.object(preprocess_module, "open_scaled", wraps=preprocess_module.open_scaled) as decode, \
+            patch.object(image_preprocess_service, "get_lesion_bbox", return_value=(500, 300, 700, 500)) as detect:
+        assert context.strategy["strategy"] == PreprocessStrategy.CROP
+        assert context.preview_base64().startswith("data:image/jpeg;base64,")
+        prepared = context.prepared((448, 448))
+        assert context.prepared((448, 448)) is prepared
+        context.strategy
+
+    assert decode.call_count == 1
+    assert detect.call_count == 1
+    assert prepared.size == (448, 448)
+
+
+def test_context_matches_prepare_image():
+    content = _jpeg_bytes()
+    with patch.object(image_preprocess_service, "get_lesion_bbox", return_value=(50, 300, 200, 500)):
+        expected = image_preprocess_service.prepare_image(Image.open(io.BytesIO(content)).convert("RGB"))
+        prepared = image_preprocess_service.create_context(content).prepared()
+    assert list(prepared.getdata()) == list(expected.getdata())
+
+
+def test_context_applies_exif_orientation():
+    # Orientation 6: stored landscape, displayed rotated 90 degrees (portrait)
+    context = image_preprocess_service.create_context(_jpeg_bytes(size=(300, 200), orientation=6))
+    assert context.image.size == (200, 300)
+    assert context.image.mode == "RGB"
+
+
+def test_detection_runs_once_per_unique_image():
+    content = _jpeg_bytes()
+    with patch.object(image_preprocess_service, "get_lesion_bbox", return_value=(500, 300, 700, 500)) as detect:
+        first = image_preprocess_service.recommend_prep_strategy(content)
+        second = image_preprocess_service.create_context(content).strategy
+        image_preprocess_service.recommend_prep_strategy(_jpeg_bytes(size=(1000, 800)))
+
+    assert detect.call_count == 2
+    assert first == second
+    assert first["bbox"] == (500, 300, 700, 500)
+    assert first["image_size"] == (1200, 800)
+    assert image_preprocess_service.strategy_cache.stats()["hits"] >= 1
+
+
+def test_large_jpeg_is_draft_decoded_and_bbox_mapped_back():
+    content = _jpeg_bytes(size=(4000, 3000))
+    context = image_preprocess_service.create_context(content)
+
+    # DCT scaling to 1/4 still covers the 448px model input and YOLO's 640px input
+    assert context.image.size == (1000, 750)
+    assert context.original_size == (4000, 3000)
+
+    with patch.object(image_preprocess_service, "get_lesion_bbox", return_value=(400, 300, 600, 450)) as detect:
+        strategy = context.strategy
+    assert detect.call_args[0][0].size == (1000, 750)
+    assert strategy["bbox"] == (1600, 1200, 2400, 1800)
+    assert strategy["image_size"] == (4000, 3000)
+    assert context.prepared().size == (448, 448)
+
+
+def test_draft_size_covers_model_and_detector_inputs():
+    assert preprocess_module.draft_size((4032, 3024)) == (640, 480)
+    assert preprocess_module.draft_size((3024, 4032)) == (480, 640)
+    assert preprocess_module.draft_size((800, 600)) == (640, 480)
+    assert preprocess_module.draft_size((600, 400)) == (600, 400)
+
+
+def test_batch_strategies_run_one_detection_batch():
+    landscape, portrait, square = _jpeg_bytes((1200, 800)), _jpeg_bytes((800, 1200)), _jpeg_bytes((600, 600))
+    boxes = [[(500, 300, 700, 500, 0.9)], [(10, 10, 100, 100, 0.8)]]
+
+    with patch.object(preprocess_module.yolo_service, "detect_batch", return_value=boxes) as detect_batch:
+        strategies = image_preprocess_service.recommend_prep_strategies([landscape, portrait, square])
+
+    detect_batch.assert_called_once()
+    assert [img.size for img in detect_batch.call_args[0][0]] == [(1200, 800), (800, 1200)]
+    assert [s["strategy"] for s in strategies] == [PreprocessStrategy.CROP, PreprocessStrategy.PAD, PreprocessStrategy.NONE]
+
+    # Later single-image lookups are served from the cache
+    with patch.object(image_preprocess_service, "get_lesion_bbox") as detect:
+        assert image_preprocess_service.create_context(portrait).strategy["bbox"] == (10, 10, 100, 100)
+    detect.assert_not_called()
+
+
+def test_needs_detection_matches_strategy_for_image():
+    sizes = [(448, 448), (1000, 1000), (448, 300), (300, 448), (449, 300), (448, 449), (1200, 800)]
+    for size in sizes:
+        with patch.object(image_preprocess_service, "get_lesion_bbox", return_value=None) as detect:
+            image_preprocess_service.strategy_for_image(Image.new("RGB", size))
+        assert image_preprocess_service.needs_detection(Image.new("RGB", size)) == detect.called, size
@@ -0,0 +1,83 @@
+import pytest
+from unittest.mock import patch
+
+torch = pytest.importorskip("torch")
+
+from app.services.byte_lru_cache import ByteLRUCache
+
+
+def test_byte_lru_evicts_least_recently_used():
+    cache = ByteLRUCache(max_bytes=10)
+    cache.put("a", b"aaaa")
+    cache.put("b", b"bbbb")
+    assert cache.get("a") == b"aaaa"  # "a" is now most recent
+    cache.put("c", b"cccc")           # evicts "b"
+
+    assert "b" not in cache
+    assert cache.get("a") == b"aaaa"
+    assert cache.get("c") == b"cccc"
+    assert cache.current_bytes == 8
+
+    cache.put("huge", b"x" * 11)      # larger than the budget: ignored
+    assert "huge" not in cache
+    assert cache.stats()["hits"] == 3
+    assert cache.stats()["misses"] == 0
+
+
+def test_byte_lru_expires_entries_after_ttl():
+    now = [100.0]
+    cache = ByteLRUCache(max_bytes=100, ttl_seconds=10, clock=lambda: now[0])
+    cache.put("a", b"aaaa")
+    now[0] += 9
+    assert cache.get("a") == b"aaaa"
+    now[0] += 1
+    assert cache.get("a") is None
+    assert "a" not in cache
+    assert cache.current_bytes == 0
+    assert cache.stats()["expired"] == 1
+
+
+def test_reanalysis_skips_preprocessing_and_vision_tower(tiny_medsiglip_service, label_prompts, make_jpeg):
+    service = tiny_medsiglip_service
+    image_bytes = make_jpeg(color=(150, 60, 60))
+    first = service.get_embeddings(image_bytes, texts=label_prompts)
+
+    with patch.object(service, "prepare", wraps=service.prepare) as prepare, \
+            patch.object(service.model.vision_model, "forward", wraps=service.model.vision_model.forward) as vision_fwd:
+        again = service.get_embeddings(image_bytes, texts=label_prompts)
+        other_labels = service.get_embeddings(image_bytes, texts=label_prompts[:2])
+        assert prepare.call_count == 0
+        assert vision_fwd.call_count == 0
+
+        # New content is a cache miss
+        service.get_embeddings(make_jpeg(color=(10, 120, 200)), texts=label_prompts)
+        assert vision_fwd.call_count == 1
+
+    assert [r["label"] for r in again] == [r["label"] for r in first]
+    for a, b in zip(again, first):
+        assert a["score"] == pytest.approx(b["score"], abs=1e-6)
+    assert {r["label"] for r in other_labels} == set(label_prompts[:2])
+
+
+def test_cache_key_depends_on_inference_mode(tiny_medsiglip_service, make_jpeg):
+    image_bytes = make_jpeg(color=(1, 2, 3))
+    key = tiny_medsiglip_service.image_cache_key(image_bytes)
+    tiny_medsiglip_service.quantization = "int8"
+    assert tiny_medsiglip_service.image_cache_key(image_bytes) != key
+
+
+def test_detection_fallback_embedding_is_not_reused_after_detection(tiny_medsiglip_service, label_prompts, make_jpeg):
+    from app.services.image_preprocess_service import image_preprocess_service
+
+    service = tiny_medsiglip_service
+    image_bytes = make_jpeg(color=(120, 70, 50), size=(900, 600))
+
+    with patch.object(service.model.vision_model, "forward", wraps=service.model.vision_model.forward) as vision_fwd:
+        with patch.object(image_preprocess_service, "get_lesion_bbox", return_value=None):
+            service.get_embeddings(image_bytes, texts=label_prompts)
+        with patch.object(image_preprocess_service, "get_lesion_bbox", return_value=[100, 100, 300, 300]):
+            service.get_embeddings(image_bytes, texts=label_prompts)
+            service.get_embeddings(image_bytes, texts=label_prompts)
+
+    # The centre-crop fallback and the detected crop are embedded separately; the latter is then reused
+    assert vision_fwd.call_count == 2
@@ -21,7 +21,7 @@ class TestImagePreprocessService(unittest.TestCase):
                 # though they should be in the repo.
                 self.skipTest(f"Missing required test data: {p}")
             
-        image_preprocess_service.recommend_prep_strategy.cache_clear()
+        image_preprocess_service.strategy_cache.clear()
 
     def test_melanoma_crop_vs_pad_logic(self):
         """
@@ -38,21 +38,21 @@ class TestImagePreprocessService(unittest.TestCase):
 
         # Case 1: Lesion is centered -> Strategy: CROP
         with patch.object(image_preprocess_service, 'get_lesion_bbox', return_value=(500, 300, 700, 500)):
-            image_preprocess_service.recommend_prep_strategy.cache_clear()
+            image_preprocess_service.strategy_cache.clear()
             res = image_preprocess_service.recommend_prep_strategy(content)
             self.assertEqual(res["strategy"], PreprocessStrategy.CROP)
             self.assertIn("fully contained", res["reason"])
 
         # Case 2: Lesion is at the far left edge (x=50) -> Strategy: PAD
         with patch.object(image_preprocess_service, 'get_lesion_bbox', return_value=(50, 300, 200, 500)):
-            image_preprocess_service.recommend_prep_strategy.cache_clear()
+            image_preprocess_service.strategy_cache.clear()
             res = image_preprocess_service.recommend_prep_strategy(content)
             self.assertEqual(res["strategy"], PreprocessStrategy.PAD)
             self.assertIn("extends beyond", res["reason"])
 
         # Case 3: Lesion is at the far right edge (x=1200) -> Strategy: PAD
         with patch.object(image_preprocess_service, 'get_lesion_bbox', return_value=(1100, 300, 1250, 500)):
-            image_preprocess_service.recommend_prep_strategy.cache_clear()
+            image_preprocess_service.strategy_cache.clear()
             res = image_preprocess_service.recommend_prep_strategy(content)
             self.assertEqual(res["strategy"], PreprocessStrategy.PAD)
             self.assertIn("extends beyond", res["reason"])
@@ -70,7 +70,7 @@ class TestImagePreprocessService(unittest.TestCase):
         # For a 1280 wide image, center crop starts at 194.5.
         # We mock a lesion at the far left edge (x=50) to verify PAD logic.
         with patch.object(image_preprocess_service, 'get_lesion_bbox', return_value=(50, 400, 250, 600)):
-            image_preprocess_service.recommend_prep_strategy.cache_clear()
+            image_preprocess_service.strategy_cache.clear()
             res = image_preprocess_service.recommend_prep_strategy(content)
             
             self.assertEqual(res["strategy"], PreprocessStrategy.PAD)
@@ -90,13 +90,13 @@ class TestImagePreprocessService(unittest.TestCase):
         
         # Case 1: Centered mole -> CROP
         with patch.object(image_preprocess_service, 'get_lesion_bbox', return_value=(200, 100, 400, 300)):
-            image_preprocess_service.recommend_prep_strategy.cache_clear()
+            image_preprocess_service.strategy_cache.clear()
             res = image_preprocess_service.recommend_prep_strategy(content)
             self.assertEqual(res["strategy"], PreprocessStrategy.CROP)
 
         # Case 2: Mole at left edge (x=50) -> PAD (Cutoff is at x=114)
         with patch.object(image_preprocess_service, 'get_lesion_bbox', return_value=(50, 100, 150, 300)):
-            image_preprocess_service.recommend_prep_strategy.cache_clear()
+            image_preprocess_service.strategy_cache.clear()
             res = image_preprocess_service.recommend_prep_strategy(content)
             self.assertEqual(res["strategy"], PreprocessStrategy.PAD)
 
@@ -106,7 +106,7 @@ class TestImagePreprocessService(unittest.TestCase):
         # Use existing melanoma.jpg (224x224)
         with Image.open(self.melanoma_path) as img:
             with patch.object(image_preprocess_service, 'get_lesion_bbox', return_value=(90, 90, 130, 130)):
-                image_preprocess_service.recommend_prep_strategy.cache_clear()
+                image_preprocess_service.strategy_cache.clear()
                 prepared = image_preprocess_service.prepare_image(img, (50, 50))
                 self.assertEqual(prepared.size, (50, 50))
 
@@ -117,7 +117,7 @@ class TestImagePreprocessService(unittest.TestCase):
         with Image.open(self.image_path) as img:
             # Mock lesion at the very left (x=50) so it's outside center crop
             with patch.object(image_preprocess_service, 'get_lesion_bbox', return_value=(50, 200, 150, 300)):
-                image_preprocess_service.recommend_prep_strategy.cache_clear()
+                image_preprocess_service.strategy_cache.clear()
                 prepared = image_preprocess_service.prepare_image(img, (50, 50))
                 self.assertEqual(prepared.size, (50, 50))
                 # Resize to 50x50 -> should have black bars if PAD was used
@@ -131,7 +131,7 @@ class TestImagePreprocessService(unittest.TestCase):
         with open(self.small_image_path, "rb") as f:
             content = f.read()
         
-        image_preprocess_service.recommend_prep_strategy.cache_clear()
+        image_preprocess_service.strategy_cache.clear()
         res = image_preprocess_service.recommend_prep_strategy(content)
         
         self.assertEqual(res["strategy"], PreprocessStrategy.PAD)
@@ -0,0 +1,113 @@
+import asyncio
+import threading
+import time
+import pytest
+from unittest.mock import patch
+
+from app.services.inference_executor import IdleTaskRunner, InferenceExecutor, InferenceQueueFull
+
+
+def test_executor_rejects_beyond_capacity():
+    """Running + queued jobs are bounded; the next submission is rejected, not queued."""
+    executor = InferenceExecutor(max_workers=1, max_queue=1)
+    release = threading.Event()
+    try:
+        first = executor.submit(release.wait)
+        second = executor.submit(release.wait)
+        assert executor.pending == 2
+        with pytest.raises(InferenceQueueFull):
+            executor.submit(release.wait)
+
+        release.set()
+        first.result(timeout=5)
+        second.result(timeout=5)
+        # Slots are released once jobs finish
+        assert executor.submit(lambda: 42).result(timeout=5) == 42
+    finally:
+        release.set()
+        executor.shutdown()
+
+
+def test_executor_runs_off_event_loop():
+    executor = InferenceExecutor(max_workers=1, max_queue=0)
+
+    async def main():
+        return await executor.run(threading.current_thread)
+
+    try:
+        worker_thread = asyncio.run(main())
+        assert worker_thread is not threading.main_thread()
+        assert worker_thread.name.startswith("inference")
+        assert executor.is_idle()
+    finally:
+        executor.shutdown()
+
+
+def test_failing_job_raises_to_caller_and_releases_its_slot():
+    executor = InferenceExecutor(max_workers=1, max_queue=0)
+
+    def fail():
+        raise ValueError("model exploded")
+
+    try:
+        with pytest.raises(ValueError, match="model exploded"):
+            asyncio.run(executor.run(fail))
+        assert executor.pending == 0
+        assert executor.is_idle()
+        # The only slot is free again
+        assert executor.submit(lambda: 42).result(timeout=5) == 42
+    finally:
+        executor.shutdown()
+
+
+def test_saliency_returns_503_with_retry_after_when_busy(client):
+    client.cookies.set("session_id", "test-admission-session")
+    with patch("app.routers.photos.inference_executor.submit", side_effect=InferenceQueueFull(retry_after=7)):
+        resp = client.post("/api/photos/abc/saliency", json={"base64_image": "aGVsbG8=", "target_label": "Melanoma"})
+    assert resp.status_code == 503
+    assert resp.headers["Retry-After"] == "7"
+
+
+def test_idle_tasks_wait_for_foreground_work_and_log_failures(caplog):
+    executor = InferenceExecutor(max_workers=1, max_queue=0)
+    runner = IdleTaskRunner(executor, poll_seconds=0.01)
+    release, done = threading.Event(), threading.Event()
+
+    def fail():
+        raise RuntimeError("warm-up broke")
+
+    try:
+        busy = executor.submit(release.wait)
+        runner.submit(fail)
+        runner.submit(done.set)
+        assert not done.wait(0.05)
+        assert runner.pending == 2
+
+        release.set()
+        busy.result(timeout=5)
+        assert done.wait(5)
+        # Idle tasks never hold an admission slot
+        assert executor.is_idle()
+        assert "warm-up broke" in caplog.text
+    finally:
+        release.set()
+        executor.shutdown()
+
+
+def test_idle_task_queue_drops_oldest():
+    executor = InferenceExecutor(max_workers=1, max_queue=0)
+    runner = IdleTaskRunner(executor, max_queue=2, poll_seconds=0.01)
+    release, ran = threading.Event(), []
+    try:
+        busy = executor.submit(release.wait)
+        for i in range(4):
+            runner.submit(ran.append, i)
+        release.set()
+        busy.result(timeout=5)
+        deadline = time.monotonic() + 5
+        while len(ran) < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert ran == [2, 3]
+    finally:
+        release.set()
+        executor.shutdown()
@@ -0,0 +1,128 @@
+import numpy as np
+import pytest
+
+from app.services.lesion_detector import LesionDetector, OnnxYoloDetector, UltralyticsDetector, letterbox, nms, postprocess
+from app.services.yolo_service import YOLOService
+
+
+def test_nms_suppresses_overlapping_boxes():
+    boxes = np.array([[0, 0, 10, 10], [1, 1, 11, 11], [20, 20, 30, 30], [0, 0, 10, 9]], dtype=np.float32)
+    scores = np.array([0.9, 0.8, 0.7, 0.95], dtype=np.float32)
+
+    keep = nms(boxes, scores, iou_threshold=0.5)
+
+    assert keep.tolist() == [3, 2]
+
+
+def test_postprocess_keeps_overlapping_boxes_of_different_classes():
+    # (4 + 2 classes, 3 anchors): two overlapping boxes of different classes, one below conf
+    prediction = np.array([
+        [50, 52, 200],   # cx
+        [50, 50, 200],   # cy
+        [20, 20, 10],    # w
+        [20, 20, 10],    # h
+        [0.9, 0.1, 0.1],  # class 0
+        [0.1, 0.8, 0.2],  # class 1
+    ], dtype=np.float32)
+
+    detections = postprocess(prediction, conf=0.25)
+
+    assert detections.shape == (2, 5)
+    np.testing.assert_allclose(detections[0], [40, 40, 60, 60, 0.9])
+    np.testing.assert_allclose(detections[1], [42, 40, 62, 60, 0.8])
+
+
+def test_onnx_backend_falls_back_to_ultralytics_without_export(tmp_path, monkeypatch):
+    pytest.importorskip("ultralytics")
+    service = YOLOService(backend="onnx", onnx_path=str(tmp_path / "missing.onnx"))
+    sentinel = object()
+    monkeypatch.setattr("ultralytics.YOLO", lambda weights: sentinel)
+
+    assert service.load_model() is sentinel
+    assert isinstance(service.get_detector(), UltralyticsDetector)
+
+
+@pytest.fixture(scope="module")
+def yolo_pair(tmp_path_factory):
+    """A randomly initialised YOLOv8n and its ONNX export (no weight download needed)."""
+    pytest.importorskip("onnxruntime")
+    pytest.importorskip("onnx")
+    ultralytics = pytest.importorskip("ultralytics")
+    import torch
+
+    torch.manual_seed(0)
+    path = tmp_path_factory.mktemp("yolo") / "yolov8n-random.pt"
+    ultralytics.YOLO("yolov8n.yaml").save(str(path))
+    model = ultralytics.YOLO(str(path))
+    return model, model.export(format="onnx", imgsz=640, dynamic=True)
+
+
+@pytest.fixture
+def images(make_image):
+    return [make_image(seed=0, size=(640, 640)), make_image(seed=1, size=(640, 480))]
+
+
+def test_letterbox_matches_ultralytics(images):
+    pytest.importorskip("ultralytics")
+    from ultralytics.data.augment import LetterBox
+
+    image = np.asarray(images[1].resize((500, 333)))
+    padded, gain, pad = letterbox(image, 640)
+
+    np.testing.assert_array_equal(padded, LetterBox(new_shape=(640, 640), auto=False)(image=image))
+    assert gain == pytest.approx(640 / 500)
+    assert pad == (0, 107)
+
+
+def test_postprocess_matches_ultralytics_nms():
+    pytest.importorskip("ultralytics")
+    import torch
+    from ultralytics.utils.nms import non_max_suppression
+
+    rng = np.random.default_rng(0)
+    anchors = 2000
+    centers = rng.uniform(0, 640, (2, anchors))
+    sizes = rng.uniform(10, 200, (2, anchors))
+    scores = rng.uniform(0, 0.6, (80, anchors))
+    prediction = np.concatenate([centers, sizes, scores]).astype(np.float32)
+
+    expected = non_max_suppression(torch.from_numpy(prediction[None]), conf_thres=0.25, iou_thres=0.7)[0].numpy()
+    actual = postprocess(prediction, conf=0.25)
+
+    # Same kept boxes; equal-score boxes may be listed in either order
+    def rows(a):
+        return a[np.lexsort(a.T[::-1])]
+
+    assert len(actual) == len(expected)
+    np.testing.assert_allclose(rows(actual), rows(expected[:, :5]), rtol=1e-5, atol=1e-3)
+
+
+def test_onnx_detector_matches_ultralytics_forward(yolo_pair, images):
+    """The exported graph reproduces the raw PyTorch predictions the NMS above consumes."""
+    import torch
+
+    model, onnx_path = yolo_pair
+    detector = OnnxYoloDetector(onnx_path)
+    session = detector.load()
+
+    padded = [letterbox(np.asarray(image), 640)[0] for image in images]
+    inputs = np.stack(padded).transpose(0, 3, 1, 2).astype(np.float32) / 255.0
+    actual = session.run(None, {session.get_inputs()[0].name: inputs})[0]
+    with torch.no_grad():
+        expected = model.model.eval()(torch.from_numpy(inputs))
+    expected = (expected[0] if isinstance(expected, (list, tuple)) else expected).numpy()
+
+    np.testing.assert_allclose(actual, expected, rtol=1e-3, atol=1e-3)
+
+    # End to end through the detector: one (possibly empty) box list per image, within bounds
+    for image, boxes in zip(images, detector.detect_batch(images, conf=1e-4)):
+        for x1, y1, x2, y2, score in boxes:
+            assert 0 <= x1 <= x2 <= image.size[0] and 0 <= y1 <= y2 <= image.size[1]
+
+
+def test_incomplete_detector_fails_on_instantiation():
+    class Incomplete(LesionDetector):
+        pass
+
+    with pytest.raises(TypeError):
+        Incomplete()
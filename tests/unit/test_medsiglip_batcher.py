@@ -0,0 +1,45 @@
+import threading
+import pytest
+from unittest.mock import patch
+
+torch = pytest.importorskip("torch")
+
+from app.services.medsiglip_batcher import MedSigLIPBatcher
+
+
+def test_batched_results_match_serial(tiny_medsiglip_service, label_prompts, make_jpeg):
+    """Concurrent callers get the same per-image results as serial calls, from fewer forwards."""
+    service = tiny_medsiglip_service
+    batcher = MedSigLIPBatcher(service, max_batch_size=4, batch_window_ms=200)
+    images = [make_jpeg(color=(i * 40, 255 - i * 40, 90)) for i in range(4)]
+    expected = [service.get_embeddings(img, texts=label_prompts) for img in images]
+    # Force the batched path to run the vision tower again
+    service.image_embedding_cache.clear()
+
+    results = [None] * len(images)
+    barrier = threading.Barrier(len(images))
+
+    def worker(i):
+        barrier.wait()
+        results[i] = batcher.get_embeddings(images[i], texts=label_prompts)
+
+    with patch.object(service, "get_embeddings_batch", wraps=service.get_embeddings_batch) as batch_fn:
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(len(images))]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join(timeout=30)
+        assert batch_fn.call_count < len(images)
+
+    for got, want in zip(results, expected):
+        assert [r["label"] for r in got] == [r["label"] for r in want]
+        for g, w in zip(got, want):
+            assert g["score"] == pytest.approx(w["score"], abs=1e-5)
+
+
+def test_batch_errors_propagate_to_callers(tiny_medsiglip_service, label_prompts, make_jpeg):
+    batcher = MedSigLIPBatcher(tiny_medsiglip_service, max_batch_size=2, batch_window_ms=1)
+    with patch.object(tiny_medsiglip_service, "get_embeddings_batch", side_effect=RuntimeError("boom")):
+        with pytest.raises(RuntimeError, match="boom"):
+            batcher.get_embeddings(make_jpeg(color=(10, 10, 10)), texts=label_prompts)
+    assert batcher.model_name == tiny_medsiglip_service.model_name
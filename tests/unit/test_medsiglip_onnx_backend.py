@@ -0,0 +1,33 @@
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("onnxruntime")
+
+from app.services.medsiglip_service import MedSigLIPService
+from app.services.medsiglip_onnx_backend import export_vision_onnx, check_parity
+
+
+def test_onnx_backend_matches_torch(tiny_medsiglip_service, tmp_path, label_prompts, make_jpeg):
+    """The exported ONNX vision tower reproduces the PyTorch probabilities."""
+    onnx_path = str(tmp_path / "vision.onnx")
+    export_vision_onnx(tiny_medsiglip_service.model, onnx_path)
+
+    onnx_service = MedSigLIPService(model_name="tiny-medsiglip", backend="onnx", onnx_path=onnx_path)
+    onnx_service.device = "cpu"
+    onnx_service.model = tiny_medsiglip_service.model
+    onnx_service.processor = tiny_medsiglip_service.processor
+    onnx_service._load_vision_backend()
+    assert onnx_service.vision_backend is not None
+
+    images = [make_jpeg(color=(200, 40, 40)), make_jpeg(color=(40, 200, 40))]
+    report = check_parity(tiny_medsiglip_service, onnx_service, images, label_prompts)
+
+    assert report["images"] == 2
+    assert report["top1_agreement"] == 1.0
+    assert report["max_abs_prob_diff"] < 1e-4
+
+
+def test_missing_onnx_file_falls_back_to_torch(tiny_medsiglip_service, tmp_path):
+    service = MedSigLIPService(model_name="tiny-medsiglip", backend="onnx", onnx_path=str(tmp_path / "missing.onnx"))
+    service._load_vision_backend()
+    assert service.vision_backend is None
@@ -0,0 +1,35 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+
+
+def test_direct_pixel_values_match_processor(tiny_medsiglip_service, make_image):
+    service = tiny_medsiglip_service
+    images = [make_image(seed=seed) for seed in range(3)]
+
+    actual = service.pixel_values(images)
+    expected = service.processor(images=images, return_tensors="pt")["pixel_values"]
+
+    assert actual.dtype == torch.float32 and actual.is_contiguous()
+    assert torch.equal(actual, expected)
+
+
+def test_other_sizes_go_through_processor(tiny_medsiglip_service, make_image):
+    service = tiny_medsiglip_service
+    images = [make_image(seed=seed, size=(300, 200)) for seed in range(2)]
+
+    actual = service.pixel_values(images)
+    expected = service.processor(images=images, return_tensors="pt")["pixel_values"]
+
+    assert actual.shape == (2, 3, 448, 448)
+    assert torch.equal(actual, expected)
+
+
+def test_image_embeds_unchanged_by_direct_path(tiny_medsiglip_service, make_image):
+    service = tiny_medsiglip_service
+    images = [make_image(seed=seed) for seed in (1, 2)]
+    with torch.no_grad():
+        inputs = service.processor(images=images, return_tensors="pt")
+        expected = service.model.vision_model(pixel_values=inputs["pixel_values"]).pooler_output
+
+    assert torch.allclose(service._get_image_embeds(images), expected, atol=1e-5)
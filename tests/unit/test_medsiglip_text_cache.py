@@ -0,0 +1,87 @@
+import io
+import pytest
+from unittest.mock import patch
+from PIL import Image
+
+torch = pytest.importorskip("torch")
+
+from app.services.image_preprocess_service import image_preprocess_service
+
+
+def _full_forward_probs(service, image_bytes, texts):
+    """Reference: the original two-tower forward with softmax over logits_per_image."""
+    image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
+    image = image_preprocess_service.prepare_image(image, (448, 448))
+    inputs = service.processor(text=texts, images=image, padding="max_length", max_length=64,
+                               truncation=True, return_tensors="pt")
+    with torch.no_grad():
+        outputs = service.model(**inputs)
+    return outputs.logits_per_image.softmax(dim=1)[0].tolist()
+
+
+def test_cached_scoring_matches_full_forward(tiny_medsiglip_service, label_prompts, make_jpeg):
+    """Vision-only scoring against cached text embeddings reproduces the full model softmax."""
+    image_bytes = make_jpeg()
+    expected = dict(zip(label_prompts, _full_forward_probs(tiny_medsiglip_service, image_bytes, label_prompts)))
+
+    results = tiny_medsiglip_service.get_embeddings(image_bytes, texts=label_prompts)
+
+    assert [r["label"] for r in results] == sorted(label_prompts, key=lambda l: expected[l], reverse=True)
+    for r in results:
+        assert r["score"] == pytest.approx(expected[r["label"]], abs=1e-5)
+
+
+def test_text_tower_runs_once_per_label_set(tiny_medsiglip_service, label_prompts, make_jpeg):
+    """Repeated requests with the same prompts reuse the cached embeddings."""
+    service = tiny_medsiglip_service
+    image_bytes = make_jpeg()
+
+    with patch.object(service.model.text_model, "forward", wraps=service.model.text_model.forward) as text_fwd:
+        service.get_embeddings(image_bytes, texts=label_prompts)
+        service.get_embeddings(make_jpeg(color=(20, 200, 20)), texts=label_prompts)
+        assert text_fwd.call_count == 1
+
+        # A different label set (e.g. another modality template) is a new cache entry
+        service.get_embeddings(image_bytes, texts=[l.replace("smartphone", "dermoscopy") for l in label_prompts])
+        assert text_fwd.call_count == 2
+
+    service.clear_text_embeddings()
+    assert len(service.text_embedding_cache) == 0 and not service._pinned_text_embeddings
+
+
+def test_text_embeddings_are_cached_per_prompt(tiny_medsiglip_service, label_prompts):
+    """Overlapping and reordered label sets only run the text tower for unseen prompts."""
+    service = tiny_medsiglip_service
+    service.clear_text_embeddings()
+    expected = service.get_text_embeddings(label_prompts)
+
+    with patch.object(service.model.text_model, "forward", wraps=service.model.text_model.forward) as text_fwd:
+        reordered = service.get_text_embeddings(label_prompts[::-1])
+        assert text_fwd.call_count == 0
+        assert torch.equal(reordered, expected.flip(0))
+
+        service.get_text_embeddings(label_prompts[:2] + ["A clinical photograph of a scar."])
+        assert text_fwd.call_count == 1
+        assert text_fwd.call_args.kwargs["input_ids"].shape[0] == 1
+    assert len(service.text_embedding_cache) == len(label_prompts) + 1
+    service.clear_text_embeddings()
+
+
+def test_client_prompts_are_bounded_and_defaults_pinned(tiny_medsiglip_service, label_prompts):
+    from app.services.byte_lru_cache import ByteLRUCache
+
+    service = tiny_medsiglip_service
+    service.clear_text_embeddings()
+    row_bytes = service.get_text_embeddings(label_prompts[:1]).element_size() * service.get_text_embeddings(label_prompts[:1]).shape[1]
+    service.text_embedding_cache = ByteLRUCache(2 * row_bytes, name="text-embeddings")
+    try:
+        service.get_text_embeddings(label_prompts, pin=True)
+        service.get_text_embeddings([f"custom label {i}" for i in range(5)])
+
+        assert len(service.text_embedding_cache) == 2
+        # Pinned default labels survive client churn
+        with patch.object(service.model.text_model, "forward", wraps=service.model.text_model.forward) as text_fwd:
+            service.get_text_embeddings(label_prompts)
+        text_fwd.assert_not_called()
+    finally:
+        service.clear_text_embeddings()
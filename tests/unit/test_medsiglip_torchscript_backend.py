@@ -0,0 +1,82 @@
+import pytest
+from unittest.mock import MagicMock, patch
+from PIL import Image
+
+pytest.importorskip("torch")
+
+from app.services.medsiglip_service import MedSigLIPService
+from app.services.medsiglip_onnx_backend import check_parity
+from app.services.medsiglip_torchscript_backend import TorchScriptVisionBackend, trace_vision_tower
+
+
+def _torchscript_service(reference, artifact_path):
+    service = MedSigLIPService(model_name="tiny-medsiglip", backend="torchscript", torchscript_path=artifact_path)
+    service.device = "cpu"
+    service.model = reference.model
+    service.processor = reference.processor
+    service._load_vision_backend()
+    return service
+
+
+def test_torchscript_backend_matches_eager(tiny_medsiglip_service, tmp_path, label_prompts, make_jpeg):
+    service = _torchscript_service(tiny_medsiglip_service, str(tmp_path / "vision.ts"))
+    assert service.vision_backend is not None
+
+    # Three images exercise a batch size other than the traced one
+    images = [make_jpeg(color=(200, 40, 40)), make_jpeg(color=(40, 200, 40)), make_jpeg(color=(40, 40, 200))]
+    report = check_parity(tiny_medsiglip_service, service, images, label_prompts)
+    assert report["top1_agreement"] == 1.0
+    assert report["max_abs_prob_diff"] < 1e-4
+
+    embeds = service._get_image_embeds([Image.new("RGB", (448, 448))] * 2)
+    assert embeds.shape[0] == 2
+
+    benchmark = service.benchmark_vision_backend(runs=1)
+    assert benchmark["eager_ms"] > 0 and benchmark["compiled_ms"] > 0
+
+
+def test_torchscript_artifact_is_reused_and_invalidated(tiny_medsiglip_service, tmp_path):
+    artifact = str(tmp_path / "vision.ts")
+    _torchscript_service(tiny_medsiglip_service, artifact)
+
+    with patch("app.services.medsiglip_torchscript_backend.trace_vision_tower") as trace:
+        _torchscript_service(tiny_medsiglip_service, artifact)
+    trace.assert_not_called()
+
+    # A different quantization mode must not reuse the fp32 trace
+    backend = TorchScriptVisionBackend(artifact, {"model_name": "tiny-medsiglip", "quantization": "int8", "image_size": [448, 448]})
+    assert backend._load_artifact() is None
+
+
+def test_preload_defers_tracing_to_first_use(tiny_medsiglip, tmp_path):
+    """The pre-fork parent loads weights only; the worker traces on its first call."""
+    model, processor = tiny_medsiglip
+    service = MedSigLIPService(model_name="tiny-medsiglip", backend="torchscript",
+                               torchscript_path=str(tmp_path / "vision.ts"))
+    service.device = "cpu"
+
+    with patch("app.services.medsiglip_service.AutoProcessor.from_pretrained", return_value=processor), \
+            patch("app.services.medsiglip_service.AutoModel.from_pretrained", return_value=model), \
+            patch("app.services.medsiglip_torchscript_backend.trace_vision_tower",
+                  wraps=trace_vision_tower) as trace:
+        service._load_model(vision_backend=False)
+        assert service.model is model and service.vision_backend is None
+        trace.assert_not_called()
+
+        service._load_model()
+        assert service.vision_backend is not None
+        trace.assert_called_once()
+
+
+def test_benchmark_feeds_eager_tower_on_model_device(tiny_medsiglip_service):
+    """The eager reference input follows the model onto cuda/mps instead of staying on the CPU."""
+    service = MedSigLIPService(model_name="tiny-medsiglip")
+    service.device = "meta"
+    service.processor = tiny_medsiglip_service.processor
+    service.model = MagicMock()
+    service.vision_backend = MagicMock()
+
+    service.benchmark_vision_backend(runs=1)
+
+    devices = {call.kwargs["pixel_values"].device.type for call in service.model.vision_model.call_args_list}
+    assert devices == {"meta"}
@@ -0,0 +1,135 @@
+import io
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from unittest.mock import patch
+from PIL import Image
+
+torch = pytest.importorskip("torch")
+
+from transformers import SiglipTextModel
+
+from app.services.medsiglip_service import MedSigLIPService
+
+CUSTOM_LABELS = ["A clinical photograph of a scar.", "A clinical photograph of a tattoo."]
+
+
+@pytest.fixture
+def checkpoint_dir(tiny_medsiglip, tmp_path):
+    """The tiny model saved as a local safetensors checkpoint."""
+    model, _ = tiny_medsiglip
+    path = tmp_path / "tiny-medsiglip"
+    model.save_pretrained(path)
+    return str(path)
+
+
+def _service(checkpoint_dir, processor, load_mode, store_path):
+    service = MedSigLIPService(model_name=checkpoint_dir, load_mode=load_mode, text_embeddings_path=store_path)
+    service.device = "cpu"
+    with patch("app.services.medsiglip_service.AutoProcessor.from_pretrained", return_value=processor):
+        service._load_model()
+    return service
+
+
+def _scores(results):
+    return {r["label"]: r["score"] for r in results}
+
+
+def test_vision_only_matches_full_model(checkpoint_dir, tiny_medsiglip, tmp_path, label_prompts, make_jpeg):
+    _, processor = tiny_medsiglip
+    store = str(tmp_path / "text-embeddings.pt")
+    full = _service(checkpoint_dir, processor, "full", store)
+    vision_only = _service(checkpoint_dir, processor, "vision_only", store)
+
+    assert vision_only.model.text_model is None
+
+    image_bytes = make_jpeg()
+    expected = _scores(full.get_embeddings(image_bytes, texts=label_prompts))
+    actual = _scores(vision_only.get_embeddings(image_bytes, texts=label_prompts))
+    for label in label_prompts:
+        assert actual[label] == pytest.approx(expected[label], abs=1e-5)
+
+    # The text tower was attached on demand for the unseen label set
+    assert vision_only.model.text_model is not None
+
+
+def test_text_embedding_store_avoids_text_tower(checkpoint_dir, tiny_medsiglip, tmp_path, label_prompts):
+    _, processor = tiny_medsiglip
+    store = str(tmp_path / "text-embeddings.pt")
+
+    first = _service(checkpoint_dir, processor, "vision_only", store)
+    expected = first.get_text_embeddings(label_prompts, pin=True)
+    first.save_text_embeddings()
+    first.unload_text_tower()
+    assert first.model.text_model is None
+
+    second = _service(checkpoint_dir, processor, "vision_only", store)
+    assert torch.allclose(second.get_text_embeddings(label_prompts), expected)
+    assert second.model.text_model is None
+
+    # Labels outside the store still work by loading the text tower
+    second.get_text_embeddings(CUSTOM_LABELS)
+    assert second.model.text_model is not None
+
+
+def test_text_tower_load_does_not_block_inference(checkpoint_dir, tiny_medsiglip, tmp_path, label_prompts, make_jpeg):
+    """An on-demand text tower load runs while foreground analyses keep scoring stored labels."""
+    _, processor = tiny_medsiglip
+    store = str(tmp_path / "text-embeddings.pt")
+    first = _service(checkpoint_dir, processor, "vision_only", store)
+    first.get_text_embeddings(label_prompts, pin=True)
+    first.save_text_embeddings()
+    service = _service(checkpoint_dir, processor, "vision_only", store)
+
+    loading, release = threading.Event(), threading.Event()
+    from_pretrained = SiglipTextModel.from_pretrained
+
+    def slow_text_tower(*args, **kwargs):
+        loading.set()
+        release.wait(5)
+        return from_pretrained(*args, **kwargs)
+
+    with patch("transformers.SiglipTextModel.from_pretrained", side_effect=slow_text_tower):
+        loader = threading.Thread(target=service.ensure_text_tower)
+        loader.start()
+        try:
+            assert loading.wait(5)
+            with ThreadPoolExecutor(max_workers=1) as pool:
+                analysis = pool.submit(service.get_embeddings, make_jpeg(), label_prompts)
+                assert len(analysis.result(timeout=5)) == len(label_prompts)
+        finally:
+            release.set()
+            loader.join(5)
+    assert service.model.text_model is not None
+
+
+def test_vision_only_two_tower_forward_matches(checkpoint_dir, tiny_medsiglip, tmp_path, label_prompts, make_jpeg):
+    """The assembled towers reproduce SiglipModel logits (used by Grad-CAM)."""
+    model, processor = tiny_medsiglip
+    service = _service(checkpoint_dir, processor, "vision_only", str(tmp_path / "store.pt"))
+    service.ensure_text_tower()
+
+    image = Image.open(io.BytesIO(make_jpeg())).convert("RGB")
+    inputs = processor(text=label_prompts, images=image, padding="max_length", max_length=64, return_tensors="pt")
+    with torch.no_grad():
+        expected = model(**inputs).logits_per_image
+        actual = service.model(**inputs).logits_per_image
+    assert torch.allclose(actual, expected, atol=1e-5)
+
+
+def test_failed_backend_setup_leaves_model_unloaded(checkpoint_dir, tiny_medsiglip, tmp_path):
+    _, processor = tiny_medsiglip
+    onnx_path = tmp_path / "vision.onnx"
+    onnx_path.write_bytes(b"")
+    service = MedSigLIPService(model_name=checkpoint_dir, backend="onnx", onnx_path=str(onnx_path), quantization="int8")
+    service.device = "cpu"
+
+    with patch("app.services.medsiglip_service.AutoProcessor.from_pretrained", return_value=processor), \
+            patch("app.services.medsiglip_onnx_backend.OnnxVisionBackend.load", side_effect=ImportError("onnxruntime")):
+        with pytest.raises(ImportError):
+            service._load_model()
+        assert service.model is None and service.processor is None and service.vision_backend is None
+
+        # The next call retries the whole load instead of serving an unconfigured model
+        with pytest.raises(ImportError):
+            service._load_model()
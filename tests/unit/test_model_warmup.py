@@ -0,0 +1,83 @@
+import pytest
+from unittest.mock import MagicMock, patch
+
+from app.services.model_warmup import ModelWarmupService, READY, UNAVAILABLE, FAILED
+
+
+def test_health_does_not_load_models(client):
+    with patch("app.services.yolo_service.yolo_service.load_model") as load_model:
+        response = client.get("/api/health")
+    assert response.status_code == 200
+    assert "yolo_available" in response.json()
+    load_model.assert_not_called()
+
+
+def test_ready_reports_progress_until_models_are_warm(client):
+    warmup = ModelWarmupService()
+    with patch("app.routers.api.model_warmup_service", warmup):
+        response = client.get("/api/ready")
+        assert response.status_code == 503
+        assert response.json()["components"]["medsiglip"]["status"] == "pending"
+
+        warmup.components["yolo"]["status"] = UNAVAILABLE
+        warmup.components["medsiglip"].update(status=READY, load_time=1.0, warmup_time=0.5)
+        response = client.get("/api/ready")
+        assert response.status_code == 200
+        assert response.json()["ready"] is True
+        assert response.json()["components"]["medsiglip"]["load_time"] == 1.0
+
+
+def test_warmup_loads_models_and_precomputes_label_embeddings(tiny_medsiglip_service):
+    yolo = MagicMock()
+    yolo.is_available.return_value = True
+    warmup = ModelWarmupService()
+
+    with patch("app.services.model_warmup.medsiglip_service", tiny_medsiglip_service), \
+            patch("app.services.model_warmup.yolo_service", yolo):
+        warmup.run()
+
+    status = warmup.status()
+    assert status["ready"] is True
+    assert status["components"]["yolo"]["status"] == READY
+    assert status["components"]["medsiglip"]["status"] == READY
+    assert "warmup_time" in status["components"]["medsiglip"]
+    yolo.detect.assert_called_once()
+    # Default label sets for both modalities are cached and pinned, one row per prompt
+    from app.services.medsiglip_modality_wrapper import ClinicalModalityWrapper
+    prompts = {p for modality in ("macroscopic", "dermoscopy")
+               for p in ClinicalModalityWrapper(tiny_medsiglip_service, modality=modality).build_prompts()[1]}
+    assert len(tiny_medsiglip_service._pinned_text_embeddings) == len(prompts)
+
+
+def test_warmup_failure_is_reported():
+    medsiglip = MagicMock()
+    medsiglip._load_model.side_effect = RuntimeError("no token")
+    yolo = MagicMock()
+    yolo.is_available.return_value = False
+    warmup = ModelWarmupService()
+
+    with patch("app.services.model_warmup.medsiglip_service", medsiglip), \
+            patch("app.services.model_warmup.yolo_service", yolo):
+        warmup.run()
+
+    status = warmup.status()
+    assert status["ready"] is False
+    assert status["components"]["yolo"]["status"] == UNAVAILABLE
+    assert status["components"]["medsiglip"]["status"] == FAILED
+    assert "no token" in status["components"]["medsiglip"]["error"]
+
+
+def test_yolo_load_failure_does_not_block_readiness(tiny_medsiglip_service):
+    yolo = MagicMock()
+    yolo.is_available.return_value = True
+    yolo.load_model.side_effect = OSError("weight download failed")
+    warmup = ModelWarmupService()
+
+    with patch("app.services.model_warmup.medsiglip_service", tiny_medsiglip_service), \
+            patch("app.services.model_warmup.yolo_service", yolo):
+        warmup.run()
+
+    status = warmup.status()
+    assert status["ready"] is True
+    assert status["components"]["yolo"]["status"] == UNAVAILABLE
+    assert "weight download failed" in status["components"]["yolo"]["error"]
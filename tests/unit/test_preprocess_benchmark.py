@@ -0,0 +1,41 @@
+import json
+
+from app.services.preprocess_benchmark import StubDetector, compare, run_benchmark
+from app.services.yolo_service import yolo_service
+
+CASES = [("square", 448, 448, "JPEG"), ("landscape", 900, 600, "JPEG"), ("png", 600, 900, "PNG")]
+STAGES = {"decode", "strategy", "crop_pad", "resize", "jpeg_encode", "base64_encode", "end_to_end"}
+
+
+def test_report_covers_all_stages_without_weights():
+    previous = yolo_service.model
+    report = run_benchmark(CASES, runs=1)
+
+    assert yolo_service.model is previous
+    assert set(report["cases"]) == {"square", "landscape", "png"}
+    for case in report["cases"].values():
+        assert set(case["stages"]) == STAGES
+        assert all(t["median_ms"] >= 0 for t in case["stages"].values())
+    assert report["cases"]["square"]["strategy"] == "none"
+    assert report["cases"]["landscape"]["strategy"] == "crop"
+    json.dumps(report)
+
+
+def test_off_center_stub_lesion_takes_pad_path():
+    report = run_benchmark(CASES[1:2], runs=1, detector=StubDetector(cx=0.9))
+    assert report["cases"]["landscape"]["strategy"] == "pad"
+    assert report["detector"]["cx"] == 0.9
+
+
+def test_compare_flags_slower_stages_only():
+    def report(resize_ms, strategy="crop"):
+        return {"cases": {"a": {"strategy": strategy, "stages": {
+            "resize": {"median_ms": resize_ms}, "decode": {"median_ms": 0.1},
+        }}}}
+
+    baseline = report(10.0)
+    assert compare(baseline, report(11.0)) == []
+    regressions = compare(baseline, report(20.0))
+    assert [(r["case"], r["stage"], r["ratio"]) for r in regressions] == [("a", "resize", 2.0)]
+    # Another crop/pad path is a different workload, not a regression
+    assert compare(baseline, report(20.0, strategy="pad")) == []
@@ -0,0 +1,53 @@
+import copy
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from app.services.medsiglip_service import MedSigLIPService
+from app.services.model_evaluation import evaluate_against_reference, load_image_folder
+
+
+def _quantized_copy(service):
+    candidate = MedSigLIPService(model_name=service.model_name, quantization="int8")
+    candidate.device = "cpu"
+    candidate.processor = service.processor
+    candidate.model = copy.deepcopy(service.model)
+    candidate._apply_quantization()
+    return candidate
+
+
+def test_int8_quantizes_only_vision_linears(tiny_medsiglip_service):
+    candidate = _quantized_copy(tiny_medsiglip_service)
+    def quantized_modules(module):
+        return [m for m in module.modules() if type(m).__module__.startswith("torch.ao.nn.quantized.dynamic")]
+
+    assert quantized_modules(candidate.model.vision_model)
+    assert not quantized_modules(candidate.model.text_model)
+    # The fp32 reference is untouched
+    assert not quantized_modules(tiny_medsiglip_service.model)
+
+
+def test_evaluation_report_against_fp32(tiny_medsiglip_service, make_jpeg):
+    candidate = _quantized_copy(tiny_medsiglip_service)
+    images = {"red.jpg": make_jpeg(color=(200, 30, 30)), "skin.jpg": make_jpeg(color=(220, 170, 140))}
+
+    report = evaluate_against_reference(tiny_medsiglip_service, candidate, images)
+
+    assert report["images"] == 2
+    assert 0.0 <= report["top1_agreement"] <= 1.0
+    assert 0.0 <= report["status_agreement"] <= 1.0
+    assert 0.0 <= report["max_prob_deviation"] < 1.0
+    assert [row["image"] for row in report["per_image"]] == ["red.jpg", "skin.jpg"]
+    assert {"reference_status", "candidate_status"} <= set(report["per_image"][0])
+
+    # Identical models agree perfectly
+    same = evaluate_against_reference(tiny_medsiglip_service, tiny_medsiglip_service, images)
+    assert same["top1_agreement"] == 1.0
+    assert same["status_agreement"] == 1.0
+    assert same["max_prob_deviation"] == 0.0
+
+
+def test_load_image_folder_reads_test_data():
+    images = load_image_folder("tests/data")
+    assert "melanoma_wiki_A.jpg" in images
+    assert all(isinstance(v, bytes) for v in images.values())
@@ -0,0 +1,144 @@
+import base64
+import threading
+import time
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from app.services.saliency_prefetch import SaliencyPrefetcher
+
+
+class _Executor:
+    def __init__(self, idle=True):
+        self.idle = idle
+
+    def is_idle(self):
+        return self.idle
+
+
+class _Service:
+    def __init__(self):
+        self.calls = []
+        self.release = threading.Event()
+        self.release.set()
+
+    def get_maps(self, image_content, labels, method):
+        self.release.wait(5)
+        self.calls.append((image_content, labels, method))
+
+
+def _prefetcher(service, executor):
+    return SaliencyPrefetcher(service=service, executor=executor, idle_poll_seconds=0.01, enabled=True)
+
+
+def test_jobs_wait_for_idle_executor(differentials):
+    service, executor = _Service(), _Executor(idle=False)
+    prefetcher = _prefetcher(service, executor)
+
+    future = prefetcher.schedule("s1", "p1", b"img", differentials[:1])
+    time.sleep(0.05)
+    assert service.calls == [] and prefetcher.runner.pending == 1
+
+    executor.idle = True
+    future.result(timeout=5)
+    assert service.calls == [(b"img", differentials[:1], "gradcam")]
+    assert prefetcher.runner.completed == 1
+
+
+def test_session_clear_and_photo_delete_cancel_queued_jobs(differentials):
+    service, executor = _Service(), _Executor(idle=False)
+    prefetcher = _prefetcher(service, executor)
+
+    a = prefetcher.schedule("s1", "p1", b"a", differentials)
+    b = prefetcher.schedule("s1", "p2", b"b", differentials)
+    c = prefetcher.schedule("s2", "p3", b"c", differentials)
+    d = prefetcher.schedule("s2", "p4", b"d", differentials)
+
+    assert prefetcher.cancel_session("s1") == 2
+    prefetcher.cancel_photo("s2", "p4")
+    assert a.cancelled() and b.cancelled() and d.cancelled()
+
+    executor.idle = True
+    c.result(timeout=5)
+    assert [call[0] for call in service.calls] == [b"c"]
+
+
+def test_claim_drops_queued_job_and_returns_running_one(differentials):
+    service, executor = _Service(), _Executor(idle=False)
+    prefetcher = _prefetcher(service, executor)
+
+    queued = prefetcher.schedule("s1", "p1", b"a", differentials)
+    assert prefetcher.claim("s1", "p1") is None
+    assert queued.cancelled()
+
+    service.release.clear()
+    running = prefetcher.schedule("s1", "p2", b"b", differentials)
+    executor.idle = True
+    while not running.running():
+        time.sleep(0.01)
+    assert prefetcher.claim("s1", "p2") is running
+    service.release.set()
+    running.result(timeout=5)
+
+
+def test_queue_drops_oldest_jobs_past_capacity(differentials):
+    service, executor = _Service(), _Executor(idle=False)
+    prefetcher = SaliencyPrefetcher(service=service, executor=executor, idle_poll_seconds=0.01, enabled=True, max_jobs=2)
+
+    futures = [prefetcher.schedule("s1", f"p{i}", b"%d" % i, differentials) for i in range(4)]
+
+    assert prefetcher.runner.pending == 2 and prefetcher.runner.dropped == 2
+    assert futures[0].cancelled() and futures[1].cancelled()
+    executor.idle = True
+    futures[3].result(timeout=5)
+    assert [call[0] for call in service.calls] == [b"2", b"3"]
+
+
+def test_queued_jobs_expire_after_ttl(differentials):
+    now = [0.0]
+    service, executor = _Service(), _Executor(idle=False)
+    prefetcher = SaliencyPrefetcher(service=service, executor=executor, idle_poll_seconds=0.01, enabled=True,
+                                    ttl_seconds=60, clock=lambda: now[0])
+
+    stale = prefetcher.schedule("s1", "p1", b"stale", differentials)
+    now[0] = 30.0
+    fresh = prefetcher.schedule("s2", "p2", b"fresh", differentials)
+    now[0] = 61.0
+    time.sleep(0.05)
+
+    assert stale.cancelled() and prefetcher.runner.expired == 1 and prefetcher.runner.pending == 1
+    executor.idle = True
+    fresh.result(timeout=5)
+    assert [call[0] for call in service.calls] == [b"fresh"]
+
+
+def test_analysis_prefetch_serves_saliency_from_cache(tiny_medsiglip_service, client, differentials, make_jpeg):
+    pytest.importorskip("torch")
+    from app.services.gradcam_service import GradCAMService
+
+    with patch("app.services.gradcam_service.medsiglip_service", tiny_medsiglip_service):
+        gradcam = GradCAMService(memory_budget_mb=1024, pass_memory_mb=256)
+        prefetcher = _prefetcher(gradcam, _Executor())
+        content = make_jpeg(seed=0)
+        predictions = [{"label": label, "score": 0.5} for label in differentials]
+
+        client.cookies.set("session_id", "test-prefetch-session")
+        with patch("app.routers.photos.saliency_prefetcher", prefetcher), \
+                patch("app.routers.photos.gradcam_service", gradcam), \
+                patch("app.routers.photos.medsiglip_service.model", MagicMock()), \
+                patch("app.routers.photos._analyze_content", return_value={"primary": predictions}), \
+                patch.object(prefetcher, "schedule", wraps=prefetcher.schedule) as schedule:
+            data_uri = "data:image/jpeg;base64," + base64.b64encode(content).decode()
+            assert client.post("/api/photos/p1/analyze", json={"base64_image": data_uri}).status_code == 200
+            schedule.assert_called_once_with("test-prefetch-session", "p1", content, differentials)
+            deadline = time.monotonic() + 60
+            while prefetcher.runner.completed == 0 and time.monotonic() < deadline:
+                time.sleep(0.01)
+
+            with patch.object(gradcam, "compute_maps", wraps=gradcam.compute_maps) as compute_maps:
+                resp = client.post("/api/photos/p1/saliency",
+                                   json={"base64_image": data_uri, "target_labels": differentials, "format": "grid"})
+
+    assert resp.status_code == 200
+    assert len(resp.json()["saliency_maps"]) == len(differentials)
+    compute_maps.assert_not_called()
@@ -0,0 +1,16 @@
+import os
+import pytest
+
+from app.serve import read_memory
+
+
+@pytest.mark.skipif(not os.path.exists("/proc/self/smaps_rollup"), reason="Needs Linux /proc smaps_rollup")
+def test_read_memory_reports_rss_and_pss():
+    usage = read_memory(os.getpid())
+    assert usage["rss_mb"] > 0
+    assert 0 < usage["pss_mb"] <= usage["rss_mb"]
+    assert usage["shared_mb"] >= 0
+
+
+def test_read_memory_unknown_process():
+    assert read_memory(2 ** 22 + 12345) == {}
@@ -14,6 +14,8 @@ def test_session_cleanup_flow(mock_prep, client):
     mock_prep.recommend_prep_strategy.return_value = {"strategy": "crop", "reason": "mocked"}
     mock_prep.prepare_image_bytes.return_value = b"mocked-prepared-bytes"
     mock_prep.prepare_image_base64.return_value = "mocked-base64"
+    mock_prep.create_context.return_value.strategy = {"strategy": "crop", "reason": "mocked"}
+    mock_prep.create_context.return_value.preview_base64.return_value = "mocked-base64"
     
     session_id = "test-cleanup-session-001"
     client.cookies.set("session_id", session_id)
@@ -47,3 +47,82 @@ def test_preprocess_graceful_fallback():
         strategy = service.recommend_prep_strategy(image_bytes)
         assert strategy['strategy'] == "crop"
         assert "Detection failed" in strategy['reason']
+
+
+def test_detection_fallback_is_not_cached():
+    """A strategy picked without a detection result must not outlive the YOLO outage."""
+    from app.services.image_preprocess_service import ImagePreprocessService
+    from PIL import Image
+    import io
+
+    service = ImagePreprocessService()
+    buf = io.BytesIO()
+    Image.new('RGB', (1000, 500), color='blue').save(buf, format='JPEG')
+    image_bytes = buf.getvalue()
+
+    with patch("app.services.image_preprocess_service.yolo_service.detect", return_value=None):
+        assert "Detection failed" in service.recommend_prep_strategy(image_bytes)['reason']
+    with patch("app.services.image_preprocess_service.yolo_service.detect", side_effect=RuntimeError("boom")):
+        assert "Detection failed" in service.recommend_prep_strategy(image_bytes)['reason']
+    assert len(service.strategy_cache) == 0
+
+    # Once YOLO answers, the real strategy is computed and cached
+    with patch("app.services.image_preprocess_service.yolo_service.detect", return_value=[(10, 10, 60, 60, 0.9)]) as detect:
+        assert service.recommend_prep_strategy(image_bytes)['strategy'] == "pad"
+        assert service.recommend_prep_strategy(image_bytes)['strategy'] == "pad"
+    detect.assert_called_once()
+
+
+class _FakeTensor:
+    def __init__(self, values):
+        self.values = values
+
+    def cpu(self):
+        return self
+
+    def numpy(self):
+        import numpy as np
+        return np.array(self.values, dtype=float)
+
+
+class _FakeBox:
+    def __init__(self, xyxy, conf):
+        self.xyxy = [_FakeTensor(xyxy)]
+        self.conf = [conf]
+
+
+def test_detect_runs_on_proxy_and_rescales_boxes():
+    """Detection sees a 640px proxy; boxes come back in original coordinates."""
+    from PIL import Image
+
+    service = YOLOService()
+    service.model = MagicMock()
+    result = MagicMock()
+    result.boxes = [_FakeBox([64, 48, 128, 96], 0.9)]
+    service.model.predict.return_value = [result]
+
+    boxes = service.detect(Image.new("RGB", (3200, 2400), color="blue"))
+
+    proxy = service.model.predict.call_args[0][0][0]
+    assert proxy.size == (640, 480)
+    assert boxes == [(320.0, 240.0, 640.0, 480.0, 0.9)]
+
+
+def test_detect_unavailable_returns_none():
+    from PIL import Image
+
+    service = YOLOService()
+    with patch.object(service, "load_model", return_value=None):
+        assert service.detect(Image.new("RGB", (100, 100))) is None
+
+
+def test_detect_batch_chunks_forward_passes():
+    from PIL import Image
+
+    service = YOLOService()
+    service.model = MagicMock()
+    service.model.predict.side_effect = lambda proxies, **kwargs: [MagicMock(boxes=[]) for _ in proxies]
+
+    images = [Image.new("RGB", (320, 240)) for _ in range(5)]
+    assert service.detect_batch(images, batch_size=2) == [[], [], [], [], []]
+    assert [len(call[0][0]) for call in service.model.predict.call_args_list] == [2, 2, 1]
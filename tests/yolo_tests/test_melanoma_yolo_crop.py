@@ -41,7 +41,7 @@ def test_melanoma_wiki_a_crop_strategy():
         mock_load.return_value = mock_model
         
         # Clear cache to ensure fresh run
-        image_preprocess_service.recommend_prep_strategy.cache_clear()
+        image_preprocess_service.strategy_cache.clear()
         
         # Run recommendation
         result = image_preprocess_service.recommend_prep_strategy(image_bytes)